@@ -0,0 +1,56 @@
+"""add image checksums
+
+Revision ID: 0a6c4e1f9d32
+Revises: f7b3d9e25a80
+Create Date: 2026-10-19 17:24:11.084562
+
+"""
+import hashlib
+import os
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a6c4e1f9d32'
+down_revision: Union[str, None] = 'f7b3d9e25a80'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def backfill_image_checksums(connection, table: str):
+    """Считает SHA256 уже загруженных изображений STORAGE_DIR/{table}/{id}/image.jpg."""
+    rows = connection.execute(sa.text(f"SELECT id FROM {table} WHERE image IS NOT NULL")).all()
+    for (row_id,) in rows:
+        image_path = os.path.join(settings.STORAGE_DIR, table, str(row_id), "image.jpg")
+        if not os.path.isfile(image_path):
+            continue
+
+        hash_sha256 = hashlib.sha256()
+        with open(image_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hash_sha256.update(chunk)
+
+        connection.execute(
+            sa.text(f"UPDATE {table} SET image_sha256 = :sha256 WHERE id = :id"),
+            {"sha256": hash_sha256.hexdigest(), "id": row_id},
+        )
+
+
+def upgrade() -> None:
+    op.add_column('objects', sa.Column('image_sha256', sa.String(length=64), nullable=True))
+    op.add_column('products', sa.Column('image_sha256', sa.String(length=64), nullable=True))
+
+    connection = op.get_bind()
+    backfill_image_checksums(connection, 'objects')
+    backfill_image_checksums(connection, 'products')
+
+
+def downgrade() -> None:
+    op.drop_column('products', 'image_sha256')
+    op.drop_column('objects', 'image_sha256')
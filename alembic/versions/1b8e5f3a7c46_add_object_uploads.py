@@ -0,0 +1,37 @@
+"""add object uploads
+
+Revision ID: 1b8e5f3a7c46
+Revises: 0a6c4e1f9d32
+Create Date: 2026-10-19 18:05:29.662417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1b8e5f3a7c46'
+down_revision: Union[str, None] = '0a6c4e1f9d32'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'object_uploads',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('object_id', sa.UUID(), nullable=False),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('mime_type', sa.String(), nullable=True),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('upload_offset', sa.BigInteger(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['object_id'], ['objects.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('object_uploads')
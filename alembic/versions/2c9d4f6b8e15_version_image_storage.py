@@ -0,0 +1,100 @@
+"""version image storage
+
+Revision ID: 2c9d4f6b8e15
+Revises: 1b8e5f3a7c46
+Create Date: 2026-10-19 19:02:37.418905
+
+"""
+import asyncio
+import os
+import posixpath
+import uuid
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.storage import StorageBackend, close_storage, get_storage
+
+
+# revision identifiers, used by Alembic.
+revision: str = '2c9d4f6b8e15'
+down_revision: Union[str, None] = '1b8e5f3a7c46'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Ссылка на изображение получает версию: первые 16 символов хеш-суммы
+ADD_URL_VERSION = """
+UPDATE {table}
+SET image = image || '/' || left(image_sha256, 16)
+WHERE image IS NOT NULL AND image_sha256 IS NOT NULL
+"""
+
+REMOVE_URL_VERSION = """
+UPDATE {table}
+SET image = regexp_replace(image, '/image/[0-9a-f]{{16}}$', '/image')
+WHERE image IS NOT NULL
+"""
+
+
+async def copy_key(storage: StorageBackend, source: str, target: str):
+    """Копирует файл хранилища через временный локальный файл (put публикует его целиком)."""
+    temp_path = os.path.join(storage.staging_dir(), f"{uuid.uuid4()}.tmp")
+    try:
+        with open(temp_path, "wb") as f:
+            async for chunk in storage.open(source):
+                f.write(chunk)
+        await storage.put(target, temp_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+async def copy_images(rows, table: str, to_versioned: bool):
+    """
+    Копирует изображения (и уменьшенные копии) между {table}/{id}/ и каталогом версии
+    {table}/{id}/{sha256}/ через хранилище приложения (локальное или S3).
+
+    Исходные ключи не трогаются: при откате транзакции миграции прежняя раскладка остаётся
+    целой. Их удаляет scripts/cleanup_legacy_storage.py после применения миграции.
+    """
+    storage = get_storage()
+    try:
+        for row_id, image_sha256 in rows:
+            entity_prefix = f"{table}/{row_id}/"
+            version_prefix = f"{entity_prefix}{image_sha256}/"
+            source_prefix, target_prefix = (
+                (entity_prefix, version_prefix) if to_versioned else (version_prefix, entity_prefix)
+            )
+            for key in await storage.list(f"{source_prefix}image"):
+                name = posixpath.basename(key)
+                if key != f"{source_prefix}{name}":
+                    continue
+                target = f"{target_prefix}{name}"
+                if await storage.stat(target) is None:
+                    await copy_key(storage, key, target)
+    finally:
+        await close_storage()
+
+
+def copy_table_images(connection, table: str, to_versioned: bool):
+    rows = connection.execute(
+        sa.text(f"SELECT id, image_sha256 FROM {table} WHERE image_sha256 IS NOT NULL")
+    ).all()
+    asyncio.run(copy_images(rows, table, to_versioned))
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    for table in ('objects', 'products'):
+        copy_table_images(connection, table, to_versioned=True)
+        op.execute(ADD_URL_VERSION.format(table=table))
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    for table in ('objects', 'products'):
+        op.execute(REMOVE_URL_VERSION.format(table=table))
+        copy_table_images(connection, table, to_versioned=False)
@@ -0,0 +1,84 @@
+"""add foreign key indexes
+
+Revision ID: 3d7a1c9e5f24
+Revises: 2c9d4f6b8e15
+Create Date: 2026-10-19 21:40:12.508371
+
+"""
+from typing import List, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7a1c9e5f24'
+down_revision: Union[str, None] = '2c9d4f6b8e15'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (имя, таблица, колонки). Индекс objects(project_id, x, y) обслуживает и выборку объектов
+# проекта, и поиск в квадрате координат внутри проекта
+INDEXES = [
+    ('ix_objects_project_id_x_y', 'objects', ['project_id', 'x', 'y']),
+    ('ix_objects_parent_id', 'objects', ['parent_id']),
+    ('ix_products_object_id', 'products', ['object_id']),
+    ('ix_chains_product_id', 'chains', ['product_id']),
+    ('ix_chains_source_object_id', 'chains', ['source_object_id']),
+    ('ix_chains_target_object_id', 'chains', ['target_object_id']),
+    ('ix_categories_parent_id', 'categories', ['parent_id']),
+    ('ix_product_category_association_category_id', 'product_category_association', ['category_id']),
+    ('ix_project_category_association_project_id', 'project_category_association', ['project_id']),
+    ('ix_project_category_association_category_id', 'project_category_association', ['category_id']),
+    ('ix_object_uploads_object_id', 'object_uploads', ['object_id']),
+]
+
+# Уникальность привязки продукта к категории; индекс обслуживает и выборку по product_id
+UNIQUE_ASSOCIATION = 'uq_product_category_association_product_id_category_id'
+
+DELETE_DUPLICATE_ASSOCIATIONS = """
+DELETE FROM product_category_association a
+USING product_category_association b
+WHERE a.product_id = b.product_id
+  AND a.category_id = b.category_id
+  AND a.id > b.id
+"""
+
+
+def create_index_concurrently(name: str, table: str, columns: List[str], unique: bool = False) -> None:
+    # Прерванная сборка CONCURRENTLY оставляет невалидный индекс: удаляем его и строим заново
+    invalid = op.get_bind().execute(
+        sa.text('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+        {'name': name},
+    ).scalar()
+    if invalid:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True, if_not_exists=True)
+
+
+def upgrade() -> None:
+    # Повторяющиеся привязки не дадут построить уникальный индекс: оставляем по одной
+    op.execute(DELETE_DUPLICATE_ASSOCIATIONS)
+
+    # CONCURRENTLY не блокирует запись в таблицы на время построения, но не работает в транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            create_index_concurrently(name, table, columns)
+        create_index_concurrently(
+            UNIQUE_ASSOCIATION, 'product_category_association', ['product_id', 'category_id'], unique=True
+        )
+
+    # Ограничение поверх готового индекса добавляется без повторного сканирования таблицы
+    op.execute(
+        f'ALTER TABLE product_category_association '
+        f'ADD CONSTRAINT {UNIQUE_ASSOCIATION} UNIQUE USING INDEX {UNIQUE_ASSOCIATION}'
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint(UNIQUE_ASSOCIATION, 'product_category_association', type_='unique')
+
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
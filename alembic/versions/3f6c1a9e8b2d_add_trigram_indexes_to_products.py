@@ -0,0 +1,36 @@
+"""add trigram indexes to products
+
+Revision ID: 3f6c1a9e8b2d
+Revises: 27355f6fe513
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6c1a9e8b2d'
+down_revision: Union[str, None] = '27355f6fe513'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for column in ('name', 'description', 'image', 'country'):
+        op.create_index(
+            f'ix_products_{column}_trgm',
+            'products',
+            [column],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    for column in ('name', 'description', 'image', 'country'):
+        op.drop_index(f'ix_products_{column}_trgm', table_name='products', postgresql_using='gin')
@@ -0,0 +1,233 @@
+"""count distinct category products
+
+Revision ID: 4e8b2d0a6f13
+Revises: 3d7a1c9e5f24
+Create Date: 2026-10-19 23:05:41.217604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4e8b2d0a6f13'
+down_revision: Union[str, None] = '3d7a1c9e5f24'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Продукт, привязанный к нескольким категориям одного поддерева, считается в нём один раз.
+# Точный пересчёт указанных категорий и всех их предков (перенос категорий, обновление привязок)
+RECOUNT_FUNCTION = """
+CREATE OR REPLACE FUNCTION recount_category_products(ids uuid[])
+RETURNS void AS $$
+    WITH RECURSIVE ancestors AS (
+        SELECT id, parent_id FROM categories WHERE id = ANY(ids)
+        UNION
+        SELECT c.id, c.parent_id
+        FROM categories c JOIN ancestors a ON c.id = a.parent_id
+    ), closure AS (
+        SELECT id AS ancestor_id, id AS descendant_id FROM ancestors
+        UNION ALL
+        SELECT cl.ancestor_id, c.id
+        FROM categories c JOIN closure cl ON c.parent_id = cl.descendant_id
+    ), totals AS (
+        SELECT cl.ancestor_id AS id, count(DISTINCT pca.product_id) AS products
+        FROM closure cl
+        LEFT JOIN product_category_association pca ON pca.category_id = cl.descendant_id
+        GROUP BY cl.ancestor_id
+    )
+    UPDATE categories c
+    SET descendant_products_count = t.products
+    FROM totals t
+    WHERE c.id = t.id AND c.descendant_products_count <> t.products
+$$ LANGUAGE sql;
+"""
+
+# Вставка или удаление привязок: счётчик предка меняется, только если продукт впервые
+# попал в его поддерево (или покинул его). Остальные привязки тех же продуктов
+# (kept) в базе уже в том состоянии, с которым сравнивается изменение
+ADJUST_PRODUCTS_FUNCTION = """
+CREATE OR REPLACE FUNCTION adjust_category_product_counts(product_ids uuid[], category_ids uuid[], delta bigint)
+RETURNS void AS $$
+    WITH RECURSIVE changed AS (
+        SELECT DISTINCT d.product_id, d.category_id
+        FROM unnest(product_ids, category_ids) AS d(product_id, category_id)
+        WHERE d.product_id IS NOT NULL AND d.category_id IS NOT NULL
+    ), kept AS (
+        SELECT pca.product_id, pca.category_id
+        FROM product_category_association pca
+        WHERE pca.product_id IN (SELECT product_id FROM changed)
+          AND (pca.product_id, pca.category_id) NOT IN (SELECT product_id, category_id FROM changed)
+    ), start AS (
+        SELECT product_id, category_id, true AS changed FROM changed
+        UNION ALL
+        SELECT product_id, category_id, false FROM kept
+    ), reach AS (
+        SELECT product_id, category_id AS id, changed FROM start
+        UNION ALL
+        SELECT r.product_id, c.parent_id, r.changed
+        FROM categories c JOIN reach r ON c.id = r.id
+        WHERE c.parent_id IS NOT NULL
+    ), totals AS (
+        SELECT id, count(*) AS products
+        FROM (
+            SELECT product_id, id FROM reach WHERE changed
+            EXCEPT
+            SELECT product_id, id FROM reach WHERE NOT changed
+        ) moved
+        GROUP BY id
+    )
+    UPDATE categories c
+    SET descendant_products_count = c.descendant_products_count + delta * t.products
+    FROM totals t
+    WHERE c.id = t.id
+$$ LANGUAGE sql;
+"""
+
+ASSOCIATION_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION product_category_association_counts_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_product_counts(array_agg(product_id), array_agg(category_id), 1)
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_delete() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_product_counts(array_agg(product_id), array_agg(category_id), -1)
+    FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM recount_category_products(array_agg(category_id))
+    FROM (SELECT category_id FROM old_rows UNION SELECT category_id FROM new_rows) changed;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Счётчик категорий по-прежнему переносится дельтой, продукты поддерева пересчитываются точно:
+# они могут быть привязаны и к другим категориям у старых и новых предков
+CATEGORY_FUNCTION = """
+CREATE OR REPLACE FUNCTION categories_counts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[OLD.parent_id],
+            ARRAY[-1 - OLD.descendant_categories_count]::bigint[],
+            ARRAY[0]::bigint[]
+        );
+        IF OLD.descendant_products_count <> 0 THEN
+            PERFORM recount_category_products(ARRAY[OLD.parent_id]);
+        END IF;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[NEW.parent_id],
+            ARRAY[1 + NEW.descendant_categories_count]::bigint[],
+            ARRAY[0]::bigint[]
+        );
+        IF NEW.descendant_products_count <> 0 THEN
+            PERFORM recount_category_products(ARRAY[NEW.parent_id]);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+BACKFILL = "SELECT recount_category_products(array_agg(id)) FROM categories"
+
+# Прежние функции: продукт считается по числу привязок
+PREVIOUS_ASSOCIATION_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION product_category_association_counts_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(1::bigint))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_delete() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(-1::bigint))
+    FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(-1::bigint))
+    FROM old_rows;
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(1::bigint))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_CATEGORY_FUNCTION = """
+CREATE OR REPLACE FUNCTION categories_counts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[OLD.parent_id],
+            ARRAY[-1 - OLD.descendant_categories_count]::bigint[],
+            ARRAY[-OLD.descendant_products_count]::bigint[]
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[NEW.parent_id],
+            ARRAY[1 + NEW.descendant_categories_count]::bigint[],
+            ARRAY[NEW.descendant_products_count]::bigint[]
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_BACKFILL = """
+WITH RECURSIVE closure AS (
+    SELECT id AS ancestor_id, id AS descendant_id FROM categories
+    UNION ALL
+    SELECT cl.ancestor_id, c.id
+    FROM categories c JOIN closure cl ON c.parent_id = cl.descendant_id
+)
+UPDATE categories c
+SET descendant_products_count = s.products
+FROM (
+    SELECT cl.ancestor_id AS id, count(pca.id) AS products
+    FROM closure cl
+    LEFT JOIN product_category_association pca ON pca.category_id = cl.descendant_id
+    GROUP BY cl.ancestor_id
+) s
+WHERE c.id = s.id;
+"""
+
+
+def upgrade() -> None:
+    op.execute(RECOUNT_FUNCTION)
+    op.execute(ADJUST_PRODUCTS_FUNCTION)
+    op.execute(ASSOCIATION_FUNCTIONS)
+    op.execute(CATEGORY_FUNCTION)
+
+    op.execute(BACKFILL)
+
+
+def downgrade() -> None:
+    op.execute(PREVIOUS_CATEGORY_FUNCTION)
+    op.execute(PREVIOUS_ASSOCIATION_FUNCTIONS)
+    op.execute('DROP FUNCTION IF EXISTS adjust_category_product_counts(uuid[], uuid[], bigint)')
+    op.execute('DROP FUNCTION IF EXISTS recount_category_products(uuid[])')
+
+    op.execute(PREVIOUS_BACKFILL)
@@ -0,0 +1,49 @@
+"""bump row versions in database
+
+Revision ID: 5a9c3e7b1d48
+Revises: 4e8b2d0a6f13
+Create Date: 2026-10-19 23:31:08.640925
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a9c3e7b1d48'
+down_revision: Union[str, None] = '4e8b2d0a6f13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Версия объекта и продукта увеличивается при любом UPDATE строки, как и версия проекта.
+# Приложение не сравнивает версию при записи: параллельные изменения не завершаются ошибкой
+ROW_VERSION_FUNCTION = """
+CREATE OR REPLACE FUNCTION bump_row_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.version = OLD.version THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TABLES = ('objects', 'products')
+
+
+def upgrade() -> None:
+    op.execute(ROW_VERSION_FUNCTION)
+    for table in TABLES:
+        op.execute(
+            f'CREATE TRIGGER {table}_row_version BEFORE UPDATE ON {table} '
+            f'FOR EACH ROW EXECUTE FUNCTION bump_row_version()'
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER IF EXISTS {table}_row_version ON {table}')
+    op.execute('DROP FUNCTION IF EXISTS bump_row_version()')
@@ -0,0 +1,35 @@
+"""add upload expiration
+
+Revision ID: 6b0d4f8a2c59
+Revises: 5a9c3e7b1d48
+Create Date: 2026-10-20 00:12:44.905217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6b0d4f8a2c59'
+down_revision: Union[str, None] = '5a9c3e7b1d48'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Существующим загрузкам даётся срок от момента миграции, дальше его задаёт приложение
+    op.add_column(
+        'object_uploads',
+        sa.Column(
+            'expires_at', sa.DateTime(timezone=True), server_default=sa.text("now() + interval '1 day'"), nullable=False
+        ),
+    )
+    op.alter_column('object_uploads', 'expires_at', server_default=None)
+    op.create_index('ix_object_uploads_expires_at', 'object_uploads', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_object_uploads_expires_at', table_name='object_uploads')
+    op.drop_column('object_uploads', 'expires_at')
@@ -0,0 +1,39 @@
+"""cascade object deletes
+
+Revision ID: 7c1e5a3b9d62
+Revises: 6b0d4f8a2c59
+Create Date: 2026-10-20 09:41:18.263504
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1e5a3b9d62'
+down_revision: Union[str, None] = '6b0d4f8a2c59'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Внешние ключи на objects: (имя, таблица, столбец, действие при удалении объекта).
+# Филиалы и цепочки удаляются вместе с объектом, продукты отвязываются
+FOREIGN_KEYS = [
+    ('objects_parent_id_fkey', 'objects', 'parent_id', 'CASCADE'),
+    ('chains_source_object_id_fkey', 'chains', 'source_object_id', 'CASCADE'),
+    ('chains_target_object_id_fkey', 'chains', 'target_object_id', 'CASCADE'),
+    ('products_object_id_fkey', 'products', 'object_id', 'SET NULL'),
+]
+
+
+def upgrade() -> None:
+    for name, table, column, ondelete in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, 'objects', [column], ['id'], ondelete=ondelete)
+
+
+def downgrade() -> None:
+    for name, table, column, _ in FOREIGN_KEYS:
+        op.drop_constraint(name, table, type_='foreignkey')
+        op.create_foreign_key(name, table, 'objects', [column], ['id'])
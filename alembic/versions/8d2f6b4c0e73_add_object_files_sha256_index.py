@@ -0,0 +1,41 @@
+"""add object_files sha256 index
+
+Revision ID: 8d2f6b4c0e73
+Revises: 7c1e5a3b9d62
+Create Date: 2026-10-20 10:05:37.614829
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2f6b4c0e73'
+down_revision: Union[str, None] = '7c1e5a3b9d62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Внешний ключ object_files.sha256 -> blobs.sha256: без индекса удаление строки blobs
+# проверяет ссылки полным сканированием object_files
+INDEX = 'ix_object_files_sha256'
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицу на время построения, но не работает в транзакции
+    with op.get_context().autocommit_block():
+        # Прерванная сборка CONCURRENTLY оставляет невалидный индекс: удаляем его и строим заново
+        invalid = op.get_bind().execute(
+            sa.text('SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'),
+            {'name': INDEX},
+        ).scalar()
+        if invalid:
+            op.drop_index(INDEX, table_name='object_files', postgresql_concurrently=True)
+        op.create_index(INDEX, 'object_files', ['sha256'], postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(INDEX, table_name='object_files', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,53 @@
+"""add full-text search vectors
+
+Revision ID: a7d4e2c91f05
+Revises: 3f6c1a9e8b2d
+Create Date: 2026-10-19 11:03:17.552930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d4e2c91f05'
+down_revision: Union[str, None] = '3f6c1a9e8b2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_COLUMNS = {
+    'objects': (('name', 'A'), ('description', 'B'), ('ownership', 'C')),
+    'products': (('name', 'A'), ('description', 'B'), ('country', 'C')),
+    'categories': (('name', 'A'),),
+}
+
+
+def search_vector_expression(*weighted_columns) -> str:
+    return " || ".join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+        for column, weight in weighted_columns
+    )
+
+
+def upgrade() -> None:
+    for table, columns in SEARCH_COLUMNS.items():
+        op.add_column(
+            table,
+            sa.Column(
+                'search_vector',
+                postgresql.TSVECTOR(),
+                sa.Computed(search_vector_expression(*columns), persisted=True),
+                nullable=True,
+            ),
+        )
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    for table in SEARCH_COLUMNS:
+        op.drop_index(f'ix_{table}_search_vector', table_name=table, postgresql_using='gin')
+        op.drop_column(table, 'search_vector')
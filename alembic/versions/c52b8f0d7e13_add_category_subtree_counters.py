@@ -0,0 +1,176 @@
+"""add category subtree counters
+
+Revision ID: c52b8f0d7e13
+Revises: a7d4e2c91f05
+Create Date: 2026-10-19 12:20:05.904416
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52b8f0d7e13'
+down_revision: Union[str, None] = 'a7d4e2c91f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Прибавляет дельты к счётчикам указанных категорий и всех их предков
+ADJUST_FUNCTION = """
+CREATE OR REPLACE FUNCTION adjust_category_counts(ids uuid[], category_deltas bigint[], product_deltas bigint[])
+RETURNS void AS $$
+    WITH RECURSIVE path AS (
+        SELECT d.id, d.categories, d.products
+        FROM unnest(ids, category_deltas, product_deltas) AS d(id, categories, products)
+        WHERE d.id IS NOT NULL
+        UNION ALL
+        SELECT c.parent_id, p.categories, p.products
+        FROM categories c JOIN path p ON c.id = p.id
+        WHERE c.parent_id IS NOT NULL
+    ), totals AS (
+        SELECT id, sum(categories) AS categories, sum(products) AS products
+        FROM path
+        GROUP BY id
+    )
+    UPDATE categories c
+    SET descendant_categories_count = c.descendant_categories_count + t.categories,
+        descendant_products_count = c.descendant_products_count + t.products
+    FROM totals t
+    WHERE c.id = t.id
+$$ LANGUAGE sql;
+"""
+
+# Триггеры уровня оператора: массовые вставки ассоциаций пересчитываются одним запросом
+ASSOCIATION_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION product_category_association_counts_insert() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(1::bigint))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_delete() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(-1::bigint))
+    FROM old_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_counts_update() RETURNS trigger AS $$
+BEGIN
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(-1::bigint))
+    FROM old_rows;
+    PERFORM adjust_category_counts(array_agg(category_id), array_agg(0::bigint), array_agg(1::bigint))
+    FROM new_rows;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+ASSOCIATION_TRIGGERS = """
+CREATE TRIGGER product_category_association_counts_insert
+AFTER INSERT ON product_category_association
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_counts_insert();
+
+CREATE TRIGGER product_category_association_counts_delete
+AFTER DELETE ON product_category_association
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_counts_delete();
+
+CREATE TRIGGER product_category_association_counts_update
+AFTER UPDATE ON product_category_association
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_counts_update();
+"""
+
+# Вставка, удаление и перенос категории меняют счётчики предков родителя
+CATEGORY_FUNCTION = """
+CREATE OR REPLACE FUNCTION categories_counts() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[OLD.parent_id],
+            ARRAY[-1 - OLD.descendant_categories_count]::bigint[],
+            ARRAY[-OLD.descendant_products_count]::bigint[]
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM adjust_category_counts(
+            ARRAY[NEW.parent_id],
+            ARRAY[1 + NEW.descendant_categories_count]::bigint[],
+            ARRAY[NEW.descendant_products_count]::bigint[]
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+CATEGORY_TRIGGERS = """
+CREATE TRIGGER categories_counts_insert_delete
+AFTER INSERT OR DELETE ON categories
+FOR EACH ROW EXECUTE FUNCTION categories_counts();
+
+CREATE TRIGGER categories_counts_move
+AFTER UPDATE OF parent_id ON categories
+FOR EACH ROW WHEN (OLD.parent_id IS DISTINCT FROM NEW.parent_id)
+EXECUTE FUNCTION categories_counts();
+"""
+
+# Начальное заполнение счётчиков по текущему дереву
+BACKFILL = """
+WITH RECURSIVE closure AS (
+    SELECT id AS ancestor_id, id AS descendant_id FROM categories
+    UNION ALL
+    SELECT cl.ancestor_id, c.id
+    FROM categories c JOIN closure cl ON c.parent_id = cl.descendant_id
+), direct_products AS (
+    SELECT category_id, count(*) AS products
+    FROM product_category_association
+    GROUP BY category_id
+)
+UPDATE categories c
+SET descendant_categories_count = s.categories,
+    descendant_products_count = s.products
+FROM (
+    SELECT cl.ancestor_id AS id,
+           count(*) - 1 AS categories,
+           coalesce(sum(dp.products), 0) AS products
+    FROM closure cl
+    LEFT JOIN direct_products dp ON dp.category_id = cl.descendant_id
+    GROUP BY cl.ancestor_id
+) s
+WHERE c.id = s.id;
+"""
+
+
+def upgrade() -> None:
+    op.add_column('categories', sa.Column('descendant_categories_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('categories', sa.Column('descendant_products_count', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(BACKFILL)
+
+    op.execute(ADJUST_FUNCTION)
+    op.execute(ASSOCIATION_FUNCTIONS)
+    op.execute(ASSOCIATION_TRIGGERS)
+    op.execute(CATEGORY_FUNCTION)
+    op.execute(CATEGORY_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS categories_counts_move ON categories')
+    op.execute('DROP TRIGGER IF EXISTS categories_counts_insert_delete ON categories')
+    op.execute('DROP FUNCTION IF EXISTS categories_counts()')
+    for operation in ('insert', 'delete', 'update'):
+        op.execute(f'DROP TRIGGER IF EXISTS product_category_association_counts_{operation} ON product_category_association')
+        op.execute(f'DROP FUNCTION IF EXISTS product_category_association_counts_{operation}()')
+    op.execute('DROP FUNCTION IF EXISTS adjust_category_counts(uuid[], bigint[], bigint[])')
+
+    op.drop_column('categories', 'descendant_products_count')
+    op.drop_column('categories', 'descendant_categories_count')
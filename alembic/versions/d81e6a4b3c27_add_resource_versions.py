@@ -0,0 +1,160 @@
+"""add resource versions
+
+Revision ID: d81e6a4b3c27
+Revises: c52b8f0d7e13
+Create Date: 2026-10-19 13:41:52.117380
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81e6a4b3c27'
+down_revision: Union[str, None] = 'c52b8f0d7e13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+HELPER_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION bump_project_versions(ids uuid[]) RETURNS void AS $$
+    UPDATE projects SET version = version + 1 WHERE id = ANY(ids)
+$$ LANGUAGE sql;
+
+-- Проекты, в деревья которых входят категории ids (подъём по родителям до корня)
+CREATE OR REPLACE FUNCTION category_project_ids(ids uuid[]) RETURNS uuid[] AS $$
+    WITH RECURSIVE path AS (
+        SELECT c.id, c.parent_id FROM categories c WHERE c.id = ANY(ids)
+        UNION
+        SELECT c.id, c.parent_id FROM categories c JOIN path p ON c.id = p.parent_id
+    )
+    SELECT coalesce(array_agg(DISTINCT pca.project_id), '{}')
+    FROM project_category_association pca JOIN path p ON pca.category_id = p.id
+$$ LANGUAGE sql STABLE;
+"""
+
+TRIGGER_FUNCTIONS = """
+-- Прямое изменение проекта (имя, описание) тоже меняет его версию
+CREATE OR REPLACE FUNCTION projects_version() RETURNS trigger AS $$
+BEGIN
+    IF NEW.version = OLD.version THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION project_category_association_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_project_versions(ARRAY[OLD.project_id]);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM bump_project_versions(ARRAY[NEW.project_id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION categories_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_project_versions(category_project_ids(ARRAY[OLD.parent_id]));
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM bump_project_versions(category_project_ids(ARRAY[NEW.id]));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION product_category_association_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_project_versions(category_project_ids(array_agg(category_id))) FROM old_rows;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM bump_project_versions(category_project_ids(array_agg(category_id))) FROM new_rows;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION products_version() RETURNS trigger AS $$
+BEGIN
+    PERFORM bump_project_versions(category_project_ids(array_agg(pca.category_id)))
+    FROM product_category_association pca JOIN new_rows p ON pca.product_id = p.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+TRIGGERS = """
+CREATE TRIGGER projects_version
+BEFORE UPDATE ON projects
+FOR EACH ROW EXECUTE FUNCTION projects_version();
+
+CREATE TRIGGER project_category_association_version
+AFTER INSERT OR UPDATE OR DELETE ON project_category_association
+FOR EACH ROW EXECUTE FUNCTION project_category_association_version();
+
+CREATE TRIGGER categories_version
+AFTER INSERT OR DELETE OR UPDATE OF name, parent_id ON categories
+FOR EACH ROW EXECUTE FUNCTION categories_version();
+
+CREATE TRIGGER product_category_association_version_insert
+AFTER INSERT ON product_category_association
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_version();
+
+CREATE TRIGGER product_category_association_version_update
+AFTER UPDATE ON product_category_association
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_version();
+
+CREATE TRIGGER product_category_association_version_delete
+AFTER DELETE ON product_category_association
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION product_category_association_version();
+
+CREATE TRIGGER products_version
+AFTER UPDATE ON products
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION products_version();
+"""
+
+
+def upgrade() -> None:
+    op.add_column('objects', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('products', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('projects', sa.Column('version', sa.BigInteger(), server_default='1', nullable=False))
+
+    op.execute(HELPER_FUNCTIONS)
+    op.execute(TRIGGER_FUNCTIONS)
+    op.execute(TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER IF EXISTS products_version ON products')
+    for operation in ('insert', 'update', 'delete'):
+        op.execute(f'DROP TRIGGER IF EXISTS product_category_association_version_{operation} ON product_category_association')
+    op.execute('DROP TRIGGER IF EXISTS categories_version ON categories')
+    op.execute('DROP TRIGGER IF EXISTS project_category_association_version ON project_category_association')
+    op.execute('DROP TRIGGER IF EXISTS projects_version ON projects')
+
+    for function in (
+        'products_version()',
+        'product_category_association_version()',
+        'categories_version()',
+        'project_category_association_version()',
+        'projects_version()',
+        'category_project_ids(uuid[])',
+        'bump_project_versions(uuid[])',
+    ):
+        op.execute(f'DROP FUNCTION IF EXISTS {function}')
+
+    op.drop_column('projects', 'version')
+    op.drop_column('products', 'version')
+    op.drop_column('objects', 'version')
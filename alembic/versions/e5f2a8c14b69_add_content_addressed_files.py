@@ -0,0 +1,170 @@
+"""add content addressed files
+
+Revision ID: e5f2a8c14b69
+Revises: d81e6a4b3c27
+Create Date: 2026-10-19 15:02:37.418205
+
+"""
+import hashlib
+import os
+import shutil
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.settings import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f2a8c14b69'
+down_revision: Union[str, None] = 'd81e6a4b3c27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Счётчик ссылок на содержимое; триггеры уровня оператора, как и для счётчиков категорий
+REF_COUNT_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION object_files_ref_count_insert() RETURNS trigger AS $$
+BEGIN
+    UPDATE blobs b SET ref_count = b.ref_count + d.refs
+    FROM (SELECT sha256, count(*) AS refs FROM new_rows GROUP BY sha256) d
+    WHERE b.sha256 = d.sha256;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION object_files_ref_count_delete() RETURNS trigger AS $$
+BEGIN
+    UPDATE blobs b SET ref_count = b.ref_count - d.refs
+    FROM (SELECT sha256, count(*) AS refs FROM old_rows GROUP BY sha256) d
+    WHERE b.sha256 = d.sha256;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+REF_COUNT_TRIGGERS = """
+CREATE TRIGGER object_files_ref_count_insert
+AFTER INSERT ON object_files
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION object_files_ref_count_insert();
+
+CREATE TRIGGER object_files_ref_count_delete
+AFTER DELETE ON object_files
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION object_files_ref_count_delete();
+"""
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(settings.STORAGE_DIR, "blobs", sha256[:2], sha256[2:4], sha256)
+
+
+def sha256_of(path: str) -> str:
+    hash_sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+
+def copy_file(source: str, target: str):
+    """Копирует файл через временный: прерванная миграция не оставит недописанный файл под целевым именем."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp_path = f"{target}.{os.getpid()}.tmp"
+    shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def copy_files_to_blobs(connection):
+    """
+    Копирует файлы из STORAGE_DIR/objects/{id}/files в хранилище по содержимому.
+
+    Исходные файлы не трогаются: при откате транзакции миграции прежняя раскладка остаётся
+    целой. Их удаляет scripts/cleanup_legacy_storage.py после применения миграции.
+    """
+    objects = connection.execute(
+        sa.text("SELECT id, file_storage FROM objects WHERE cardinality(file_storage) > 0")
+    ).all()
+    for object_id, file_names in objects:
+        files_dir = os.path.join(settings.STORAGE_DIR, "objects", str(object_id), "files")
+        for file_name in dict.fromkeys(file_names):
+            file_path = os.path.join(files_dir, file_name)
+            if not os.path.isfile(file_path):
+                continue
+
+            sha256 = sha256_of(file_path)
+            connection.execute(
+                sa.text(
+                    "INSERT INTO blobs (sha256, size) VALUES (:sha256, :size) "
+                    "ON CONFLICT (sha256) DO NOTHING"
+                ),
+                {"sha256": sha256, "size": os.path.getsize(file_path)},
+            )
+            connection.execute(
+                sa.text(
+                    "INSERT INTO object_files (id, object_id, name, sha256) "
+                    "VALUES (gen_random_uuid(), :object_id, :name, :sha256)"
+                ),
+                {"object_id": object_id, "name": file_name, "sha256": sha256},
+            )
+
+            target = blob_path(sha256)
+            if not os.path.exists(target):
+                copy_file(file_path, target)
+
+
+def copy_files_from_blobs(connection):
+    """
+    Возвращает файлы объектов в STORAGE_DIR/objects/{id}/files. Каталог blobs не удаляется:
+    транзакция отката ещё может не зафиксироваться.
+    """
+    object_files = connection.execute(sa.text("SELECT object_id, name, sha256 FROM object_files")).all()
+    for object_id, file_name, sha256 in object_files:
+        if not os.path.isfile(blob_path(sha256)):
+            continue
+        files_dir = os.path.join(settings.STORAGE_DIR, "objects", str(object_id), "files")
+        copy_file(blob_path(sha256), os.path.join(files_dir, file_name))
+
+
+def upgrade() -> None:
+    op.create_table(
+        'blobs',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('sha256'),
+    )
+    op.create_index(
+        'ix_blobs_unreferenced', 'blobs', ['sha256'], unique=False, postgresql_where=sa.text('ref_count = 0')
+    )
+    op.create_table(
+        'object_files',
+        sa.Column('id', sa.UUID(), nullable=False),
+        sa.Column('object_id', sa.UUID(), nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.ForeignKeyConstraint(['object_id'], ['objects.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['sha256'], ['blobs.sha256']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('object_id', 'name', name='uq_object_files_object_id_name'),
+    )
+
+    op.execute(REF_COUNT_FUNCTIONS)
+    op.execute(REF_COUNT_TRIGGERS)
+
+    copy_files_to_blobs(op.get_bind())
+
+
+def downgrade() -> None:
+    copy_files_from_blobs(op.get_bind())
+
+    for operation in ('insert', 'delete'):
+        op.execute(f'DROP TRIGGER IF EXISTS object_files_ref_count_{operation} ON object_files')
+        op.execute(f'DROP FUNCTION IF EXISTS object_files_ref_count_{operation}()')
+
+    op.drop_table('object_files')
+    op.drop_index('ix_blobs_unreferenced', table_name='blobs')
+    op.drop_table('blobs')
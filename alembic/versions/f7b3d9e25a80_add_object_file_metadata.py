@@ -0,0 +1,59 @@
+"""add object file metadata
+
+Revision ID: f7b3d9e25a80
+Revises: e5f2a8c14b69
+Create Date: 2026-10-19 16:10:48.530921
+
+"""
+import mimetypes
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b3d9e25a80'
+down_revision: Union[str, None] = 'e5f2a8c14b69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def backfill_mime_types(connection):
+    object_files = connection.execute(sa.text("SELECT id, name FROM object_files")).all()
+    for object_file_id, name in object_files:
+        mime_type = mimetypes.guess_type(name)[0]
+        if mime_type:
+            connection.execute(
+                sa.text("UPDATE object_files SET mime_type = :mime_type WHERE id = :id"),
+                {"mime_type": mime_type, "id": object_file_id},
+            )
+
+
+def upgrade() -> None:
+    op.add_column('object_files', sa.Column('size', sa.BigInteger(), nullable=True))
+    op.add_column('object_files', sa.Column('mime_type', sa.String(), server_default='application/octet-stream', nullable=False))
+    op.add_column('object_files', sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+
+    op.execute('UPDATE object_files f SET size = b.size FROM blobs b WHERE b.sha256 = f.sha256')
+    op.alter_column('object_files', 'size', nullable=False)
+    op.alter_column('object_files', 'mime_type', server_default=None)
+    backfill_mime_types(op.get_bind())
+
+    op.drop_column('objects', 'file_storage')
+
+
+def downgrade() -> None:
+    op.add_column('objects', sa.Column('file_storage', postgresql.ARRAY(sa.String()), nullable=True))
+    op.execute(
+        'UPDATE objects o SET file_storage = f.names '
+        'FROM (SELECT object_id, array_agg(name ORDER BY created_at, name) AS names '
+        'FROM object_files GROUP BY object_id) f '
+        'WHERE o.id = f.object_id'
+    )
+
+    op.drop_column('object_files', 'created_at')
+    op.drop_column('object_files', 'mime_type')
+    op.drop_column('object_files', 'size')
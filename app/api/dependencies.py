@@ -1,8 +1,9 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from uuid import UUID
-from typing import List
+from typing import Callable, List, Optional
 
+from app.db.replicas import session_factory_for
 from app.db.session import async_session
 from app.repositories.chain_repository import ChainRepository
 from app.repositories.category_repository import CategoryRepository
@@ -14,7 +15,13 @@ from app.repositories.project_repository import ProjectRepository
 from app.db.models import Chain, Category, Object, Product, ProductCategoryAssociation, Project
 
 
-async def get_db() -> AsyncSession:
+async def get_db(request: Request) -> AsyncSession:
+    """Сеанс базы данных: GET и HEAD читают с реплики (если настроены), остальное — с основной базы."""
+    async with session_factory_for(request)() as session:
+        yield session
+
+async def get_primary_db() -> AsyncSession:
+    """Сеанс основной базы для чтений, которые не должны отставать (например, смещение докачки)."""
     async with async_session() as session:
         yield session
 
@@ -49,6 +56,17 @@ async def get_current_object(object_id: UUID, db: AsyncSession = Depends(get_db)
         return current_object
     
 
+async def get_current_object_row(object_id: UUID, db: AsyncSession = Depends(get_db)) -> Object:
+    """Текущий объект без филиалов и файлов (для маршрутов, которые не отдают ObjectResponse)."""
+    current_object = await ObjectRepository(db).get_object_row(object_id)
+    if not current_object:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Object not found"
+        )
+    return current_object
+
+
 async def get_current_product(product_id: UUID, db: AsyncSession = Depends(get_db)):
     current_product = await ProductRepository(db).get_product_by_id(product_id)
     if not current_product:
@@ -85,4 +103,57 @@ async def get_current_project(
             detail="Project not found"
         )
     else:
-        return current_project
\ No newline at end of file
+        return current_project
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Проверяет заголовок If-None-Match (слабое сравнение, как требует RFC 9110:
+    W/-префикс, добавляемый прокси при сжатии, игнорируется).
+    """
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def conditional_get(get_version: Callable) -> Callable:
+    """
+    Зависимость для условного GET. Версия ресурса получается зависимостью get_version
+    до загрузки ORM-объектов; при совпадении с If-None-Match сразу отвечаем 304 Not Modified,
+    иначе добавляем ETag к ответу. Если версия не найдена (None), обработка продолжается как обычно.
+    """
+    async def check_etag(
+        request: Request,
+        response: Response,
+        version = Depends(get_version),
+    ):
+        if version is None:
+            return
+
+        etag = f'"{version}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+
+    return check_etag
+
+
+async def get_all_objects_version(db: AsyncSession = Depends(get_db)) -> Optional[str]:
+    return await ObjectRepository(db).get_all_objects_etag()
+
+async def get_object_version(object_id: UUID, db: AsyncSession = Depends(get_db)) -> Optional[str]:
+    return await ObjectRepository(db).get_object_etag(object_id)
+
+async def get_all_products_version(db: AsyncSession = Depends(get_db)) -> Optional[str]:
+    return await ProductRepository(db).get_all_products_etag()
+
+async def get_product_version(product_id: UUID, db: AsyncSession = Depends(get_db)) -> Optional[int]:
+    return await ProductRepository(db).get_product_version(product_id)
+
+async def get_all_projects_version(db: AsyncSession = Depends(get_db)) -> Optional[str]:
+    return await ProjectRepository(db).get_all_projects_etag()
+
+async def get_project_version(project_id: UUID, db: AsyncSession = Depends(get_db)) -> Optional[int]:
+    return await ProjectRepository(db).get_project_version(project_id)
@@ -0,0 +1,134 @@
+import os
+
+from email.utils import formatdate
+from typing import Dict, List, Mapping, Optional, Tuple
+from urllib.parse import quote
+from fastapi import HTTPException, status
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from starlette.datastructures import Headers
+from starlette.types import Message, Receive, Scope, Send
+
+from app.api.dependencies import etag_matches
+from app.core.settings import settings
+from app.core.storage import get_storage
+
+
+def not_modified_response(scope: Scope, etag: Optional[str], headers: Mapping[str, str]) -> Optional[Response]:
+    """
+    Ответ 304 Not Modified, если If-None-Match запроса совпадает с etag, иначе None.
+    304 повторяет заголовки кэширования полного ответа, но не описывает тело.
+    """
+    if not etag or not etag_matches(Headers(scope=scope).get("if-none-match"), etag):
+        return None
+    kept = {name: headers[name] for name in ("cache-control", "vary") if name in headers}
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"etag": etag, **kept})
+
+
+class ChecksumFileResponse(FileResponse):
+    """
+    FileResponse со строгим ETag по хеш-сумме содержимого.
+
+    При совпадении ETag с If-None-Match отвечает 304 Not Modified, не открывая файл.
+    Запросы Range (в том числе с несколькими диапазонами, 206 Partial Content) обрабатывает
+    Starlette. If-Range сравнивается с этим ETag или с Last-Modified, поэтому докачка
+    продолжается, только если файл не изменился.
+    """
+
+    def __init__(self, path, checksum: Optional[str] = None, **kwargs):
+        # Без хеш-суммы (старые файлы) остаётся ETag Starlette по времени изменения и размеру
+        self.checksum_etag = f'"{checksum}"' if checksum else None
+        super().__init__(path, **kwargs)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = not_modified_response(scope, self.checksum_etag, self.headers) or super()
+        await response.__call__(scope, receive, send)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        if self.checksum_etag:
+            self.headers.setdefault("etag", self.checksum_etag)
+        super().set_stat_headers(stat_result)
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        if self.checksum_etag is None:
+            return super()._should_use_range(http_if_range, stat_result)
+        return http_if_range in (self.checksum_etag, formatdate(stat_result.st_mtime, usegmt=True))
+
+    async def _handle_multiple_ranges(
+        self,
+        send: Send,
+        ranges: List[Tuple[int, int]],
+        file_size: int,
+        send_header_only: bool,
+    ) -> None:
+        # Starlette записывает multipart/byteranges в Content-Range вместо Content-Type
+        # и занижает Content-Length на байт: исправляем тип, длину не передаём (chunked)
+        async def send_with_multipart_type(message: Message):
+            if message["type"] == "http.response.start":
+                headers = dict(message["headers"])
+                multipart_type = headers.pop(b"content-range")
+                headers.pop(b"content-length", None)
+                headers[b"content-type"] = multipart_type
+                message = {**message, "headers": list(headers.items())}
+            await send(message)
+
+        await super()._handle_multiple_ranges(send_with_multipart_type, ranges, file_size, send_header_only)
+
+
+class AccelRedirectResponse(Response):
+    """
+    Пустой ответ с X-Accel-Redirect: файл и Range обслуживает nginx, воркер освобождается сразу.
+    nginx сохраняет Content-Type, Content-Disposition и Cache-Control из этого ответа,
+    а строгий ETag по хеш-сумме передаёт дальше (add_header ETag $upstream_http_etag).
+    If-None-Match проверяется здесь: 304 приходит без X-Accel-Redirect и nginx его не трогает.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        checksum: Optional[str],
+        media_type: Optional[str],
+        filename: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        headers = dict(headers or {})
+        headers["X-Accel-Redirect"] = settings.ACCEL_REDIRECT_LOCATION.rstrip("/") + "/" + quote(key)
+        if filename:
+            headers["Content-Disposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+        self.checksum_etag = f'"{checksum}"' if checksum else None
+        if self.checksum_etag:
+            headers["ETag"] = self.checksum_etag
+        super().__init__(media_type=media_type, headers=headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        response = not_modified_response(scope, self.checksum_etag, self.headers) or super()
+        await response.__call__(scope, receive, send)
+
+
+async def storage_file_response(
+    key: str,
+    checksum: Optional[str],
+    media_type: Optional[str],
+    filename: Optional[str] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    Отдаёт файл из хранилища: локальный — через ChecksumFileResponse или, если задан
+    ACCEL_REDIRECT_LOCATION, через nginx (X-Accel-Redirect); удалённый — перенаправлением (307)
+    на временную ссылку хранилища.
+    """
+    storage = get_storage()
+    path = storage.local_path(key)
+    if path is not None and settings.ACCEL_REDIRECT_LOCATION:
+        return AccelRedirectResponse(key, checksum, media_type, filename, headers)
+    if path is not None:
+        return ChecksumFileResponse(path, checksum, media_type=media_type, filename=filename, headers=headers)
+
+    # Cache-Control передаётся самому файлу, а перенаправление кэшируется не дольше,
+    # чем действует временная ссылка
+    headers = dict(headers or {})
+    cache_control = headers.pop("Cache-Control", None)
+    url = await storage.url(key, filename=filename, media_type=media_type, cache_control=cache_control)
+    if url is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    headers["Cache-Control"] = f"private, max-age={settings.S3_URL_EXPIRES // 2}"
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers)
@@ -0,0 +1,87 @@
+import os
+import time
+import zipfile
+
+from typing import AsyncIterator, Iterable, Iterator, Tuple
+from fastapi.concurrency import run_in_threadpool
+
+from app.api.routes.catalog_utils import StreamSink
+from app.core.blobs import blob_key
+from app.core.storage import get_storage
+
+
+# Форматы, которые уже сжаты: в архив кладутся без повторного сжатия
+COMPRESSED_MIME_PREFIXES = ("image/", "video/", "audio/")
+COMPRESSED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp3", ".mp4", ".mov", ".avi",
+}
+
+
+def is_compressed(name: str, mime_type: str) -> bool:
+    return (
+        mime_type.startswith(COMPRESSED_MIME_PREFIXES)
+        or os.path.splitext(name)[1].lower() in COMPRESSED_EXTENSIONS
+    )
+
+
+async def iter_zip(entries: Iterable[Tuple[str, str, int, str]]) -> AsyncIterator[bytes]:
+    """
+    Потоково собирает ZIP-архив из содержимого хранилища, не записывая временных файлов.
+
+    Архив пишется в StreamSink, после каждой прочитанной части накопленные байты отдаются
+    клиенту, поэтому в памяти держится не больше одной части файла. Сжатие выполняется
+    в пуле потоков, чтение — через StorageBackend (локальный диск или S3).
+
+    :param entries: Кортежи (имя в архиве, sha256, размер, MIME-тип).
+    """
+    storage = get_storage()
+    sink = StreamSink()
+    archive = zipfile.ZipFile(sink, "w")
+    try:
+        for archive_name, sha256, size, mime_type in entries:
+            key = blob_key(sha256)
+            stat = await storage.stat(key)
+            if not stat:
+                continue
+
+            info = zipfile.ZipInfo(archive_name, date_time=time.localtime(stat.modified)[:6])
+            info.external_attr = 0o644 << 16
+            info.compress_type = zipfile.ZIP_STORED if is_compressed(archive_name, mime_type) else zipfile.ZIP_DEFLATED
+
+            target = archive.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT)
+            try:
+                async for chunk in storage.open(key):
+                    await run_in_threadpool(target.write, chunk)
+                    if data := sink.pop():
+                        yield data
+            finally:
+                await run_in_threadpool(target.close)
+            if data := sink.pop():
+                yield data
+    finally:
+        archive.close()
+
+    yield sink.pop()
+
+
+def project_archive_entries(rows) -> Iterator[Tuple[str, str, int, str]]:
+    """
+    Раскладывает файлы проекта по папкам объектов.
+    Одноимённые объекты получают папки с суффиксом (1), (2) и т.д.
+    """
+    folders = {}
+    used_folders = set()
+    for row in rows:
+        folder = folders.get(row.object_id)
+        if folder is None:
+            folder = row.object_name.replace("/", "_")
+            counter = 0
+            while folder in used_folders:
+                counter += 1
+                folder = f"{row.object_name.replace('/', '_')}({counter})"
+            folders[row.object_id] = folder
+            used_folders.add(folder)
+
+        yield f"{folder}/{row.name}", row.sha256, row.size, row.mime_type
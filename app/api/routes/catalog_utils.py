@@ -0,0 +1,186 @@
+import csv
+import io
+import itertools
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from typing import AsyncIterator, Iterator, List, Optional
+from uuid import UUID
+from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import sessionmaker
+
+from app.repositories.catalog_repository import CatalogRepository
+from app.schemas.enums import CatalogFormat
+from app.schemas.product import CatalogRecord
+
+
+CATALOG_BATCH_SIZE = 5000
+
+CATALOG_FIELDS = ["id", "name", "description", "country", "categories"]
+
+CATALOG_MEDIA_TYPES = {
+    CatalogFormat.CSV: "text/csv",
+    CatalogFormat.NDJSON: "application/x-ndjson",
+    CatalogFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+CATALOG_EXTENSIONS = {
+    ".csv": CatalogFormat.CSV,
+    ".ndjson": CatalogFormat.NDJSON,
+    ".jsonl": CatalogFormat.NDJSON,
+    ".parquet": CatalogFormat.PARQUET,
+}
+
+PARQUET_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("name", pa.string()),
+    ("description", pa.string()),
+    ("country", pa.string()),
+    ("categories", pa.list_(pa.string())),
+])
+
+
+def detect_catalog_format(filename: Optional[str], catalog_format: Optional[CatalogFormat]) -> CatalogFormat:
+    """Формат каталога: явно переданный или по расширению файла."""
+    if catalog_format:
+        return catalog_format
+    for extension, detected_format in CATALOG_EXTENSIONS.items():
+        if filename and filename.lower().endswith(extension):
+            return detected_format
+    raise HTTPException(
+        status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+        detail="Unknown catalog format, pass format=csv|ndjson|parquet"
+    )
+
+
+def iter_raw_records(file: UploadFile, catalog_format: CatalogFormat) -> Iterator[dict]:
+    """Синхронно читает записи каталога из загруженного файла (вызывается в пуле потоков)."""
+    if catalog_format == CatalogFormat.PARQUET:
+        for batch in pq.ParquetFile(file.file).iter_batches(batch_size=CATALOG_BATCH_SIZE):
+            yield from batch.to_pylist()
+        return
+
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    if catalog_format == CatalogFormat.CSV:
+        yield from csv.DictReader(text)
+    else:
+        for line in text:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def read_catalog_batches(file: UploadFile, catalog_format: CatalogFormat) -> AsyncIterator[List[CatalogRecord]]:
+    """
+    Читает каталог пакетами по CATALOG_BATCH_SIZE записей, не держа весь файл в памяти.
+    Чтение файла выполняется в пуле потоков, чтобы не блокировать цикл событий.
+    """
+    records = iter_raw_records(file, catalog_format)
+    offset = 0
+    while True:
+        try:
+            raw_batch = await run_in_threadpool(list, itertools.islice(records, CATALOG_BATCH_SIZE))
+        except (ValueError, pa.ArrowException) as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid catalog file: {str(e)}"
+            )
+        if not raw_batch:
+            return
+
+        batch = []
+        for number, raw_record in enumerate(raw_batch, start=offset + 1):
+            try:
+                batch.append(CatalogRecord.model_validate(raw_record))
+            except ValidationError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail=f"Invalid catalog record #{number}: {str(e)}"
+                )
+        offset += len(raw_batch)
+        yield batch
+
+
+class StreamSink(io.RawIOBase):
+    """
+    Файловый объект для потоковой записи Parquet: накапливает записанные байты
+    до pop(), но сохраняет сквозную позицию (tell) для корректных смещений в файле.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def serialize_csv(records: List[CatalogRecord], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CATALOG_FIELDS)
+    if header:
+        writer.writeheader()
+    for record in records:
+        row = record.model_dump(mode="json")
+        row["categories"] = ";".join(record.categories)
+        writer.writerow(row)
+    return buffer.getvalue().encode("utf-8")
+
+
+def serialize_ndjson(records: List[CatalogRecord]) -> bytes:
+    return "".join(record.model_dump_json() + "\n" for record in records).encode("utf-8")
+
+
+async def stream_catalog(
+    root_ids: List[UUID],
+    catalog_format: CatalogFormat,
+    session_factory: sessionmaker,
+) -> AsyncIterator[bytes]:
+    """
+    Потоково выгружает каталог проекта в заданном формате.
+
+    Сессия открывается здесь же (из session_factory — обычно реплики): зависимости FastAPI
+    закрываются до начала отправки потокового ответа.
+    """
+    async with session_factory() as db:
+        batches = CatalogRepository(db).stream_products(root_ids, CATALOG_BATCH_SIZE)
+
+        if catalog_format == CatalogFormat.PARQUET:
+            sink = StreamSink()
+            with pq.ParquetWriter(sink, PARQUET_SCHEMA) as writer:
+                async for records in batches:
+                    writer.write_table(pa.Table.from_pylist(
+                        [record.model_dump(mode="json") for record in records],
+                        schema=PARQUET_SCHEMA,
+                    ))
+                    yield sink.pop()
+            yield sink.pop()
+            return
+
+        header = True
+        async for records in batches:
+            if catalog_format == CatalogFormat.CSV:
+                yield serialize_csv(records, header)
+                header = False
+            else:
+                yield serialize_ndjson(records)
+
+        # Пустой каталог в CSV — только заголовок
+        if catalog_format == CatalogFormat.CSV and header:
+            yield serialize_csv([], header)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -38,8 +39,11 @@ async def create_category(category_data: CategoryCreateV2, db: AsyncSession = De
         )
 
 
-    parent_category = await CategoryRepository(db).get_category_by_id(category_data.id)
-    project = await ProjectRepository(db).get_project_by_id(category_data.id)
+    # Обе загрузки уходят на одном шаге цикла событий через загрузчики запроса
+    parent_category, project = await asyncio.gather(
+        CategoryRepository(db).get_category_by_id(category_data.id),
+        ProjectRepository(db).get_project_by_id(category_data.id),
+    )
 
     if not parent_category and not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parent category or project not found")
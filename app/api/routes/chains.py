@@ -67,22 +67,16 @@ async def get_object_by_product_id(
 async def create_chain(chain_data: ChainCreate, db: AsyncSession = Depends(get_db)):
 
     # TODO: сделать обработчик ошибки для каждого объекта
-    objects = await ObjectRepository(db).get_object_by_ids(
-        [
-            chain_data.source_object_id,
-            chain_data.target_object_id
-        ]
-    )
-
     product = await ProductRepository(db).get_product_by_id(chain_data.product_id)
-
     if not product:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Product not found"
         )
 
-    if len(objects) < 2 and (chain_data.source_object_id != chain_data.target_object_id):
+    # Объекты только проверяются на существование, без загрузки
+    object_ids = {chain_data.source_object_id, chain_data.target_object_id}
+    if len(await ObjectRepository(db).get_existing_object_ids(object_ids)) < len(object_ids):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Source or target object not found"
@@ -0,0 +1,29 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core.janitor import storage_janitor
+from app.db.pool import pool_status
+from app.db.query_stats import query_metrics
+from app.db.replicas import replica_router
+from app.db.session import async_engine
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Внутренние метрики приложения. Снаружи закрыт в nginx (location /api/internal/).
+    """
+    return {
+        "db_pool": pool_status(async_engine),
+        "db_replicas": replica_router.status(),
+        "storage_janitor": storage_janitor.metrics_snapshot(),
+        "db_queries": query_metrics.snapshot(),
+    }
+
+
+@router.get("/metrics/prometheus", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    """Гистограммы запросов к базе по маршрутам в текстовом формате Prometheus."""
+    return PlainTextResponse(query_metrics.prometheus(), media_type="text/plain; version=0.0.4")
@@ -1,15 +1,15 @@
 import logging
-import shutil
-import os
 import uuid
 import json
 
-from fastapi import APIRouter, UploadFile, File, status, Depends, HTTPException, Form
-from fastapi.responses import FileResponse
+from functools import partial
+from fastapi import APIRouter, UploadFile, File, status, Depends, HTTPException, Form, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.repositories.object_repository import ObjectRepository
+from app.repositories.file_repository import FileRepository
 from app.schemas.object import (
     ObjectUpdate, 
     ObjectResponse, 
@@ -17,20 +17,43 @@ from app.schemas.object import (
     AllObjectsResponse, 
     LocationCheckRequest, 
     AllSmallObjectsResponse, 
-    ObjectSmallResponse
+    ObjectSmallResponse,
+    ObjectFilesResponse
 )
 from app.schemas.enums import StatusEnum
 
-from app.api.dependencies import get_db, get_current_object, get_current_project
+from app.api.dependencies import (
+    get_db,
+    get_current_object,
+    get_current_object_row,
+    get_current_project,
+    conditional_get,
+    get_all_objects_version,
+    get_object_version,
+)
 from app.db.models import Object, Project
+from app.core.blobs import blob_key
+from app.core.images import IMMUTABLE_CACHE_CONTROL, image_version
 from app.core.settings import settings
-from app.api.routes.utils import attach_files_to_object, attach_image_to_object
+from app.core.janitor import storage_janitor
+from app.db.session import after_commit
+from app.core.storage import get_storage
+from app.api.routes.utils import (
+    attach_files_to_object,
+    attach_image_to_object,
+    image_file_response,
+    image_version_redirect,
+    release_blobs,
+    schedule_image_cleanup,
+)
+from app.api.routes.archive_utils import iter_zip
+from app.api.responses import storage_file_response
 
 router = APIRouter()
 
 logging.basicConfig(level=logging.INFO)
 
-@router.get("/", response_model=AllObjectsResponse)
+@router.get("/", response_model=AllObjectsResponse, dependencies=[Depends(conditional_get(get_all_objects_version))])
 async def list_objects(db: AsyncSession = Depends(get_db)):
     objects = await ObjectRepository(db).get_all_objects()
     if not objects:
@@ -42,7 +65,7 @@ async def list_objects(db: AsyncSession = Depends(get_db)):
 
     return AllObjectsResponse(objects=objects_to_return)
 
-@router.get("/{object_id}", response_model=ObjectResponse)
+@router.get("/{object_id}", response_model=ObjectResponse, dependencies=[Depends(conditional_get(get_object_version))])
 async def get_object_by_id(
     current_object: Object = Depends(get_current_object),
     db: AsyncSession = Depends(get_db)
@@ -87,14 +110,17 @@ async def create_object(
     # Проверка наличия родительского объекта, если указан parent_id
     parent_object = None
     if parent_id:
-        parent_object = await ObjectRepository(db).get_object_by_id(parent_id)
+        parent_object = await ObjectRepository(db).get_object_row(parent_id)
         if not parent_object:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Parent object with ID {parent_id} not found"
             )
 
+    # Идентификатор задаётся заранее: изображение сохраняется в хранилище до записи объекта,
+    # и объект с изображением и файлами записывается одной транзакцией
     obj = Object(
+        id=uuid.uuid4(),
         x=x,
         y=y,
         name=name,
@@ -104,23 +130,20 @@ async def create_object(
         links=links,
         icon=icon,
         image=None,
-        file_storage=[],  # Обновится позже, если загружены файлы
         description=description,
         parent_id=parent_id,
         project_id=current_project.id
     )
 
-    object_db = await ObjectRepository(db).create_object(obj)
-
     # Загружаем изображение, если передано
     if image:
-        object_db = await attach_image_to_object(db, object_db, image)
+        await attach_image_to_object(db, obj, image)
 
     # Загружаем файлы, если переданы
     if files:
-        object_db = await attach_files_to_object(db, object_db, files)
+        await attach_files_to_object(db, obj, files)
 
-    return object_db
+    return await ObjectRepository(db).create_object(obj)
 
 
 @router.put("/{object_id}", response_model=ObjectResponse)
@@ -142,49 +165,60 @@ async def update_object(
             detail="Invalid JSON format in object_data"
             )
 
+    object_repository = ObjectRepository(db)
+
     # Обновляем объект, если переданы данные
-    updated_object = await ObjectRepository(db).update_object(current_object, object_data_dict)
+    object_repository.set_fields(current_object, object_data_dict)
 
     # Загружаем изображение, если передано
     if image:
-        updated_object = await attach_image_to_object(db, updated_object, image)
+        await attach_image_to_object(db, current_object, image)
 
     # Загружаем файлы, если переданы
     if files:
-        updated_object = await attach_files_to_object(db, updated_object, files)
+        await attach_files_to_object(db, current_object, files)
 
-    return updated_object
+    # Все изменения записываются одной транзакцией
+    return await object_repository.save_object(current_object)
 
 
 @router.delete("/{object_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_object(
-    current_object: Object = Depends(get_current_object),
+    current_object: Object = Depends(get_current_object_row),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Удаляет объект вместе со всеми его файлами и изображениями.
     """
-    object_dir = os.path.join(settings.STORAGE_DIR, "objects", str(current_object.id))
+    object_repository = ObjectRepository(db)
+    # Филиалы любой глубины, цепочки и файлы удаляет база (ON DELETE CASCADE),
+    # связи объекта не загружаются
+    object_ids = await object_repository.get_subtree_ids(current_object.id)
+    hashes = await FileRepository(db).get_object_hashes(object_ids)
+
+    await object_repository.delete_object(current_object, object_ids)
 
-    # Удаляем папку с файлами, если существует
-    if os.path.exists(object_dir) and os.path.isdir(object_dir):
-        shutil.rmtree(object_dir)  # Полностью удаляем папку с объектом
+    # Каталоги объектов в хранилище удаляются в фоне, после фиксации
+    for object_id in object_ids:
+        after_commit(db, partial(storage_janitor.schedule_delete, f"objects/{object_id}/"))
 
-    # Удаляем объект из базы данных
-    await ObjectRepository(db).delete_object(current_object)
+    # Удаляем содержимое, на которое больше никто не ссылается, в той же транзакции
+    await release_blobs(db, hashes)
+    await db.commit()
 
 
 
 @router.post("/{object_id}/image", status_code=status.HTTP_201_CREATED)
 async def upload_object_image(
     file: UploadFile = File(...),
-    object: Object = Depends(get_current_object),
+    object: Object = Depends(get_current_object_row),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Загрузка изображения для объекта.
     """
     await attach_image_to_object(db, object, file)
+    await ObjectRepository(db).save_object(object)
     return {"detail": "Image uploaded successfully"}
 
 
@@ -197,46 +231,46 @@ async def upload_object_files(
     """
     Загрузка документов для объекта.
     """
-    obj = await attach_files_to_object(db, object, files)
+    await attach_files_to_object(db, object, files)
+    obj = await ObjectRepository(db).save_object(object)
     return {"files": obj.file_storage}
 
 
 
 @router.delete("/{object_id}/image", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_object_image(
-    obj: Object = Depends(get_current_object),
+    obj: Object = Depends(get_current_object_row),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Удаление изображения объекта.
     """
 
+    image_sha256 = obj.image_sha256
     if obj.image:
         # Обновляем запись в базе данных
         await ObjectRepository(db).update_image(obj, False)
         
-    # Удаляем файл если он существует
-    if os.path.exists(settings.STORAGE_DIR / "objects" / str(obj.id) / "image.jpg"):
-        os.remove(settings.STORAGE_DIR / "objects" / str(obj.id) / "image.jpg")
+    # Удаляем файл и его уменьшенные копии в фоне
+    schedule_image_cleanup("objects", obj.id, image_sha256)
 
     return
 
 
 @router.delete("/{object_id}/files", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_object_files(
-    obj: Object = Depends(get_current_object),
+    obj: Object = Depends(get_current_object_row),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Удаление всех файлов объекта.
     """
 
-    # Удаляем папку с файлами
-    if os.path.exists(settings.STORAGE_DIR / "objects" / str(obj.id) / "files"):
-        shutil.rmtree(settings.STORAGE_DIR / "objects" / str(obj.id) / "files")
-
-    # Обновляем запись в базе данных
-    await ObjectRepository(db).update_file_storage(obj, None)
+    # Удаляем ссылки на файлы и содержимое, на которое больше никто не ссылается,
+    # и обновляем запись в базе данных одной транзакцией
+    hashes = await FileRepository(db).delete_object_files(obj.id)
+    await release_blobs(db, hashes)
+    await ObjectRepository(db).update_files(obj)
 
     return {"detail": "Object files deleted successfully"}
 
@@ -244,104 +278,119 @@ async def delete_object_files(
 
 @router.get("/{object_id}/image", response_class=FileResponse)
 async def get_object_image(
-    current_object: Object = Depends(get_current_object),
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
+    current_object: Object = Depends(get_current_object_row),
 ):
     """
-    Получить изображение объекта по его ID.
+    Получить текущее изображение объекта по его ID (ответ перепроверяется по ETag).
+    С параметром size отдаётся уменьшенная копия (WebP, если клиент его принимает).
     """
-    if not current_object.image:
+    if not current_object.image or not current_object.image_sha256:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found for the object")
     
-    image_path = settings.STORAGE_DIR / "objects" / str(current_object.id) / "image.jpg"
-    if not image_path.exists():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image file not found")
-    
-    return FileResponse(image_path, media_type="image/jpeg")
+    return await image_file_response(request, "objects", current_object.id, current_object.image_sha256, size)
+
+
+@router.get("/{object_id}/image/{version}", response_class=FileResponse)
+async def get_object_image_version(
+    version: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
+    current_object: Object = Depends(get_current_object_row),
+):
+    """
+    Получить изображение объекта по ссылке из поля image (с версией изображения).
+    Такая ссылка неизменяема и кэшируется клиентом на год; ссылка на старую версию
+    перенаправляет на текущую.
+    """
+    if not current_object.image or not current_object.image_sha256:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found for the object")
+
+    if version != image_version(current_object.image_sha256):
+        return image_version_redirect(request, current_object.image)
+
+    return await image_file_response(
+        request, "objects", current_object.id, current_object.image_sha256, size, IMMUTABLE_CACHE_CONTROL
+    )
 
 
-@router.get("/{object_id}/files")
+@router.get("/{object_id}/files", response_model=ObjectFilesResponse)
 async def get_object_files(
-    current_object: Object = Depends(get_current_object),
+    current_object: Object = Depends(get_current_object_row),
+    db: AsyncSession = Depends(get_db),
 ):
     """
-    Получить список всех файлов, связанных с объектом по его ID.
+    Получить список всех файлов, связанных с объектом по его ID, с размерами и типами.
     """
-    if not current_object.file_storage:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File storage not found for the object")
-    
-    # Path to the files directory
-    files_dir = settings.STORAGE_DIR / "objects" / str(current_object.id) / "files"
+    files = await FileRepository(db).get_object_files(current_object.id)
+    if not files:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No files found for the object")
     
-    if not files_dir.exists() or not files_dir.is_dir():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Files directory not found")
+    return ObjectFilesResponse(files=files)
 
-    # Collect all file names in the directory
-    file_list = [file.name for file in files_dir.iterdir() if file.is_file()]
-    
-    if not file_list:
+
+@router.get("/{object_id}/files.zip", response_class=StreamingResponse)
+async def get_object_files_archive(
+    current_object: Object = Depends(get_current_object_row),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Скачать все файлы объекта одним ZIP-архивом (собирается на лету).
+    """
+    files = await FileRepository(db).get_object_files(current_object.id)
+    if not files:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No files found for the object")
-    
-    return {"files": file_list}
+
+    entries = [(file.name, file.sha256, file.size, file.mime_type) for file in files]
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="object-{current_object.id}.zip"'},
+    )
 
 
 @router.get("/{object_id}/files/{file_name}", response_class=FileResponse)
 async def get_object_file(
     file_name: str,
-    current_object: Object = Depends(get_current_object),
+    current_object: Object = Depends(get_current_object_row),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     Получить файл из файлового хранилища объекта по его ID.
+    Поддерживается докачка: Range (в том числе несколько диапазонов) и If-Range.
     """
-    if not current_object.file_storage:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File storage not found for the object")
+    object_file = await FileRepository(db).get_object_file(current_object.id, file_name)
+    if not object_file:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     
-    file_path = settings.STORAGE_DIR / "objects" / str(current_object.id) / "files" / file_name
-    if not file_path.exists():
+    key = blob_key(object_file.sha256)
+    if not await get_storage().stat(key):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     
-    return FileResponse(file_path, media_type="application/octet-stream", filename=file_name)
+    return await storage_file_response(key, object_file.sha256, object_file.mime_type, filename=file_name)
 
 
 @router.delete("/{object_id}/files/{file_name}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_object_file(
     file_name: str,
-    current_object: Object = Depends(get_current_object),
+    current_object: Object = Depends(get_current_object_row),
     db: AsyncSession = Depends(get_db),
 
 ):
     """
     Удалить файл из файлового хранилища объекта по его названию.
     """
-    if not current_object.file_storage:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File storage not found for the object"
-        )
-
-    file_path = settings.STORAGE_DIR / "objects" / str(current_object.id) / "files" / file_name
-
-    if not file_path.exists() or not file_path.is_file():
+    sha256 = await FileRepository(db).delete_object_file(current_object.id, file_name)
+    if sha256 is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="File not found"
         )
 
-    try:
-        os.remove(file_path)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error deleting file: {str(e)}"
-        )
-    
-    # Удаляем имя файла из file_storage
-    try:
-        await ObjectRepository(db).remove_file_from_storage(current_object, file_name)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+    # Удаляем содержимое, если на него больше никто не ссылается
+    await release_blobs(db, [sha256])
+    await ObjectRepository(db).update_files(current_object)
 
     return {"detail": f"File '{file_name}' deleted successfully"}
 
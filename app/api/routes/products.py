@@ -1,35 +1,84 @@
-import shutil
-import os
 import json
+import uuid
 
-from fastapi import APIRouter, UploadFile, File, status, Depends, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, status, Depends, HTTPException, Form, Query, Request
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from uuid import UUID
 
 from app.repositories.product_repository import ProductRepository
-from app.repositories.product_category_association_repository import AssociationRepository
 from app.repositories.category_repository import CategoryRepository
-
-from app.schemas.product import ProductCreate, ProductUpdate, ProductResponse, AllProductResponse, ProductIds
+from app.repositories.catalog_repository import CatalogRepository
+from app.repositories.project_repository import ProjectRepository
+
+from app.schemas.product import (
+    ProductCreate,
+    ProductUpdate,
+    ProductResponse,
+    AllProductResponse,
+    ProductIds,
+    ProductBulkCreate,
+    CatalogImportResponse,
+)
+from app.schemas.enums import CatalogFormat
 from app.schemas.filter import FilterModel
-from app.db.models import Product
-from app.api.dependencies import get_db, get_current_product, get_current_project
-from app.api.routes.utils import collect_filtered_products
-from app.core.settings import settings
+from app.db.models import Product, Project
+from app.api.dependencies import (
+    get_db,
+    get_current_product,
+    get_current_project,
+    conditional_get,
+    get_all_products_version,
+    get_product_version,
+)
+from app.api.routes.catalog_utils import (
+    CATALOG_MEDIA_TYPES,
+    detect_catalog_format,
+    read_catalog_batches,
+    stream_catalog,
+)
+from app.api.routes.utils import (
+    attach_image_to_product,
+    image_file_response,
+    image_version_redirect,
+    save_product_image,
+    schedule_image_cleanup,
+)
+from app.core.images import IMMUTABLE_CACHE_CONTROL, image_version
+from app.core.janitor import storage_janitor
+from app.db.replicas import session_factory_for
 
 
 router = APIRouter()
 
-@router.get("/", response_model=AllProductResponse)
+@router.get("/", response_model=AllProductResponse, dependencies=[Depends(conditional_get(get_all_products_version))])
 async def list_products(db: AsyncSession = Depends(get_db)):
     products = await ProductRepository(db).get_all_products()
     if not products:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No products found")
     return AllProductResponse(products=products)
 
-@router.get("/{product_id}", response_model=ProductResponse)
+@router.get("/export", response_class=StreamingResponse)
+async def export_catalog(
+    request: Request,
+    catalog_format: CatalogFormat = Query(CatalogFormat.CSV, alias="format"),
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Потоковая выгрузка каталога продуктов проекта (CSV, NDJSON или Parquet)
+    с путями категорий вида `Root/Sub/Leaf`.
+    """
+    category_ids = await ProjectRepository(db).get_category_ids(project.id)
+
+    return StreamingResponse(
+        stream_catalog(category_ids, catalog_format, session_factory_for(request)),
+        media_type=CATALOG_MEDIA_TYPES[catalog_format],
+        headers={"Content-Disposition": f'attachment; filename="catalog.{catalog_format.value}"'},
+    )
+
+@router.get("/{product_id}", response_model=ProductResponse, dependencies=[Depends(conditional_get(get_product_version))])
 async def get_product_by_id(
     current_product: Product = Depends(get_current_product), 
     db: AsyncSession = Depends(get_db)
@@ -55,39 +104,95 @@ async def create_product(
     image: Optional[UploadFile] = File(None),
     db: AsyncSession = Depends(get_db)
 ):
-    categories_objects = await CategoryRepository(db).get_category_by_ids(categories)
+    categories = list(dict.fromkeys(categories))  # Убираем повторы, сохраняя порядок
+    existing_categories = await CategoryRepository(db).get_existing_category_ids(categories)
 
-    if len(categories_objects) < len(categories):
+    if len(existing_categories) < len(categories):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not all categories exist")
     
+    # ID задаём заранее, чтобы сохранить изображение до записи в базу
     product = Product(
+        id=uuid.uuid4(),
         name=name,
         description=description,
         country=country,
     )
 
-    product = await ProductRepository(db).create_product(product)
-
     if image:
-        # Создаем путь для хранения файла
-        product_dir = os.path.join(settings.STORAGE_DIR, "products", str(product.id))
-        os.makedirs(product_dir, exist_ok=True)
-        file_path = os.path.join(product_dir, "image.jpg")
+        checksum = await save_product_image(product.id, image)
+        ProductRepository(db).set_image(product, True, checksum)
 
-        # Сохраняем файл
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(image.file, f)
+    # Продукт, изображение и привязки к категориям записываются одной транзакцией
+    return await ProductRepository(db).create_product(product, categories)
 
-        # Обновляем запись в базе данных
-        await ProductRepository(db).update_image(product, True)
 
-    for category_id in categories:
-        await AssociationRepository(db).create_association(
-            product_id=product.id,
-            category_id=category_id
+@router.post("/bulk", response_model=AllProductResponse)
+async def create_products_bulk(
+    products_data: ProductBulkCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Массовое создание продуктов с привязками к категориям одной транзакцией.
+    """
+    category_ids = {
+        category_id
+        for product_data in products_data.products
+        for category_id in product_data.categories
+    }
+    existing_categories = await CategoryRepository(db).get_existing_category_ids(category_ids)
+
+    if len(existing_categories) < len(category_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not all categories exist")
+
+    items = [
+        (
+            Product(
+                name=product_data.name,
+                description=product_data.description,
+                country=product_data.country,
+            ),
+            list(dict.fromkeys(product_data.categories)),
         )
+        for product_data in products_data.products
+    ]
+    products = await ProductRepository(db).create_products(items)
+
+    return AllProductResponse(products=products)
+
+@router.post("/import", response_model=CatalogImportResponse)
+async def import_catalog(
+    file: UploadFile = File(...),
+    catalog_format: Optional[CatalogFormat] = Query(None, alias="format"),
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Импорт каталога продуктов в проект одной транзакцией (CSV, NDJSON или Parquet).
+
+    Категории задаются путями `Root/Sub/Leaf` (в CSV несколько путей через `;`),
+    недостающие создаются. Продукты с существующим `id` обновляются, их привязки
+    к категориям проекта заменяются (привязки к категориям других проектов остаются).
+    """
+    catalog_format = detect_catalog_format(file.filename, catalog_format)
+    category_ids = await ProjectRepository(db).get_category_ids(project.id)
+
+    repository = CatalogRepository(db)
+    path_ids = await repository.get_category_paths(category_ids)
+    await repository.create_import_table()
+
+    products_count = categories_count = 0
+    async for records in read_catalog_batches(file, catalog_format):
+        categories_count += await repository.create_category_paths(
+            project.id,
+            {path for record in records for path in record.categories},
+            path_ids,
+        )
+        products_count += await repository.import_products(records, path_ids)
+
+    await db.commit()
+
+    return CatalogImportResponse(products=products_count, categories_created=categories_count)
 
-    return product
 
 @router.put("/{product_id}", response_model=ProductResponse)
 async def update_product(
@@ -107,24 +212,26 @@ async def update_product(
             detail="Invalid JSON format in product_data"
         )
 
-    # Обновляем продукт, если переданы данные
-    updated_product = await ProductRepository(db).update_product(current_product, product_data_dict)
+    # Если переданы категории, привязки продукта заменяются
+    categories = product_data_dict.pop("categories", None)
+    if categories is not None:
+        try:
+            categories = list(dict.fromkeys(UUID(category_id) for category_id in categories))
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Invalid categories in product_data"
+            )
+        existing_categories = await CategoryRepository(db).get_existing_category_ids(categories)
+        if len(existing_categories) < len(categories):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not all categories exist")
 
     # Загружаем изображение, если передано
     if image:
-        # Создаем путь для хранения файла
-        product_dir = os.path.join(settings.STORAGE_DIR, "products", str(updated_product.id))
-        os.makedirs(product_dir, exist_ok=True)
-        file_path = os.path.join(product_dir, "image.jpg")
+        await attach_image_to_product(db, current_product, image)
 
-        # Сохраняем файл
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(image.file, f)
-
-        # Обновляем запись в базе данных
-        await ProductRepository(db).update_image(updated_product, True)
-
-    return updated_product
+    # Данные, изображение и привязки к категориям записываются одной транзакцией
+    return await ProductRepository(db).update_product(current_product, product_data_dict, categories)
 
 
 @router.delete("/{product_id}")
@@ -133,7 +240,9 @@ async def delete_product(
     db: AsyncSession = Depends(get_db),
     ):
     
+    product_id = current_product.id
     await ProductRepository(db).delete_product(current_product)
+    storage_janitor.schedule_delete(f"products/{product_id}/")
     return {"detail": "Product deleted"}
 
 
@@ -145,13 +254,10 @@ async def get_filtered_products_by_project(
 ):
 
     # Получаем категории, связанные с проектом
-    category_ids = [assoc.category_id for assoc in current_project.categories]
-    categories = await CategoryRepository(db).get_category_by_ids(category_ids)
+    category_ids = await ProjectRepository(db).get_category_ids(current_project.id)
 
-    # Рекурсивно собираем продукты
-    filtered_products = []
-    for category in categories:
-        filtered_products.extend(collect_filtered_products(category, filters))
+    # Фильтруем продукты поддеревьев категорий на стороне базы данных
+    filtered_products = await ProductRepository(db).get_filtered_products(category_ids, filters)
 
     return AllProductResponse(products=filtered_products)
 
@@ -165,18 +271,11 @@ async def upload_product_image(
     """
     Загрузка изображения для продукта.
     """
-    # Создаем путь для хранения файла
-    product_dir = os.path.join(settings.STORAGE_DIR, "products", str(product.id))
-    os.makedirs(product_dir, exist_ok=True)
-    file_path = os.path.join(product_dir, "image.jpg")
-
-    # Сохраняем файл
-    with open(file_path, "wb") as f:
-        shutil.copyfileobj(file.file, f)
+    await attach_image_to_product(db, product, file)
 
     # Обновляем запись в базе данных
-    await ProductRepository(db).update_image(product, True)
-    return {"detail": "Image uploaded successfully", "path": f'{settings.API_URL}/products/{product.id}/image'}
+    await ProductRepository(db).save_product(product)
+    return {"detail": "Image uploaded successfully", "path": product.image}
 
 
 
@@ -189,13 +288,13 @@ async def delete_product_image(
     Удаление изображения продукта.
     """
 
+    image_sha256 = product.image_sha256
     if product.image:
         # Обновляем запись в базе данных
         await ProductRepository(db).update_image(product, False)
         
-    # Удаляем файл
-    if os.path.exists(settings.STORAGE_DIR / "products" / str(product.id) / "image.jpg"):
-        os.remove(settings.STORAGE_DIR / "products" / str(product.id) / "image.jpg")
+    # Удаляем файл и его уменьшенные копии в фоне
+    schedule_image_cleanup("products", product.id, image_sha256)
 
     return
 
@@ -203,16 +302,38 @@ async def delete_product_image(
 
 @router.get("/{product_id}/image", response_class=FileResponse)
 async def get_product_image(
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
     current_product: Product = Depends(get_current_product),
 ):
     """
-    Получить изображение продукта по его ID.
+    Получить текущее изображение продукта по его ID (ответ перепроверяется по ETag).
+    С параметром size отдаётся уменьшенная копия (WebP, если клиент его принимает).
     """
-    if not current_product.image:
+    if not current_product.image or not current_product.image_sha256:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found for the product")
     
-    image_path = settings.STORAGE_DIR / "products" / str(current_product.id) / "image.jpg"
-    if not image_path.exists():
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image file not found")
-    
-    return FileResponse(image_path, media_type="image/jpeg")
+    return await image_file_response(request, "products", current_product.id, current_product.image_sha256, size)
+
+
+@router.get("/{product_id}/image/{version}", response_class=FileResponse)
+async def get_product_image_version(
+    version: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=1),
+    current_product: Product = Depends(get_current_product),
+):
+    """
+    Получить изображение продукта по ссылке из поля image (с версией изображения).
+    Такая ссылка неизменяема и кэшируется клиентом на год; ссылка на старую версию
+    перенаправляет на текущую.
+    """
+    if not current_product.image or not current_product.image_sha256:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found for the product")
+
+    if version != image_version(current_product.image_sha256):
+        return image_version_redirect(request, current_product.image)
+
+    return await image_file_response(
+        request, "products", current_product.id, current_product.image_sha256, size, IMMUTABLE_CACHE_CONTROL
+    )
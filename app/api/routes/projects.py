@@ -1,11 +1,20 @@
 import logging
 
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.db.models import Project
 from app.repositories.project_repository import ProjectRepository
-from app.api.dependencies import get_db, get_current_project
+from app.repositories.file_repository import FileRepository
+from app.api.routes.archive_utils import iter_zip, project_archive_entries
+from app.api.dependencies import (
+    get_db,
+    get_current_project,
+    conditional_get,
+    get_all_projects_version,
+    get_project_version,
+)
 from app.schemas.project import (
     ProjectCreate,
     ProjectUpdate,
@@ -16,14 +25,14 @@ from app.schemas.project import (
 router = APIRouter()
 
 
-@router.get("/", response_model=AllProjectsResponse)
+@router.get("/", response_model=AllProjectsResponse, dependencies=[Depends(conditional_get(get_all_projects_version))])
 async def get_all_projects(db: AsyncSession = Depends(get_db)):
     """Получить все проекты."""
     projects = await ProjectRepository(db).get_all_projects()
     return AllProjectsResponse(projects=[ProjectResponse.model_validate(project) for project in projects])
 
 
-@router.get("/{project_id}", response_model=ProjectResponse)
+@router.get("/{project_id}", response_model=ProjectResponse, dependencies=[Depends(conditional_get(get_project_version))])
 async def get_project_by_id(
     project: Project = Depends(get_current_project), 
     db: AsyncSession = Depends(get_db)):
@@ -31,6 +40,21 @@ async def get_project_by_id(
 
     return project
 
+@router.get("/{project_id}/files.zip", response_class=StreamingResponse)
+async def get_project_files_archive(
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)):
+    """Скачать файлы всех объектов проекта одним ZIP-архивом (по папке на объект)."""
+    rows = await FileRepository(db).get_project_files(project.id)
+    if not rows:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No files found for the project")
+
+    return StreamingResponse(
+        iter_zip(project_archive_entries(rows)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="project-{project.id}.zip"'},
+    )
+
 @router.post("/", response_model=ProjectResponse)
 async def create_project(
     project_data: ProjectCreate, db: AsyncSession = Depends(get_db)
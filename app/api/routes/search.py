@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Project
+from app.repositories.project_repository import ProjectRepository
+from app.repositories.search_repository import SearchRepository
+from app.schemas.search import SearchResponse, SearchResult
+from app.api.dependencies import get_db, get_current_project
+
+router = APIRouter()
+
+
+@router.get("", response_model=SearchResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    project: Project = Depends(get_current_project),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Полнотекстовый поиск по объектам, продуктам и категориям проекта.
+    Слова запроса ищутся по префиксу, результаты отсортированы по релевантности.
+    """
+    category_ids = await ProjectRepository(db).get_category_ids(project.id)
+    rows = await SearchRepository(db).search(project.id, category_ids, q, limit)
+
+    return SearchResponse(results=[SearchResult.model_validate(row) for row in rows])
@@ -1,50 +1,89 @@
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from uuid import UUID
 
-from app.db.models import Category, Project
+from app.db.models import Project
 from app.repositories.category_repository import CategoryRepository
+from app.repositories.product_repository import ProductRepository
+from app.repositories.project_repository import ProjectRepository
 
 from app.schemas.tree import (
     TreeResponse, 
     AllTreeResponse,
+    TreeNodeResponse,
+    TreeChildrenResponse,
 )
+from app.schemas.product import ProductResponse
 
 from app.schemas.filter import FilterModel
-from app.api.dependencies import get_db, get_current_category, get_current_project
-from app.api.routes.utils import map_category, map_all_category
+from app.api.dependencies import get_db, get_current_project, conditional_get, get_project_version
+from app.api.routes.utils import build_category_trees, load_category_trees
 
 router = APIRouter()
 logging.basicConfig(level=logging.INFO)
 
+
 @router.get("/all", response_model=AllTreeResponse)
 async def get_tree(db: AsyncSession = Depends(get_db)):
 
-    categories = await CategoryRepository(db).get_root_categories_with_relationships()
+    root_ids = await CategoryRepository(db).get_root_category_ids()
 
-    if not categories:
+    if not root_ids:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Categories not found")
 
-    answers = []
-    for category in categories:
-        category_to_return = map_all_category(category)
-        answers.append(category_to_return)
+    answers = await load_category_trees(db, root_ids)
 
     return AllTreeResponse(categories=answers)
 
 
 @router.get("/{category_id}", response_model=TreeResponse)
 async def get_tree_by_id(
-    category: Category = Depends(get_current_category),
+    category_id: UUID,
     db: AsyncSession = Depends(get_db)
     ):
 
-    category_to_return = map_all_category(category)
+    node = await CategoryRepository(db).get_category_node(category_id)
+    if not node:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+
+    trees = await load_category_trees(db, [category_id])
+
+    return trees[0]
 
-    return category_to_return
 
-@router.get("/project/{project_id}", response_model=AllTreeResponse)
+@router.get("/{category_id}/children", response_model=TreeChildrenResponse)
+async def get_tree_children(
+    category_id: UUID,
+    cursor: Optional[UUID] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Раскрытие одного узла дерева: прямые дочерние категории со счётчиками поддерева
+    и страница продуктов, привязанных непосредственно к категории.
+    """
+    node = await CategoryRepository(db).get_category_node(category_id)
+    if not node:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+
+    children = await CategoryRepository(db).get_child_nodes(category_id)
+
+    # Запрашиваем на один продукт больше, чтобы узнать, есть ли следующая страница
+    products = await ProductRepository(db).get_category_products_page(category_id, cursor, limit + 1)
+    next_cursor = products[limit - 1].id if len(products) > limit else None
+
+    return TreeChildrenResponse(
+        **TreeNodeResponse.model_validate(node).model_dump(),
+        children=[TreeNodeResponse.model_validate(child) for child in children],
+        products=[ProductResponse.model_validate(product) for product in products[:limit]],
+        next_cursor=next_cursor,
+    )
+
+
+@router.get("/project/{project_id}", response_model=AllTreeResponse, dependencies=[Depends(conditional_get(get_project_version))])
 async def get_tree_by_project(
     project: Project = Depends(get_current_project),
     db: AsyncSession = Depends(get_db)
@@ -53,12 +92,10 @@ async def get_tree_by_project(
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
 
-    category_ids = [association.category_id for association in project.categories]
-
-    categories = await CategoryRepository(db).get_category_by_ids(category_ids)
+    category_ids = await ProjectRepository(db).get_category_ids(project.id)
 
     # Построение дерева категорий
-    trees = [map_all_category(category) for category in categories]
+    trees = await load_category_trees(db, category_ids)
 
 
     return AllTreeResponse(categories=trees)
@@ -71,16 +108,17 @@ async def get_tree_by_project_with_filters(
     db: AsyncSession = Depends(get_db)
 ):
 
-    # Получаем категории проекта
-    category_ids = [association.category_id for association in project.categories]
-    categories = await CategoryRepository(db).get_category_by_ids(category_ids)
+    # Ищем подходящие продукты в поддеревьях категорий проекта
+    category_ids = await ProjectRepository(db).get_category_ids(project.id)
+    product_rows = await ProductRepository(db).get_category_product_rows(category_ids, filters)
 
-    # Строим дерево с применением фильтров
-    filtered_tree = [
-        map_category(category, filters) for category in categories
-    ]
-    filtered_tree = [category for category in filtered_tree if category is not None]  # Убираем None
+    # Загружаем только категории найденных продуктов и их предков
+    categories = await CategoryRepository(db).get_categories_with_ancestors(
+        {row.category_id for row in product_rows}
+    )
 
+    # Строим дерево из найденных продуктов, пустые категории не попадают в ответ
+    filtered_tree = build_category_trees(category_ids, categories, product_rows, skip_empty=True)
 
     # Возвращаем дерево
     return AllTreeResponse(categories=filtered_tree)
@@ -0,0 +1,284 @@
+import os
+import uuid
+import base64
+import binascii
+import hashlib
+import aiofiles
+import aiofiles.os
+
+from email.utils import format_datetime
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import ClientDisconnect
+from typing import Dict, Optional
+from uuid import UUID
+
+from app.db.models import Object, ObjectUpload
+from app.repositories.file_repository import FileRepository
+from app.repositories.object_repository import ObjectRepository
+from app.repositories.upload_repository import UploadRepository
+from app.api.dependencies import get_db, get_current_object, get_current_object_row, get_primary_db
+from app.api.routes.utils import store_object_file
+from app.core.settings import settings
+from app.core.storage import get_storage
+
+router = APIRouter()
+
+
+# Докачиваемая загрузка по протоколу tus 1.0 (core + creation + expiration + termination)
+TUS_VERSION = "1.0.0"
+TUS_HEADERS = {"Tus-Resumable": TUS_VERSION}
+TUS_CONTENT_TYPE = "application/offset+octet-stream"
+
+# SQLSTATE lock_not_available: загрузку в этот момент пишет другой запрос
+LOCK_NOT_AVAILABLE = "55P03"
+
+
+def upload_part_path(upload_id: UUID) -> str:
+    return os.path.join(settings.STORAGE_DIR, "uploads", f"{upload_id}.part")
+
+
+def parse_upload_metadata(upload_metadata: Optional[str]) -> Dict[str, str]:
+    """Разбирает заголовок Upload-Metadata: пары `ключ base64(значение)` через запятую."""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in (upload_metadata or "").split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value, validate=True).decode("utf-8")
+        except (binascii.Error, UnicodeDecodeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid Upload-Metadata value for '{key}'")
+    return metadata
+
+
+def upload_headers(upload: ObjectUpload, offset: int) -> Dict[str, str]:
+    return {
+        **TUS_HEADERS,
+        "Upload-Offset": str(offset),
+        "Upload-Expires": format_datetime(upload.expires_at, usegmt=True),
+    }
+
+
+async def remove_file(path: str):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def receive_chunk(request: Request, path: str, limit: int) -> int:
+    """
+    Потоково записывает тело запроса во временный файл (не больше limit байт)
+    и возвращает число полученных байт. При обрыве соединения полученное сохраняется.
+    """
+    received = 0
+    async with aiofiles.open(path, "wb") as f:
+        try:
+            async for chunk in request.stream():
+                if received + len(chunk) > limit:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail="Chunk exceeds Upload-Length"
+                    )
+                await f.write(chunk)
+                received += len(chunk)
+        except ClientDisconnect:
+            # Клиент продолжит с того, что успел передать
+            pass
+    return received
+
+
+async def append_chunk(part_path: str, offset: int, chunk_path: str):
+    """Дописывает полученную часть в файл загрузки с сохранённого смещения."""
+    async with aiofiles.open(part_path, "r+b") as part, aiofiles.open(chunk_path, "rb") as chunk:
+        # Байты сверх сохранённого смещения (запись прервалась до фиксации) отбрасываются
+        await part.truncate(offset)
+        await part.seek(offset)
+        while data := await chunk.read(settings.UPLOAD_CHUNK_SIZE):
+            await part.write(data)
+
+
+async def part_checksum(path: str) -> str:
+    """Хеш-сумма (SHA256) собранного файла: состояние хеша между запросами не сохраняется."""
+    hash_sha256 = hashlib.sha256()
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(settings.UPLOAD_CHUNK_SIZE):
+            hash_sha256.update(chunk)
+    return hash_sha256.hexdigest()
+
+
+async def lock_current_upload(db: AsyncSession, object_id: UUID, upload_id: UUID) -> ObjectUpload:
+    try:
+        upload = await UploadRepository(db).lock_upload(object_id, upload_id)
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == LOCK_NOT_AVAILABLE:
+            raise HTTPException(status_code=status.HTTP_423_LOCKED, detail="Upload is being written by another request")
+        raise
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return upload
+
+
+async def finalize_upload(db: AsyncSession, current_object: Object, upload: ObjectUpload):
+    """Переносит собранный файл в хранилище объекта и удаляет загрузку (одной транзакцией)."""
+    part_path = upload_part_path(upload.id)
+    checksum = await part_checksum(part_path)
+
+    # Части загрузки лежат на локальном диске (STORAGE_DIR/uploads); в локальном хранилище
+    # файл переносится атомарно, без копирования, в S3 — загружается по частям
+    file_repository = FileRepository(db)
+    await store_object_file(
+        file_repository, current_object,
+        upload.file_name, upload.mime_type, part_path, checksum, upload.size,
+    )
+    await UploadRepository(db).delete_upload(upload)
+    await ObjectRepository(db).update_files(current_object)
+
+
+@router.post("/{object_id}/uploads", status_code=status.HTTP_201_CREATED)
+async def create_upload(
+    upload_length: int = Header(..., ge=0),
+    upload_metadata: Optional[str] = Header(None),
+    current_object: Object = Depends(get_current_object),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Создать докачиваемую загрузку файла объекта (tus creation).
+    Имя файла передаётся в Upload-Metadata (`filename`), тип — там же (`filetype`).
+    """
+    if upload_length > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {settings.MAX_UPLOAD_SIZE} bytes limit"
+        )
+
+    metadata = parse_upload_metadata(upload_metadata)
+    file_name = os.path.basename(metadata.get("filename", ""))
+    if not file_name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Upload-Metadata must contain filename")
+
+    upload = await UploadRepository(db).create_upload(
+        ObjectUpload(
+            object_id=current_object.id,
+            file_name=file_name,
+            mime_type=metadata.get("filetype"),
+            size=upload_length,
+        )
+    )
+
+    # Данные загрузки хранятся на диске, состояние — в базе: продолжить можно через любой воркер
+    part_path = upload_part_path(upload.id)
+    await aiofiles.os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    async with aiofiles.open(part_path, "wb"):
+        pass
+
+    if upload_length == 0:
+        upload = await lock_current_upload(db, current_object.id, upload.id)
+        await finalize_upload(db, current_object, upload)
+
+    return Response(
+        status_code=status.HTTP_201_CREATED,
+        headers={
+            **upload_headers(upload, upload.upload_offset),
+            "Location": f"{settings.API_URL}/objects/{current_object.id}/uploads/{upload.id}",
+        },
+    )
+
+
+@router.head("/{object_id}/uploads/{upload_id}")
+async def get_upload_offset(
+    upload_id: UUID,
+    current_object: Object = Depends(get_current_object_row),
+    db: AsyncSession = Depends(get_primary_db),
+):
+    """Текущее смещение загрузки: с него клиент продолжает после обрыва (читается с основной базы)."""
+    upload = await UploadRepository(db).get_upload(current_object.id, upload_id)
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+    return Response(
+        headers={
+            **upload_headers(upload, upload.upload_offset),
+            "Upload-Length": str(upload.size),
+            "Cache-Control": "no-store",
+        }
+    )
+
+
+@router.patch("/{object_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def patch_upload(
+    upload_id: UUID,
+    request: Request,
+    upload_offset: int = Header(..., ge=0),
+    content_type: Optional[str] = Header(None),
+    current_object: Object = Depends(get_current_object),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Дописать часть файла с указанного смещения (Upload-Offset должен совпадать с текущим).
+    Тело читается потоково без открытой транзакции. Когда получены все байты, файл
+    переносится в хранилище объекта.
+    """
+    if content_type != TUS_CONTENT_TYPE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be {TUS_CONTENT_TYPE}"
+        )
+
+    upload = await lock_current_upload(db, current_object.id, upload_id)
+    if upload_offset != upload.upload_offset:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Upload offset is {upload.upload_offset}")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and upload.upload_offset + int(content_length) > upload.size:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Chunk exceeds Upload-Length")
+
+    # Блокировка нужна только для проверки смещения: пока читается тело,
+    # транзакция и соединение с базой не удерживаются
+    await db.commit()
+
+    # Часть сначала принимается во временный файл: параллельный запрос с тем же смещением
+    # не испортит файл загрузки, в него попадёт только часть победившего запроса
+    upload_repository = UploadRepository(db)
+    chunk_path = os.path.join(get_storage().staging_dir(), f"{upload_id}.{uuid.uuid4()}.chunk")
+    try:
+        received = await receive_chunk(request, chunk_path, upload.size - upload_offset)
+        offset = upload_offset + received
+
+        if not await upload_repository.advance_offset(upload, offset):
+            current_upload = await upload_repository.get_upload(current_object.id, upload_id)
+            if not current_upload:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail=f"Upload offset is {current_upload.upload_offset}"
+            )
+
+        # Строка загрузки заблокирована обновлением до фиксации, файл дописывает один запрос
+        if received:
+            await append_chunk(upload_part_path(upload_id), upload_offset, chunk_path)
+    finally:
+        await remove_file(chunk_path)
+
+    if offset == upload.size:
+        await finalize_upload(db, current_object, upload)
+    else:
+        await db.commit()
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=upload_headers(upload, offset))
+
+
+@router.delete("/{object_id}/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_upload(
+    upload_id: UUID,
+    current_object: Object = Depends(get_current_object_row),
+    db: AsyncSession = Depends(get_db),
+):
+    """Отменить загрузку и удалить полученные части (tus termination)."""
+    upload = await lock_current_upload(db, current_object.id, upload_id)
+    await UploadRepository(db).delete_upload(upload)
+    await db.commit()
+
+    await remove_file(upload_part_path(upload_id))
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT, headers=TUS_HEADERS)
@@ -1,91 +1,120 @@
 import os
+import asyncio
+import posixpath
+import shutil
+import tempfile
+import logging
+import mimetypes
 import aiofiles
 import hashlib
+import multiprocessing
+import uuid
 
-from typing import List, Optional
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 from uuid import UUID
-from fastapi import UploadFile, HTTPException, status
+from fastapi import UploadFile, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse
+from sqlalchemy import Row
 
 from app.schemas.tree import TreeResponse
 from app.schemas.product import ProductResponse
-from app.schemas.filter import FilterModel
 from app.schemas.object import ObjectCoordinates, ObjectChainResponse, AllObjectChainResponse
-from app.db.models import Category, Product, Object
+from app.db.models import Object, Product
 from app.core.settings import settings
+from app.core.blobs import place_blob
+from app.core.images import VARIANT_FORMATS, image_key, render_image_variants, variant_key, variant_size
+from app.core.janitor import storage_janitor
+from app.core.storage import get_storage
+from app.db.session import after_commit
+from app.api.responses import storage_file_response
+from app.repositories.category_repository import CategoryRepository
+from app.repositories.file_repository import FileRepository
 from app.repositories.object_repository import ObjectRepository
+from app.repositories.product_repository import ProductRepository
 
 
-def map_all_category(category: Category) -> TreeResponse:
+logger = logging.getLogger(__name__)
 
-    products = [ProductResponse.model_validate(product.product) for product in category.products]
+# Пул процессов для генерации уменьшенных копий изображений (создаётся при первой загрузке)
+image_executor: Optional[ProcessPoolExecutor] = None
 
-    return TreeResponse(
-        id=category.id,
-        name=category.name,
-        objects=[map_all_category(child) for child in category.children] + products
-        )
-
-def apply_filters(products: List[Product], filters: FilterModel) -> List[Product]:
-    """
-    Применяет фильтры к продуктам.
-    """
-    def matches(product: Product) -> bool:
-        return all([
-            filters.name is None or (product.name and filters.name.lower() in product.name.lower()),
-            filters.description is None or (product.description and filters.description.lower() in product.description.lower()),
-            filters.image is None or (product.image and filters.image.lower() in product.image.lower()),
-            filters.country is None or (product.country and filters.country.lower() in product.country.lower())
-        ])
-
-    return [product for product in products if matches(product)]
+# Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора до завершения
+image_tasks = set()
 
 
-def map_category(category: Category, filters: Optional[FilterModel] = None) -> Optional[TreeResponse]:
-    """
-    Рекурсивно строит дерево категорий, исключая пустые категории.
+def build_category_trees(
+    root_ids: List[UUID],
+    categories: List[Row],
+    product_rows: List[Row],
+    skip_empty: bool = False,
+) -> List[TreeResponse]:
     """
-    # Применяем фильтры к продуктам
-    products = [assoc.product for assoc in category.products]
-    if filters:
-        products = apply_filters(products, filters)
+    Итеративно (без рекурсии) строит деревья категорий из плоских строк.
 
-    # Преобразуем продукты в ответную схему
-    products_response = [ProductResponse.model_validate(product) for product in products]
+    Каждый продукт валидируется один раз: если он привязан к нескольким категориям,
+    во все узлы попадает один и тот же экземпляр ProductResponse.
 
-    # Рекурсивно обрабатываем дочерние категории
-    children_response = [map_category(child, filters) for child in category.children]
-    # Удаляем пустые дочерние категории
-    children_response = [child for child in children_response if child is not None]
-
-    # Если у текущей категории нет ни продуктов, ни дочерних категорий — исключаем её
-    if not products_response and not children_response:
-        return None
-
-    return TreeResponse(
-        id=category.id,
-        name=category.name,
-        objects=children_response + products_response
-    )
-
-def collect_filtered_products(category: Category, filters: Optional[FilterModel] = None) -> List[ProductResponse]:
+    :param root_ids: ID корневых категорий (задают порядок деревьев).
+    :param categories: Плоский список (id, name, parent_id) категорий.
+    :param product_rows: Строки продуктов с полем category_id.
+    :param skip_empty: Исключать категории без продуктов во всём поддереве.
+    :return: Список деревьев.
     """
-    Рекурсивно собирает продукты из категории и ее дочерних категорий, применяя фильтры.
+    names = {}
+    children = defaultdict(list)
+    for category in categories:
+        names[category.id] = category.name
+        children[category.parent_id].append(category.id)
+
+    product_responses = {}
+    products = defaultdict(list)
+    for row in product_rows:
+        product = product_responses.get(row.id)
+        if product is None:
+            product = product_responses[row.id] = ProductResponse.model_validate(row)
+        products[row.category_id].append(product)
+
+    # Обход в глубину с явным стеком: узел собирается после всех своих потомков
+    built = {}
+    visited = set()
+    for root_id in root_ids:
+        if root_id not in names or root_id in visited:
+            continue
+        visited.add(root_id)
+        stack = [(root_id, False)]
+        while stack:
+            category_id, expanded = stack.pop()
+            if not expanded:
+                stack.append((category_id, True))
+                for child_id in reversed(children[category_id]):
+                    if child_id not in visited:
+                        visited.add(child_id)
+                        stack.append((child_id, False))
+                continue
+
+            objects = [built[child_id] for child_id in children[category_id] if built.get(child_id)]
+            objects.extend(products[category_id])
+            if skip_empty and not objects:
+                built[category_id] = None
+            else:
+                built[category_id] = TreeResponse(id=category_id, name=names[category_id], objects=objects)
+
+    return [built[root_id] for root_id in root_ids if built.get(root_id)]
+
+
+async def load_category_trees(db, root_ids: List[UUID]) -> List[TreeResponse]:
     """
-    # Получаем продукты из категории
-    products = [assoc.product for assoc in category.products]
-
-    # Применяем фильтры
-    if filters:
-        products = apply_filters(products, filters)
-
-    # Конвертируем продукты в ответную схему
-    products_response = [ProductResponse.model_validate(product) for product in products]
+    Загружает поддеревья категорий плоскими строками (двумя запросами) и собирает из них деревья.
 
-    # Рекурсивно обрабатываем дочерние категории
-    for child in category.children:
-        products_response.extend(collect_filtered_products(child, filters))
-
-    return products_response
+    :param db: Сессия базы данных.
+    :param root_ids: ID корневых категорий.
+    """
+    categories = await CategoryRepository(db).get_subtree_rows(root_ids)
+    product_rows = await ProductRepository(db).get_category_product_rows(root_ids)
+    return build_category_trees(root_ids, categories, product_rows)
 
 
 def map_objects(objects: List[Object], product_id: UUID) -> AllObjectChainResponse:
@@ -123,125 +152,340 @@ def map_objects(objects: List[Object], product_id: UUID) -> AllObjectChainRespon
 
     return mapped_objects
 
-async def file_checksum(file_path: str) -> str:
-    """Вычисляет хеш-сумму (SHA256) файла для проверки идентичности."""
-    hash_sha256 = hashlib.sha256()
-    async with aiofiles.open(file_path, "rb") as f:
-        while chunk := await f.read(8192):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
+async def stream_upload_to_temp(file: UploadFile, directory: str, max_size: int) -> Tuple[str, str, int]:
+    """
+    Потоково записывает загружаемый файл во временный файл в каталоге directory.
 
+    Файл читается частями по UPLOAD_CHUNK_SIZE, хеш-сумма считается по ходу записи,
+    поэтому в памяти никогда не держится больше одной части.
+    Временный файл затем публикуется в хранилище через StorageBackend.put.
 
-async def upload_file_checksum(file: UploadFile) -> str:
-    """Вычисляет хеш-сумму загружаемого файла без его сохранения на диск."""
+    :param file: Загруженный файл.
+    :param directory: Каталог назначения.
+    :param max_size: Максимальный размер файла в байтах.
+    :return: Путь к временному файлу, его хеш-сумма (SHA256) и размер.
+    """
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.tmp")
     hash_sha256 = hashlib.sha256()
-    chunk = await file.read()
-    hash_sha256.update(chunk)
-    await file.seek(0)  # Сбрасываем позицию файла после чтения
-    return hash_sha256.hexdigest()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as f:
+            while chunk := await file.read(settings.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File {file.filename} exceeds the {max_size} bytes limit"
+                    )
+                hash_sha256.update(chunk)
+                await f.write(chunk)
+    except HTTPException:
+        os.remove(temp_path)
+        raise
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error saving file: {str(e)}"
+        )
+
+    return temp_path, hash_sha256.hexdigest(), size
+
+
+async def store_object_file(
+    file_repository: FileRepository,
+    obj: Object,
+    file_name: str,
+    content_type: Optional[str],
+    temp_path: str,
+    checksum: str,
+    size: int,
+) -> Optional[str]:
+    """
+    Переносит полностью записанный временный файл в хранилище и добавляет его объекту.
+
+    Если файл с таким именем уже существует, к имени файла добавляется суффикс (1), (2) и т.д.
+    Имена сверяются с загруженными файлами объекта, без запросов к базе.
+    Транзакция не фиксируется.
+
+    :return: Имя сохранённого файла или None, если такой же файл уже есть.
+    """
+    existing_files = {object_file.name: object_file.sha256 for object_file in obj.files}
+
+    # Проверка: если файл с таким именем уже существует, генерируем новое имя
+    if file_name in existing_files:
+        if existing_files[file_name] == checksum:
+            # 🔴 Если файл уже есть и он идентичен - НЕ загружаем
+            os.remove(temp_path)
+            return None
+
+        name, ext = os.path.splitext(file_name)
+        counter = 1
+        new_filename = f"{name}({counter}){ext}"
+        while new_filename in existing_files:
+            counter += 1
+            new_filename = f"{name}({counter}){ext}"
+        file_name = new_filename  # обновляем имя файла
+
+    # Строка blobs заблокирована до конца транзакции, файл переносится под этой блокировкой
+    await file_repository.acquire_blob(checksum, size)
+    await place_blob(temp_path, checksum)
+    mime_type = (
+        content_type
+        or mimetypes.guess_type(file_name)[0]
+        or "application/octet-stream"
+    )
+    file_repository.add_object_file(obj, file_name, checksum, size, mime_type)
+    return file_name
+
 
-async def save_uploaded_files(object_id: int, files: List[UploadFile]) -> List[str]:
+async def save_uploaded_files(db, obj: Object, files: List[UploadFile]) -> List[str]:
     """
     Сохранение списка загруженных файлов в файловое хранилище объекта.
 
+    Содержимое хранится в общем хранилище по SHA256 (blobs/ab/cd/<sha256>), поэтому одинаковые
+    документы разных объектов лежат на диске один раз. Хеш-сумма считается при записи,
+    уже сохранённые файлы не перечитываются.
+
     Если файл с таким именем уже существует, к имени файла добавляется суффикс (1), (2) и т.д.
+    Транзакция не фиксируется.
     
-    :param object_id: ID объекта, к которому добавляются файлы.
+    :param db: Сессия базы данных.
+    :param obj: Объект, к которому добавляются файлы.
     :param files: Список загруженных файлов.
     :return: Список имён сохранённых файлов.
     """
-
-    # Создаем путь для хранения файлов
-    object_dir = os.path.join(settings.STORAGE_DIR, "objects", str(object_id), "files")
-    os.makedirs(object_dir, exist_ok=True)
+    file_repository = FileRepository(db)
 
     saved_files = []
     for file in files:
-        base_filename = file.filename
-        file_path = os.path.join(object_dir, base_filename)
-
-        # Проверка: если файл с таким именем уже существует, генерируем новое имя
-        if os.path.exists(file_path):
-            existing_checksum = await file_checksum(file_path)
-            new_file_checksum = await upload_file_checksum(file)
-
-            if existing_checksum == new_file_checksum:
-                # 🔴 Если файл уже есть и он идентичен - НЕ загружаем
-                continue  # Пропускаем загрузку и переходим к следующему файлу
-
-            name, ext = os.path.splitext(base_filename)
-            counter = 1
-            new_filename = f"{name}({counter}){ext}"
-            file_path = os.path.join(object_dir, new_filename)
-            while os.path.exists(file_path):
-                counter += 1
-                new_filename = f"{name}({counter}){ext}"
-                file_path = os.path.join(object_dir, new_filename)
-            base_filename = new_filename  # обновляем имя файла
+        # Сначала сохраняем во временный файл: хеш-сумма считается по ходу записи
+        temp_path, checksum, size = await stream_upload_to_temp(file, get_storage().staging_dir(), settings.MAX_UPLOAD_SIZE)
 
-        try:
-            async with aiofiles.open(file_path, "wb") as f:
-                # Читаем и записываем содержимое файла
-                await f.write(await file.read())
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-                detail=f"Error saving file: {str(e)}"
-            )
-        
-        saved_files.append(base_filename)
+        saved_file = await store_object_file(
+            file_repository, obj,
+            os.path.basename(file.filename), file.content_type, temp_path, checksum, size,
+        )
+        if saved_file:
+            saved_files.append(saved_file)
 
     return saved_files
 
 
 async def attach_files_to_object(db, object: Object, files: List[UploadFile]):
     """
-    Загружает файлы в хранилище объекта и обновляет информацию в базе данных.
+    Загружает файлы в хранилище объекта и добавляет их объекту.
+    Транзакция не фиксируется: изменения записываются вместе с остальными изменениями запроса.
     
     :param db: Сессия базы данных.
     :param object: Экземпляр объекта.
     :param files: Список загруженных файлов.
     """
     if files:
-        saved_files = await save_uploaded_files(object.id, files)
-        obj = await ObjectRepository(db).update_file_storage(object, saved_files)
-    
-    return obj
+        await save_uploaded_files(db, object, files)
+        ObjectRepository(db).touch_files(object)
+
 
+async def save_image(kind: str, entity_id: UUID, file: UploadFile) -> str:
+    """
+    Сохраняет загруженное изображение в хранилище (каталог версии по хеш-сумме)
+    и запускает генерацию уменьшенных копий.
 
-async def save_uploaded_image(object_id: int, file: UploadFile) -> str:
+    :return: Хеш-сумма (SHA256) сохраненного изображения.
+    """
+    storage = get_storage()
+    temp_path, checksum, _ = await stream_upload_to_temp(file, storage.staging_dir(), settings.MAX_IMAGE_SIZE)
+    key = image_key(kind, entity_id, checksum)
+    if await storage.stat(key):
+        # Эта версия уже загружена, копии для неё уже есть или генерируются
+        os.remove(temp_path)
+    else:
+        await storage.put(key, temp_path)
+        schedule_image_variants(key)
+    return checksum
+
+
+async def save_uploaded_image(object_id: UUID, file: UploadFile) -> str:
     """
     Сохраняет загруженное изображение для объекта.
 
     :param object_id: ID объекта, к которому добавляется изображение.
     :param file: Загруженный файл.
-    :return: Путь к сохраненному изображению.
+    :return: Хеш-сумма (SHA256) сохраненного изображения.
+    """
+    return await save_image("objects", object_id, file)
+
+
+async def save_product_image(product_id: UUID, file: UploadFile) -> str:
+    """
+    Сохраняет загруженное изображение для продукта.
+
+    :param product_id: ID продукта, к которому добавляется изображение.
+    :param file: Загруженный файл.
+    :return: Хеш-сумма (SHA256) сохраненного изображения.
+    """
+    return await save_image("products", product_id, file)
+
+
+def schedule_image_cleanup(kind: str, entity_id: UUID, image_sha256: Optional[str]):
+    """
+    Ставит версию изображения вместе с уменьшенными копиями в очередь на удаление.
+    Вызывается после того, как запись в базе перестала на неё ссылаться.
+    """
+    if image_sha256:
+        storage_janitor.schedule_delete(posixpath.dirname(image_key(kind, entity_id, image_sha256)) + "/")
+
+
+def image_version_redirect(request: Request, current_url: str) -> Response:
+    """Перенаправляет ссылку на старую версию изображения на текущую (с теми же параметрами)."""
+    url = f"{current_url}?{request.url.query}" if request.url.query else current_url
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers={"Cache-Control": "no-cache"})
+
+
+async def image_file_response(
+    request: Request,
+    kind: str,
+    entity_id: UUID,
+    image_sha256: str,
+    size: Optional[int],
+    cache_control: str = "no-cache",
+) -> Response:
+    """
+    Отдаёт изображение или его уменьшенную копию (WebP, если клиент его принимает).
+    Пока копии не готовы, отдаётся оригинал. ETag копии строится из хеш-суммы оригинала и имени копии.
     """
-    # Создаем путь для хранения изображения
-    object_dir = os.path.join(settings.STORAGE_DIR, "objects", str(object_id))
-    os.makedirs(object_dir, exist_ok=True)
-    file_path = os.path.join(object_dir, "image.jpg")
+    key = image_key(kind, entity_id, image_sha256)
+    if not await get_storage().stat(key):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image file not found")
+
+    media_type = "image/jpeg"
+    checksum = image_sha256
+    resized = variant_size(size)
+    if resized:
+        extension = "webp" if "image/webp" in request.headers.get("accept", "") else "jpg"
+        resized_key = variant_key(key, resized, extension)
+        if await get_storage().stat(resized_key):
+            key, media_type = resized_key, VARIANT_FORMATS[extension][1]
+            checksum = f"{image_sha256}-{posixpath.basename(resized_key)}"
+        else:
+            # Копия ещё генерируется: оригинал под этой ссылкой кэшируется ненадолго
+            cache_control = "no-cache"
+
+    return await storage_file_response(
+        key, checksum, media_type, headers={"Vary": "Accept", "Cache-Control": cache_control}
+    )
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    global image_executor
+    if image_executor is None:
+        # spawn: дочерние процессы не наследуют цикл событий и соединения с базой
+        image_executor = ProcessPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return image_executor
+
+
+def shutdown_image_executor():
+    global image_executor
+    if image_executor is not None:
+        image_executor.shutdown(wait=False, cancel_futures=True)
+        image_executor = None
+
 
+async def download_to_file(key: str, path: str):
+    async with aiofiles.open(path, "wb") as f:
+        async for chunk in get_storage().open(key):
+            await f.write(chunk)
+
+
+async def render_variants(key: str):
+    """
+    Генерирует уменьшенные копии изображения key в пуле процессов и публикует их в хранилище.
+    Если версию изображения удалили во время генерации, копии не публикуются.
+    """
+    storage = get_storage()
+    source_stat = await storage.stat(key)
+    if not source_stat:
+        return
+
+    work_dir = tempfile.mkdtemp(dir=storage.staging_dir())
     try:
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(await file.read())
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
-            detail=f"Error saving image: {str(e)}"
-            )
+        # Локальное хранилище читается напрямую, из остальных оригинал сначала скачивается
+        source_path = storage.local_path(key)
+        if source_path is None:
+            source_path = os.path.join(work_dir, "source")
+            await download_to_file(key, source_path)
+
+        names = await asyncio.get_running_loop().run_in_executor(
+            get_image_executor(), render_image_variants, str(source_path), work_dir
+        )
+
+        if await storage.stat(key) != source_stat:
+            return
+        for name in names:
+            await storage.put(posixpath.join(posixpath.dirname(key), name), os.path.join(work_dir, name))
+    finally:
+        await run_in_threadpool(shutil.rmtree, work_dir, True)
+
+
+def run_image_task(coroutine, description: str):
+    """Запускает фоновую задачу, не дожидаясь её; ошибки только логируются."""
+    async def run():
+        try:
+            await coroutine
+        except Exception:
+            logger.exception("Failed to %s", description)
 
-    return file_path
+    task = asyncio.create_task(run())
+    image_tasks.add(task)
+    task.add_done_callback(image_tasks.discard)
 
 
+def schedule_image_variants(key: str):
+    """
+    Запускает генерацию уменьшенных копий изображения, не дожидаясь её.
+    До готовности копий отдаётся оригинал.
+    """
+    run_image_task(render_variants(key), f"render image variants for {key}")
+
+
+async def release_blobs(db, hashes: List[str]):
+    """
+    Удаляет строки содержимого из hashes, на которое больше никто не ссылается.
+    Транзакция не фиксируется; сами файлы удаляются в фоне после фиксации.
+    """
+    released = await FileRepository(db).delete_unreferenced_blobs(hashes)
+    if released:
+        after_commit(db, lambda: storage_janitor.schedule_blob_delete(released))
+
 async def attach_image_to_object(db, object: Object, file: UploadFile):
     """
-    Загружает изображение и обновляет информацию об объекте в базе данных.
+    Загружает изображение и записывает ссылку на него в объект.
+    Транзакция не фиксируется; предыдущая версия изображения удаляется после фиксации.
 
     :param db: Сессия базы данных.
     :param object: Экземпляр объекта.
     :param file: Загруженный файл изображения.
     """
-    await save_uploaded_image(object.id, file)
-    obj = await ObjectRepository(db).update_image(object, True)
-    return obj
\ No newline at end of file
+    previous_sha256 = object.image_sha256
+    checksum = await save_uploaded_image(object.id, file)
+    ObjectRepository(db).set_image(object, True, checksum)
+    if previous_sha256 != checksum:
+        after_commit(db, lambda: schedule_image_cleanup("objects", object.id, previous_sha256))
+
+
+async def attach_image_to_product(db, product: Product, file: UploadFile):
+    """
+    Загружает изображение и записывает ссылку на него в продукт.
+    Транзакция не фиксируется; предыдущая версия изображения удаляется после фиксации.
+    """
+    previous_sha256 = product.image_sha256
+    checksum = await save_product_image(product.id, file)
+    ProductRepository(db).set_image(product, True, checksum)
+    if previous_sha256 != checksum:
+        after_commit(db, lambda: schedule_image_cleanup("products", product.id, previous_sha256))
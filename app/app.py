@@ -11,7 +11,15 @@ from app.api.routes.trees import router as tree_router
 from app.api.routes.objects import router as object_router
 from app.api.routes.products import router as product_router
 from app.api.routes.projects import router as project_router
+from app.api.routes.search import router as search_router
+from app.api.routes.uploads import router as upload_router
+from app.api.routes.internal import router as internal_router
+from app.api.routes.utils import shutdown_image_executor
 from app.core.settings import settings
+from app.core.janitor import storage_janitor
+from app.core.storage import close_storage
+from app.db.query_stats import QueryStatsMiddleware
+from app.db.replicas import ReadYourWritesMiddleware, replica_router
 
 
 def get_app() -> FastAPI:
@@ -20,7 +28,13 @@ def get_app() -> FastAPI:
     async def lifespan(app: FastAPI):
         # Создание директории, если она не существует
         os.makedirs(settings.STORAGE_DIR, exist_ok=True)
+        storage_janitor.start()
+        replica_router.start()
         yield
+        await replica_router.stop()
+        await storage_janitor.stop()
+        shutdown_image_executor()
+        await close_storage()
 
     app = FastAPI(
         title="Logistics App", 
@@ -29,14 +43,20 @@ def get_app() -> FastAPI:
 
     )
 
+    app.add_middleware(ReadYourWritesMiddleware)
+    app.add_middleware(QueryStatsMiddleware)
+
     # Include routers
     app.include_router(chain_router, prefix="/chains", tags=["Chains"])
     app.include_router(category_router, prefix="/categories", tags=["Categories"])
     app.include_router(tree_router, prefix="/tree", tags=["Trees"])
 
     app.include_router(object_router, prefix="/objects", tags=["Objects"])
+    app.include_router(upload_router, prefix="/objects", tags=["Uploads"])
     app.include_router(product_router, prefix="/products", tags=["Products"])
     app.include_router(project_router, prefix="/projects", tags=["Projects"])
+    app.include_router(search_router, prefix="/search", tags=["Search"])
+    app.include_router(internal_router, prefix="/internal", tags=["Internal"])
 
 
     return app
@@ -0,0 +1,26 @@
+import os
+
+from app.core.storage import get_storage
+
+
+def blob_key(sha256: str) -> str:
+    """Ключ содержимого файла в хранилище: blobs/ab/cd/<sha256>."""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+async def place_blob(temp_path: str, sha256: str) -> str:
+    """
+    Переносит временный файл в хранилище. Если такое содержимое уже лежит в хранилище,
+    временный файл просто удаляется.
+    """
+    storage = get_storage()
+    key = blob_key(sha256)
+    if await storage.stat(key):
+        os.remove(temp_path)
+    else:
+        await storage.put(key, temp_path)
+    return key
+
+
+async def remove_blob(sha256: str):
+    await get_storage().delete(blob_key(sha256))
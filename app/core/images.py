@@ -0,0 +1,89 @@
+import os
+import posixpath
+
+from typing import List, Optional
+from uuid import UUID
+from PIL import Image, ImageOps
+
+from app.core.settings import settings
+
+
+# Размеры (по большей стороне) уменьшенных копий изображений
+IMAGE_SIZES = (64, 256, 1024)
+
+# Расширение файла варианта → (формат Pillow, MIME-тип)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpg": ("JPEG", "image/jpeg"),
+}
+
+
+# Ссылки на изображения содержат версию (хеш-сумму), поэтому кэшируются без перепроверки
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def image_version(image_sha256: str) -> str:
+    """Версия изображения в ссылке: начало хеш-суммы содержимого."""
+    return image_sha256[:16]
+
+
+def image_key(kind: str, entity_id: UUID, image_sha256: str) -> str:
+    """
+    Ключ изображения в хранилище: objects|products/<id>/<sha256>/image.jpg.
+    Каждая версия лежит в своём каталоге вместе с уменьшенными копиями.
+    """
+    return f"{kind}/{entity_id}/{image_sha256}/image.jpg"
+
+
+def image_url(kind: str, entity_id: UUID, image_sha256: Optional[str]) -> str:
+    """Неизменяемая ссылка на версию изображения (без хеш-суммы — ссылка на текущее изображение)."""
+    url = f"{settings.API_URL}/{kind}/{entity_id}/image"
+    return f"{url}/{image_version(image_sha256)}" if image_sha256 else url
+
+
+def variant_name(size: int, extension: str) -> str:
+    return f"image_{size}.{extension}"
+
+
+def variant_key(image_key: str, size: int, extension: str) -> str:
+    """Ключ уменьшенной копии в хранилище: рядом с оригиналом."""
+    return posixpath.join(posixpath.dirname(image_key), variant_name(size, extension))
+
+
+def variant_keys(image_key: str) -> List[str]:
+    return [variant_key(image_key, size, extension) for size in IMAGE_SIZES for extension in VARIANT_FORMATS]
+
+
+def variant_size(size: Optional[int]) -> Optional[int]:
+    """Наименьший размер копии не меньше запрошенного (None — нужен оригинал)."""
+    if size:
+        for variant_size in IMAGE_SIZES:
+            if variant_size >= size:
+                return variant_size
+    return None
+
+
+def render_image_variants(image_path: str, output_dir: str) -> List[str]:
+    """
+    Генерирует уменьшенные копии изображения (JPEG и WebP для каждого размера из IMAGE_SIZES)
+    в каталог output_dir. Выполняется в пуле процессов.
+
+    :return: Имена созданных файлов.
+    """
+    names = []
+    with Image.open(image_path) as source:
+        source = ImageOps.exif_transpose(source)
+        has_alpha = source.mode in ("RGBA", "LA") or "transparency" in source.info
+        source = source.convert("RGBA" if has_alpha else "RGB")
+
+        for size in IMAGE_SIZES:
+            variant = source.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+            for extension, (image_format, _) in VARIANT_FORMATS.items():
+                name = variant_name(size, extension)
+                image = variant.convert("RGB") if image_format == "JPEG" else variant
+                image.save(os.path.join(output_dir, name), image_format, quality=85)
+                names.append(name)
+
+    return names
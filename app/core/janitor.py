@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+
+from dataclasses import asdict, dataclass
+from functools import partial
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+from uuid import UUID
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from app.core.blobs import blob_key, remove_blob
+from app.core.settings import settings
+from app.core.storage import get_storage
+from app.db.session import async_session
+from app.repositories.file_repository import FileRepository
+from app.repositories.object_repository import ObjectRepository
+from app.repositories.product_repository import ProductRepository
+from app.repositories.upload_repository import UploadRepository
+
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки сверки: в каждый момент её выполняет только один воркер
+RECONCILE_LOCK_KEY = 4_044_001
+
+# Сколько ждать опустошения очереди удаления при остановке приложения (секунды)
+SHUTDOWN_TIMEOUT = 10
+
+
+@dataclass
+class JanitorMetrics:
+    queued: int = 0             # Префиксов и файлов содержимого поставлено в очередь удаления
+    deleted: int = 0            # Префиксов и файлов содержимого удалено
+    failed: int = 0             # Ошибок удаления
+    reclaimed_bytes: int = 0    # Освобождено байт (очередь и сверка)
+    orphans_found: int = 0      # Брошенных каталогов и файлов найдено сверкой
+    reconcile_runs: int = 0
+    last_reconcile_at: Optional[float] = None
+    last_reconcile_seconds: Optional[float] = None
+
+
+def parse_uuids(names: Iterable[str]) -> List[UUID]:
+    ids = []
+    for name in names:
+        try:
+            ids.append(UUID(name))
+        except ValueError:
+            continue
+    return ids
+
+
+def remove_local(path: str) -> int:
+    """Удаляет локальный файл или каталог и возвращает освобождённый объём в байтах."""
+    if os.path.isdir(path):
+        size = sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path) for name in names
+        )
+        shutil.rmtree(path, ignore_errors=True)
+        return size
+    size = os.path.getsize(path)
+    os.remove(path)
+    return size
+
+
+class StorageJanitor:
+    """
+    Фоновая очистка хранилища.
+
+    Очередь удаления: запросы ставят в неё префиксы (каталог объекта, версию изображения)
+    и файлы содержимого, строки которых удалены, после фиксации транзакции и сразу отвечают,
+    файлы удаляет фоновый обработчик.
+
+    Сверка (раз в JANITOR_INTERVAL секунд): каталоги objects/<id> и products/<id> без строки
+    в базе (например, после каскадного удаления филиалов), содержимое без ссылок, просроченные
+    tus-загрузки, части загрузок без записи и забытые временные файлы. За один проход удаляется не больше JANITOR_BATCH_SIZE находок,
+    файлы моложе JANITOR_GRACE_PERIOD не трогаются: их запись в базе может быть ещё не зафиксирована.
+    """
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.metrics = JanitorMetrics()
+        self.worker: Optional[asyncio.Task] = None
+        self.reconciler: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.run_deletions())
+        if self.reconciler is None and settings.JANITOR_INTERVAL > 0:
+            self.reconciler = asyncio.create_task(self.run_reconciliation())
+
+    async def stop(self):
+        if self.reconciler is not None:
+            self.reconciler.cancel()
+            self.reconciler = None
+        if self.worker is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Оставшееся подберёт сверка после перезапуска
+                logger.warning("Storage janitor stopped with %d pending deletions", self.queue.qsize())
+            self.worker.cancel()
+            self.worker = None
+
+    def schedule_delete(self, prefix: str):
+        """Ставит префикс хранилища в очередь на удаление."""
+        self.queue.put_nowait(partial(self.delete_prefix, prefix))
+        self.metrics.queued += 1
+
+    def schedule_blob_delete(self, hashes: Iterable[str]):
+        """Ставит в очередь файлы содержимого, строки blobs которых удалены зафиксированной транзакцией."""
+        for sha256 in hashes:
+            self.queue.put_nowait(partial(self.delete_blob, sha256))
+            self.metrics.queued += 1
+
+    def metrics_snapshot(self) -> dict:
+        return {**asdict(self.metrics), "queue_size": self.queue.qsize()}
+
+    async def run_deletions(self):
+        while True:
+            deletion = await self.queue.get()
+            try:
+                await deletion()
+            except Exception:
+                self.metrics.failed += 1
+                logger.exception("Failed storage deletion %s", deletion.args)
+            finally:
+                self.queue.task_done()
+
+    async def delete_prefix(self, prefix: str):
+        storage = get_storage()
+        usage = await storage.usage(prefix)
+        await storage.delete_prefix(prefix)
+        self.metrics.deleted += 1
+        self.metrics.reclaimed_bytes += usage.size if usage else 0
+
+    async def delete_blob(self, sha256: str):
+        """
+        Удаляет файл содержимого, если его не успели загрузить снова. Временная строка blobs
+        держится до конца удаления, чтобы параллельная загрузка не сослалась на удаляемый файл.
+        """
+        async with async_session() as db:
+            repository = FileRepository(db)
+            if not await repository.claim_blob_removal(sha256):
+                return
+            stat = await get_storage().stat(blob_key(sha256))
+            await remove_blob(sha256)
+            await repository.delete_blob(sha256)
+            await db.commit()
+        self.metrics.deleted += 1
+        self.metrics.reclaimed_bytes += stat.size if stat else 0
+
+    async def run_reconciliation(self):
+        while True:
+            await asyncio.sleep(settings.JANITOR_INTERVAL)
+            try:
+                await self.reconcile()
+            except Exception:
+                logger.exception("Storage reconciliation failed")
+
+    async def reconcile(self) -> int:
+        """
+        Один проход сверки хранилища с базой.
+
+        :return: Число найденных брошенных каталогов и файлов (0, если сверку выполняет другой воркер).
+        """
+        started = time.monotonic()
+        async with async_session() as db:
+            # Блокировка держится до конца транзакции, то есть до конца прохода
+            locked = await db.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RECONCILE_LOCK_KEY})
+            if not locked:
+                return 0
+
+            budget = settings.JANITOR_BATCH_SIZE
+            found = await self.reconcile_entities("objects", ObjectRepository(db).get_existing_object_ids, budget)
+            found += await self.reconcile_entities(
+                "products", ProductRepository(db).get_existing_product_ids, budget - found
+            )
+            hashes = await FileRepository(db).take_unreferenced_blobs(max(budget - found, 0))
+            found += len(hashes)
+            expired_uploads = await UploadRepository(db).delete_expired_uploads(max(budget - found, 0))
+            found += len(expired_uploads)
+            found += await self.reconcile_upload_parts(UploadRepository(db), budget - found)
+            found += await self.reconcile_staging(budget - found)
+            await db.commit()
+        # Строки удалены зафиксированной транзакцией, теперь можно удалять файлы
+        self.schedule_blob_delete(hashes)
+        await self.remove_upload_parts(expired_uploads)
+
+        self.metrics.orphans_found += found
+        self.metrics.reconcile_runs += 1
+        self.metrics.last_reconcile_at = time.time()
+        self.metrics.last_reconcile_seconds = time.monotonic() - started
+        logger.info(
+            "Storage reconciliation: %d orphans, %d bytes reclaimed in total",
+            found, self.metrics.reclaimed_bytes,
+        )
+        return found
+
+    async def reconcile_entities(
+        self,
+        kind: str,
+        get_existing_ids: Callable[[List[UUID]], Awaitable[Set[UUID]]],
+        budget: int,
+    ) -> int:
+        """Ставит в очередь каталоги kind/<id>, для которых нет строки в базе."""
+        storage = get_storage()
+        ids = parse_uuids(await storage.list_dirs(f"{kind}/"))
+        found = 0
+        for start in range(0, len(ids), settings.JANITOR_BATCH_SIZE):
+            if found >= budget:
+                break
+            batch = ids[start:start + settings.JANITOR_BATCH_SIZE]
+            existing = await get_existing_ids(batch)
+            for entity_id in batch:
+                if found >= budget:
+                    break
+                if entity_id in existing:
+                    continue
+                prefix = f"{kind}/{entity_id}/"
+                usage = await storage.usage(prefix)
+                if usage and time.time() - usage.modified < settings.JANITOR_GRACE_PERIOD:
+                    continue
+                self.schedule_delete(prefix)
+                found += 1
+        return found
+
+    async def reconcile_upload_parts(self, upload_repository: UploadRepository, budget: int) -> int:
+        """Удаляет части tus-загрузок, запись о которых удалена (например, вместе с объектом)."""
+        uploads_dir = os.path.join(settings.STORAGE_DIR, "uploads")
+        names = await run_in_threadpool(lambda: os.listdir(uploads_dir) if os.path.isdir(uploads_dir) else [])
+        ids = parse_uuids(name.removesuffix(".part") for name in names if name.endswith(".part"))
+        found = 0
+        for start in range(0, len(ids), settings.JANITOR_BATCH_SIZE):
+            batch = ids[start:start + settings.JANITOR_BATCH_SIZE]
+            existing = await upload_repository.get_existing_upload_ids(batch)
+            paths = [os.path.join(uploads_dir, f"{upload_id}.part") for upload_id in batch if upload_id not in existing]
+            found += await self.remove_stale_local(paths, budget - found)
+        return found
+
+    async def remove_upload_parts(self, upload_ids: List[UUID]):
+        """Удаляет части загрузок, записи о которых удалены."""
+        for upload_id in upload_ids:
+            path = os.path.join(settings.STORAGE_DIR, "uploads", f"{upload_id}.part")
+            try:
+                self.metrics.reclaimed_bytes += await run_in_threadpool(remove_local, path)
+            except FileNotFoundError:
+                continue
+
+    async def reconcile_staging(self, budget: int) -> int:
+        """Удаляет временные файлы, оставшиеся после прерванных загрузок и генерации копий."""
+        staging_dir = str(get_storage().staging_dir())
+        names = await run_in_threadpool(os.listdir, staging_dir)
+        return await self.remove_stale_local([os.path.join(staging_dir, name) for name in names], budget)
+
+    async def remove_stale_local(self, paths: List[str], budget: int) -> int:
+        found = 0
+        for path in paths:
+            if found >= budget:
+                break
+            try:
+                modified = await run_in_threadpool(os.path.getmtime, path)
+                if time.time() - modified < settings.JANITOR_GRACE_PERIOD:
+                    continue
+                self.metrics.reclaimed_bytes += await run_in_threadpool(remove_local, path)
+            except FileNotFoundError:
+                continue
+            found += 1
+        return found
+
+
+storage_janitor = StorageJanitor()
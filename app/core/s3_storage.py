@@ -0,0 +1,162 @@
+import os
+
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, List, Optional
+from urllib.parse import quote
+from aiobotocore.config import AioConfig
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.settings import settings
+from app.core.storage import StorageBackend, StorageStat
+
+
+# Минимальный размер части multipart upload в S3 — 5 МБ (кроме последней)
+S3_PART_SIZE = 8 * 1024 * 1024
+
+# Максимум ключей в одном запросе DeleteObjects
+S3_DELETE_BATCH = 1000
+
+
+class S3Storage(StorageBackend):
+    """
+    S3-совместимое хранилище (AWS S3, MinIO).
+
+    Клиент создаётся один раз на процесс и держит пул соединений (S3_MAX_POOL_CONNECTIONS).
+    Большие файлы загружаются по частям (multipart upload), файлы отдаются клиентам
+    по временным ссылкам (presigned URL) — Range и ETag обрабатывает само хранилище.
+    """
+
+    def __init__(self):
+        self.bucket = settings.S3_BUCKET
+        self.exit_stack = AsyncExitStack()
+        self.client = None
+
+    async def get_client(self):
+        if self.client is None:
+            session = get_session()
+            self.client = await self.exit_stack.enter_async_context(
+                session.create_client(
+                    "s3",
+                    endpoint_url=settings.S3_ENDPOINT_URL,
+                    region_name=settings.S3_REGION,
+                    aws_access_key_id=settings.S3_ACCESS_KEY,
+                    aws_secret_access_key=settings.S3_SECRET_KEY,
+                    config=AioConfig(
+                        max_pool_connections=settings.S3_MAX_POOL_CONNECTIONS,
+                        s3={"addressing_style": "path"},
+                    ),
+                )
+            )
+        return self.client
+
+    async def put(self, key: str, source_path: str) -> None:
+        client = await self.get_client()
+        size = os.path.getsize(source_path)
+        try:
+            with open(source_path, "rb") as f:
+                if size <= S3_PART_SIZE:
+                    body = await run_in_threadpool(f.read)
+                    await client.put_object(Bucket=self.bucket, Key=key, Body=body)
+                else:
+                    await self.put_multipart(client, key, f)
+        finally:
+            os.remove(source_path)
+
+    async def put_multipart(self, client, key: str, f) -> None:
+        upload = await client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        upload_id = upload["UploadId"]
+        parts = []
+        try:
+            while chunk := await run_in_threadpool(f.read, S3_PART_SIZE):
+                part_number = len(parts) + 1
+                response = await client.upload_part(
+                    Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=chunk
+                )
+                parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+            await client.complete_multipart_upload(
+                Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+            )
+        except BaseException:
+            await client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+    async def open(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        client = await self.get_client()
+        params = {"Bucket": self.bucket, "Key": key}
+        if start or end is not None:
+            params["Range"] = f"bytes={start}-{'' if end is None else end - 1}"
+        response = await client.get_object(**params)
+        async with response["Body"] as body:
+            async for chunk in body.iter_chunks(settings.UPLOAD_CHUNK_SIZE):
+                yield chunk
+
+    async def delete(self, key: str) -> None:
+        client = await self.get_client()
+        await client.delete_object(Bucket=self.bucket, Key=key)
+
+    async def list(self, prefix: str) -> List[str]:
+        client = await self.get_client()
+        keys = []
+        async for page in client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    async def list_dirs(self, prefix: str) -> List[str]:
+        client = await self.get_client()
+        names = []
+        paginator = client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            names.extend(item["Prefix"][len(prefix):].rstrip("/") for item in page.get("CommonPrefixes", []))
+        return names
+
+    async def usage(self, prefix: str) -> Optional[StorageStat]:
+        client = await self.get_client()
+        size, modified, found = 0, 0.0, False
+        async for page in client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+            for item in page.get("Contents", []):
+                size, modified, found = size + item["Size"], max(modified, item["LastModified"].timestamp()), True
+        return StorageStat(size=size, modified=modified) if found else None
+
+    async def delete_prefix(self, prefix: str) -> None:
+        client = await self.get_client()
+        keys = await self.list(prefix)
+        for start in range(0, len(keys), S3_DELETE_BATCH):
+            batch = keys[start:start + S3_DELETE_BATCH]
+            await client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True}
+            )
+
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        client = await self.get_client()
+        try:
+            response = await client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return StorageStat(size=response["ContentLength"], modified=response["LastModified"].timestamp())
+
+    async def url(
+        self,
+        key: str,
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None,
+        cache_control: Optional[str] = None,
+    ) -> str:
+        client = await self.get_client()
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = f"attachment; filename*=utf-8''{quote(filename)}"
+        if media_type:
+            params["ResponseContentType"] = media_type
+        if cache_control:
+            params["ResponseCacheControl"] = cache_control
+        return await client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=settings.S3_URL_EXPIRES
+        )
+
+    async def close(self) -> None:
+        await self.exit_stack.aclose()
+        self.client = None
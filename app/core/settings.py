@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,11 +11,65 @@ class Settings(BaseSettings):
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
 
+    # Пул соединений: постоянные соединения, сверх них (overflow), ожидание свободного (секунды)
+    # и пересоздание старых соединений (секунды)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Кэш подготовленных запросов на соединение (0 — выключен) и statement_timeout (мс, 0 — без ограничения)
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    DB_STATEMENT_TIMEOUT: int = 30000
+
+    # Учёт запросов к базе на каждый HTTP-запрос (Server-Timing, гистограммы по маршрутам).
+    # Больше DB_QUERY_BUDGET запросов или один запрос больше DB_QUERY_REPEAT_LIMIT раз (N+1) —
+    # предупреждение в лог; в строгом режиме (для тестов) — ответ 500
+    DB_QUERY_BUDGET: int = 20
+    DB_QUERY_REPEAT_LIMIT: int = 5
+    DB_QUERY_STRICT: bool = False
+
+    # Реплики для чтения: хосты через запятую (host или host:port), учётные данные как у основной базы.
+    # Реплика, отстающая больше REPLICA_MAX_LAG секунд, исключается до следующей проверки.
+    # Окно read-your-writes должно быть не меньше REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+    POSTGRES_REPLICA_HOSTS: str = ""
+    REPLICA_MAX_LAG: float = 5
+    REPLICA_CHECK_INTERVAL: float = 5
+    REPLICA_READ_YOUR_WRITES_WINDOW: int = 10
+
     # Общие настройки приложения
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
     DEBUG: bool
     STORAGE_DIR: Path
+    IMAGE_WORKERS: int = 2
+
+    # Настройки загрузки файлов (размеры в байтах)
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024
+    MAX_UPLOAD_SIZE: int = 2 * 1024 ** 3
+    MAX_IMAGE_SIZE: int = 20 * 1024 ** 2
+    # Срок жизни незавершённой докачиваемой загрузки с последней записанной части (секунды)
+    UPLOAD_EXPIRES: int = 24 * 3600
+
+    # Хранилище файлов: local (каталог STORAGE_DIR) или s3 (S3-совместимое, например MinIO)
+    STORAGE_BACKEND: str = "local"
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    S3_BUCKET: Optional[str] = None
+    S3_ACCESS_KEY: Optional[str] = None
+    S3_SECRET_KEY: Optional[str] = None
+    S3_MAX_POOL_CONNECTIONS: int = 50
+    S3_URL_EXPIRES: int = 3600
+
+    # Фоновая очистка хранилища: период сверки с базой (секунды, 0 — выключена),
+    # размер пачки и возраст, после которого файлы без записи в базе считаются брошенными
+    JANITOR_INTERVAL: int = 3600
+    JANITOR_BATCH_SIZE: int = 500
+    JANITOR_GRACE_PERIOD: int = 3600
+
+    # Внутренний location nginx над STORAGE_DIR (например, /protected-storage/).
+    # Если задан, локальные файлы отдаёт nginx по заголовку X-Accel-Redirect, а не uvicorn
+    ACCEL_REDIRECT_LOCATION: Optional[str] = None
 
     API_URL: str
 
@@ -25,6 +80,16 @@ class Settings(BaseSettings):
             f"@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
         )
     @property
+    def ASYNC_REPLICA_DATABASE_URLS(self) -> List[str]:
+        urls = []
+        for replica in filter(None, (item.strip() for item in self.POSTGRES_REPLICA_HOSTS.split(","))):
+            host, _, port = replica.partition(":")
+            urls.append(
+                f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
+                f"@{host}:{port or self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+            )
+        return urls
+    @property
     def SYNC_DATABASE_URL(self) -> str:
         return (
             f"postgresql+psycopg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"
@@ -0,0 +1,199 @@
+import os
+import shutil
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, List, Optional
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.settings import settings
+
+
+@dataclass
+class StorageStat:
+    size: int
+    modified: float  # Время изменения (unix timestamp)
+
+
+class StorageBackend(ABC):
+    """
+    Хранилище файлов по ключам вида `objects/<id>/image.jpg` или `blobs/ab/cd/<sha256>`.
+
+    Файл сначала полностью записывается во временный локальный файл (в staging_dir),
+    и только затем передаётся в хранилище через put(): так хеш-сумма и лимиты проверяются
+    до публикации, а читатели никогда не видят недописанный файл.
+    """
+
+    def staging_dir(self) -> Path:
+        """Локальный каталог для временных файлов."""
+        path = settings.STORAGE_DIR / "tmp"
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @abstractmethod
+    async def put(self, key: str, source_path: str) -> None:
+        """Публикует локальный временный файл под ключом key (файл source_path забирается)."""
+
+    @abstractmethod
+    def open(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Потоково читает файл (или диапазон байт [start, end)) частями."""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Удаляет файл; отсутствующий файл не считается ошибкой."""
+
+    @abstractmethod
+    async def list(self, prefix: str) -> List[str]:
+        """Ключи всех файлов с указанным префиксом."""
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        """Размер и время изменения файла или None, если его нет."""
+
+    @abstractmethod
+    async def list_dirs(self, prefix: str) -> List[str]:
+        """Имена «каталогов» непосредственно под префиксом prefix (оканчивается на /)."""
+
+    async def usage(self, prefix: str) -> Optional[StorageStat]:
+        """Суммарный размер файлов под префиксом и время изменения самого нового (None — файлов нет)."""
+        size, modified, found = 0, 0.0, False
+        for key in await self.list(prefix):
+            stat = await self.stat(key)
+            if stat:
+                size, modified, found = size + stat.size, max(modified, stat.modified), True
+        return StorageStat(size=size, modified=modified) if found else None
+
+    def local_path(self, key: str) -> Optional[Path]:
+        """Путь к файлу на локальном диске, если хранилище локальное (для FileResponse)."""
+        return None
+
+    async def url(
+        self,
+        key: str,
+        filename: Optional[str] = None,
+        media_type: Optional[str] = None,
+        cache_control: Optional[str] = None,
+    ) -> Optional[str]:
+        """Временная прямая ссылка на файл, если хранилище умеет отдавать файлы само."""
+        return None
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in await self.list(prefix):
+            await self.delete(key)
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Хранилище в локальном каталоге. Блокирующие вызовы выполняются в пуле потоков."""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    async def put(self, key: str, source_path: str) -> None:
+        path = self.local_path(key)
+
+        def move():
+            os.makedirs(path.parent, exist_ok=True)
+            # Временные файлы лежат в STORAGE_DIR/tmp: на одном диске перенос атомарный
+            shutil.move(source_path, path)
+
+        await run_in_threadpool(move)
+
+    async def open(self, key: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        f = await run_in_threadpool(open, self.local_path(key), "rb")
+        try:
+            await run_in_threadpool(f.seek, start)
+            position = start
+            while end is None or position < end:
+                size = settings.UPLOAD_CHUNK_SIZE if end is None else min(settings.UPLOAD_CHUNK_SIZE, end - position)
+                chunk = await run_in_threadpool(f.read, size)
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+        finally:
+            await run_in_threadpool(f.close)
+
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(self.local_path(key).unlink, True)
+
+    async def list(self, prefix: str) -> List[str]:
+        def walk():
+            base = self.local_path(prefix)
+            directory = base if prefix.endswith("/") else base.parent
+            if not directory.is_dir():
+                return []
+            keys = []
+            for path in directory.rglob("*"):
+                key = path.relative_to(self.root).as_posix()
+                if path.is_file() and key.startswith(prefix):
+                    keys.append(key)
+            return sorted(keys)
+
+        return await run_in_threadpool(walk)
+
+    async def stat(self, key: str) -> Optional[StorageStat]:
+        try:
+            stat_result = await run_in_threadpool(os.stat, self.local_path(key))
+        except FileNotFoundError:
+            return None
+        return StorageStat(size=stat_result.st_size, modified=stat_result.st_mtime)
+
+    async def list_dirs(self, prefix: str) -> List[str]:
+        def scan():
+            directory = self.local_path(prefix)
+            if not directory.is_dir():
+                return []
+            return sorted(entry.name for entry in os.scandir(directory) if entry.is_dir())
+
+        return await run_in_threadpool(scan)
+
+    async def usage(self, prefix: str) -> Optional[StorageStat]:
+        def walk():
+            size, modified, found = 0, 0.0, False
+            for root, _, names in os.walk(self.local_path(prefix)):
+                for name in names:
+                    try:
+                        stat_result = os.stat(os.path.join(root, name))
+                    except FileNotFoundError:
+                        continue
+                    size, modified, found = size + stat_result.st_size, max(modified, stat_result.st_mtime), True
+            return StorageStat(size=size, modified=modified) if found else None
+
+        if not prefix.endswith("/"):
+            return await super().usage(prefix)
+        return await run_in_threadpool(walk)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        # Каталог удаляется целиком (вместе с пустыми подкаталогами) в пуле потоков
+        if not prefix.endswith("/"):
+            return await super().delete_prefix(prefix)
+        await run_in_threadpool(shutil.rmtree, self.local_path(prefix), True)
+
+
+storage_backend: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """Хранилище файлов приложения (выбирается настройкой STORAGE_BACKEND)."""
+    global storage_backend
+    if storage_backend is None:
+        if settings.STORAGE_BACKEND == "s3":
+            from app.core.s3_storage import S3Storage
+            storage_backend = S3Storage()
+        else:
+            storage_backend = LocalStorage(settings.STORAGE_DIR)
+    return storage_backend
+
+
+async def close_storage():
+    global storage_backend
+    if storage_backend is not None:
+        await storage_backend.close()
+        storage_backend = None
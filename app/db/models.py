@@ -1,14 +1,35 @@
 import uuid
 from typing import List, Optional
-from sqlalchemy import ForeignKey, String
+from datetime import datetime
+from sqlalchemy import BigInteger, Computed, DateTime, FetchedValue, ForeignKey, Index, String, UniqueConstraint, func
 from sqlalchemy.orm import DeclarativeBase, mapped_column, Mapped, relationship
-from sqlalchemy.dialects.postgresql import UUID, ARRAY
+from sqlalchemy.dialects.postgresql import UUID, ARRAY, TSVECTOR
 
+# Связи не загружаются неявно (lazy="raise"): каждый метод репозитория сам указывает
+# профиль загрузки — только те связи, которые нужны ответу. Обращение к незагруженной
+# связи сразу даёт ошибку вместо скрытого запроса (или декартова произведения JOIN).
+# Каскадные операции сессии (удаление, обнуление внешних ключей) загружают связи сами.
 class Base(DeclarativeBase):
     pass
 
+
+def search_vector_expression(*weighted_columns: tuple[str, str]) -> str:
+    """
+    SQL-выражение для генерируемой колонки полнотекстового поиска:
+    конкатенация взвешенных tsvector по указанным колонкам.
+    """
+    return " || ".join(
+        f"setweight(to_tsvector('simple', coalesce({column}, '')), '{weight}')"
+        for column, weight in weighted_columns
+    )
+
 class ProductCategoryAssociation(Base):
     __tablename__ = "product_category_association"
+    __table_args__ = (
+        # Индекс уникальности используется и для выборки привязок продукта
+        UniqueConstraint("product_id", "category_id", name="uq_product_category_association_product_id_category_id"),
+        Index("ix_product_category_association_category_id", "category_id"),
+    )
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     
     product_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("products.id"))
@@ -17,17 +38,21 @@ class ProductCategoryAssociation(Base):
     product: Mapped["Product"] = relationship(
         "Product", 
         back_populates="categories",
-        lazy="joined"
+        lazy="raise"
     )
     
     category: Mapped["Category"] = relationship(
         "Category", 
         back_populates="products",
-        lazy="joined"
+        lazy="raise"
     )
 
 class ProjectCategoryAssociation(Base):
     __tablename__ = "project_category_association"
+    __table_args__ = (
+        Index("ix_project_category_association_project_id", "project_id"),
+        Index("ix_project_category_association_category_id", "category_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
 
@@ -38,41 +63,53 @@ class ProjectCategoryAssociation(Base):
     project: Mapped["Project"] = relationship(
         "Project", 
         back_populates="categories", 
-        lazy="joined"
+        lazy="raise"
     )
 
     # Связь с Category
     category: Mapped["Category"] = relationship(
         "Category", 
         back_populates="projects", 
-        lazy="joined"
+        lazy="raise"
     )
 
 
 class Chain(Base):
     __tablename__ = "chains"
+    __table_args__ = (
+        Index("ix_chains_product_id", "product_id"),
+        Index("ix_chains_source_object_id", "source_object_id"),
+        Index("ix_chains_target_object_id", "target_object_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     
-    source_object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id"))
-    target_object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id"))
+    # Цепочки удаляются вместе с объектом (ON DELETE CASCADE)
+    source_object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id", ondelete="CASCADE"))
+    target_object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id", ondelete="CASCADE"))
 
     product_id: Mapped[Optional[uuid.UUID]] = mapped_column(ForeignKey("products.id"))
 
     source_object: Mapped["Object"] = relationship(
-        "Object", back_populates="chains_source", foreign_keys=[source_object_id]
+        "Object", back_populates="chains_source", foreign_keys=[source_object_id], lazy="raise"
     )
 
     target_object: Mapped["Object"] = relationship(
-        "Object", back_populates="chains_target", foreign_keys=[target_object_id], lazy='joined'
+        "Object", back_populates="chains_target", foreign_keys=[target_object_id], lazy="raise"
     )
 
     product: Mapped["Product"] = relationship(
-        "Product", back_populates="chains", foreign_keys=[product_id]
+        "Product", back_populates="chains", foreign_keys=[product_id], lazy="raise"
     )
 
 class Object(Base):
     __tablename__ = "objects"
+    __table_args__ = (
+        Index("ix_objects_search_vector", "search_vector", postgresql_using="gin"),
+        # Объекты проекта и поиск в квадрате координат внутри проекта
+        Index("ix_objects_project_id_x_y", "project_id", "x", "y"),
+        Index("ix_objects_parent_id", "parent_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     x: Mapped[float] = mapped_column(nullable=False)
@@ -84,13 +121,24 @@ class Object(Base):
     links: Mapped[Optional[List[str]]] = mapped_column(ARRAY(String), nullable=True) 
     icon: Mapped[Optional[str]] = mapped_column(nullable=True)
     image: Mapped[Optional[str]] = mapped_column(nullable=True)
-    file_storage: Mapped[Optional[List[str]]] = mapped_column(ARRAY(String), nullable=True)
+    # SHA256 исходного изображения (строгий ETag)
+    image_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
     description: Mapped[Optional[str]] = mapped_column(nullable=True)
     project_id: Mapped[Optional[uuid.UUID]] = mapped_column(ForeignKey("projects.id"), nullable=True)
 
-    # Продукты, производимые объектом
+    # Полнотекстовый индекс, поддерживается базой данных
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(search_vector_expression(("name", "A"), ("description", "B"), ("ownership", "C")), persisted=True),
+        deferred=True
+    )
+
+    # Версия строки (используется для ETag), увеличивается триггером базы данных при каждом UPDATE
+    version: Mapped[int] = mapped_column(nullable=False, server_default="1", server_onupdate=FetchedValue())
+
+    # Продукты, производимые объектом. При удалении объекта база обнуляет ссылку (ON DELETE SET NULL)
     products: Mapped[List["Product"]] = relationship(
-        "Product", back_populates="object"
+        "Product", back_populates="object", lazy="raise", passive_deletes=True
     )
 
     # Цепочки, где объект источник
@@ -98,9 +146,9 @@ class Object(Base):
         "Chain", 
         back_populates="source_object", 
         foreign_keys="[Chain.source_object_id]",
-        lazy='joined',
-        cascade="all, delete-orphan"
-
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
     # Цепочки, где объект потребитель
@@ -108,122 +156,243 @@ class Object(Base):
         "Chain", 
         back_populates="target_object", 
         foreign_keys="[Chain.target_object_id]",
-        lazy='joined',
-        cascade="all, delete-orphan"
+        lazy="raise",
+        cascade="all, delete-orphan",
+        passive_deletes=True
     )
 
-    # Самореферентное отношение для филиалов (дочерних объектов)
+    # Самореферентное отношение для филиалов (дочерних объектов).
+    # Филиалы удаляются базой вместе с родителем (ON DELETE CASCADE), ORM их не загружает
     parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(
         UUID(as_uuid=True), 
-        ForeignKey("objects.id"), 
+        ForeignKey("objects.id", ondelete="CASCADE"), 
         nullable=True
     )
 
     parent: Mapped[Optional["Object"]] = relationship(
         "Object", 
         remote_side=[id], 
-        back_populates="branches"
+        back_populates="branches",
+        lazy="raise"
     )
 
     branches: Mapped[Optional[List["Object"]]] = relationship(
         "Object", 
         back_populates="parent",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        lazy="raise",
+        passive_deletes=True
     )
     project: Mapped["Project"] = relationship(
         "Project",
         back_populates="objects",
-        lazy="joined"
+        lazy="raise"
+    )
+
+    # Файлы объекта (метаданные), загружаются selectinload одним запросом на все объекты выборки.
+    # Строки удаляются вместе с объектом внешним ключом ON DELETE CASCADE, ORM их не трогает
+    files: Mapped[List["ObjectFile"]] = relationship(
+        "ObjectFile",
+        order_by="(ObjectFile.created_at, ObjectFile.name)",
+        lazy="raise",
+        passive_deletes="all"
+    )
+
+    @property
+    def file_storage(self) -> List[str]:
+        """Имена файлов объекта."""
+        return [object_file.name for object_file in self.files]
+
+
+class Blob(Base):
+    """Содержимое файла в адресуемом по SHA256 хранилище (STORAGE_DIR/blobs)."""
+    __tablename__ = "blobs"
+    __table_args__ = (
+        Index("ix_blobs_unreferenced", "sha256", postgresql_where="ref_count = 0"),
+    )
+
+    sha256: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    # Число ссылок из object_files, поддерживается триггером базы данных
+    ref_count: Mapped[int] = mapped_column(nullable=False, server_default="0")
+
+
+class ObjectFile(Base):
+    """
+    Файл объекта: имя и метаданные файла и ссылка на его содержимое.
+    Индекс уникальности (object_id, name) используется и для выборки файлов объекта,
+    индекс по sha256 — для проверки ссылок при удалении содержимого (blobs).
+    """
+    __tablename__ = "object_files"
+    __table_args__ = (
+        UniqueConstraint("object_id", "name", name="uq_object_files_object_id_name"),
+        Index("ix_object_files_sha256", "sha256"),
     )
 
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id", ondelete="CASCADE"), nullable=False)
+    name: Mapped[str] = mapped_column(nullable=False)
+    sha256: Mapped[str] = mapped_column(ForeignKey("blobs.sha256"), nullable=False)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    mime_type: Mapped[str] = mapped_column(nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class ObjectUpload(Base):
+    """Незавершённая докачиваемая загрузка файла объекта (данные — в STORAGE_DIR/uploads/<id>.part)."""
+    __tablename__ = "object_uploads"
+    __table_args__ = (
+        Index("ix_object_uploads_object_id", "object_id"),
+        Index("ix_object_uploads_expires_at", "expires_at"),
+    )
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id", ondelete="CASCADE"), nullable=False)
+    file_name: Mapped[str] = mapped_column(nullable=False)
+    mime_type: Mapped[Optional[str]] = mapped_column(nullable=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    upload_offset: Mapped[int] = mapped_column(BigInteger, nullable=False, server_default="0")
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    # Продлевается каждой записанной частью; просроченные загрузки удаляет фоновая очистка
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
 
 class Product(Base):
     __tablename__ = "products"
+    # Триграммные GIN-индексы для фильтрации по подстроке (ILIKE)
+    __table_args__ = (
+        Index("ix_products_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_products_description_trgm", "description", postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"}),
+        Index("ix_products_image_trgm", "image", postgresql_using="gin", postgresql_ops={"image": "gin_trgm_ops"}),
+        Index("ix_products_country_trgm", "country", postgresql_using="gin", postgresql_ops={"country": "gin_trgm_ops"}),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_products_object_id", "object_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(nullable=False)
     description: Mapped[Optional[str]] = mapped_column(nullable=True)
     image: Mapped[Optional[str]] = mapped_column(nullable=True)
+    # SHA256 исходного изображения (строгий ETag)
+    image_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     country: Mapped[Optional[str]] = mapped_column(nullable=True)
     
-    object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id"), nullable=True)
+    object_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("objects.id", ondelete="SET NULL"), nullable=True)
+
+    # Полнотекстовый индекс, поддерживается базой данных
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(search_vector_expression(("name", "A"), ("description", "B"), ("country", "C")), persisted=True),
+        deferred=True
+    )
+
+    # Версия строки (используется для ETag), увеличивается триггером базы данных при каждом UPDATE
+    version: Mapped[int] = mapped_column(nullable=False, server_default="1", server_onupdate=FetchedValue())
 
     # Связь с объектом
     object: Mapped["Object"] = relationship(
         "Object", 
-        back_populates="products"
+        back_populates="products",
+        lazy="raise"
         )
 
     # Связь с цепочками
     chains: Mapped[List["Chain"]] = relationship(
         "Chain", 
         back_populates="product",
-        cascade="all, delete-orphan"  # Указание каскадного удаления
+        cascade="all, delete-orphan",  # Указание каскадного удаления
+        lazy="raise"
     )
 
     categories: Mapped[List["ProductCategoryAssociation"]] = relationship(
         "ProductCategoryAssociation", 
         back_populates="product",
-        cascade="all, delete-orphan"  # Указание каскадного удаления
+        cascade="all, delete-orphan",  # Указание каскадного удаления
+        lazy="raise"
     )
 
 
 class Category(Base):
     __tablename__ = "categories"
+    __table_args__ = (
+        Index("ix_categories_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_categories_parent_id", "parent_id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(nullable=False)
 
+    # Полнотекстовый индекс, поддерживается базой данных
+    search_vector: Mapped[Optional[str]] = mapped_column(
+        TSVECTOR,
+        Computed(search_vector_expression(("name", "A")), persisted=True),
+        deferred=True
+    )
+
+    # Денормализованные счётчики поддерева, поддерживаются триггерами базы данных: категории без самой
+    # категории, продукты различные (продукт из нескольких категорий поддерева считается один раз)
+    descendant_categories_count: Mapped[int] = mapped_column(nullable=False, server_default="0")
+    descendant_products_count: Mapped[int] = mapped_column(nullable=False, server_default="0")
+
     # Самореферентное отношение для родителя
     parent_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("categories.id"), nullable=True)
 
     parent: Mapped[Optional["Category"]] = relationship(
         "Category", 
         remote_side=[id], 
-        back_populates="children" 
+        back_populates="children",
+        lazy="raise"
     )
 
     # Самореферентное отношение для дочерних категорий
     children: Mapped[List["Category"]] = relationship(
         "Category", 
         back_populates="parent", 
-        lazy="joined"
+        lazy="raise"
     )
 
     # Отношение с ProductCategoryAssociation
     products: Mapped[List["ProductCategoryAssociation"]] = relationship(
         "ProductCategoryAssociation", 
         back_populates="category", 
-        lazy="joined",
+        lazy="raise",
         cascade="all, delete-orphan"  # Указание каскадного удаления
     )
 
     projects: Mapped[List["ProjectCategoryAssociation"]] = relationship(
         "ProjectCategoryAssociation",
         back_populates="category",
-        lazy="joined",
+        lazy="raise",
         cascade="all, delete-orphan"  # Указание каскадного удаления
     )
 
 
 class Project(Base):
     __tablename__ = "projects"
+    __mapper_args__ = {"eager_defaults": True}
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(nullable=False)
     description: Mapped[Optional[str]] = mapped_column(nullable=True)
 
+    # Агрегированная версия проекта и дерева его категорий, поддерживается триггерами базы данных.
+    # Новое значение возвращает сам UPDATE (RETURNING), проект после записи не перечитывается
+    version: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, server_default="1", server_onupdate=FetchedValue()
+    )
+
     categories: Mapped[List["ProjectCategoryAssociation"]] = relationship(
         "ProjectCategoryAssociation",
         back_populates="project",
         cascade="all, delete-orphan",
-        lazy="joined"
+        lazy="raise"
     )
 
     objects: Mapped[List["Object"]] = relationship(
         "Object",
         back_populates="project",
-        lazy="joined"
+        lazy="raise"
     )
 
 
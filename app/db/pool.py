@@ -0,0 +1,70 @@
+import time
+
+from dataclasses import dataclass
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# Получение соединения дольше этого времени (секунды) считается медленным
+SLOW_ACQUIRE_SECONDS = 0.1
+
+
+@dataclass
+class PoolMetrics:
+    acquires: int = 0                   # Сколько раз соединение брали из пула
+    slow_acquires: int = 0              # Из них дольше SLOW_ACQUIRE_SECONDS
+    timeouts: int = 0                   # Не дождались соединения за pool_timeout
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+
+    def record_acquire(self, seconds: float):
+        self.acquires += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+        if seconds > SLOW_ACQUIRE_SECONDS:
+            self.slow_acquires += 1
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который считает время ожидания соединения и таймауты.
+    Время включает установку нового соединения и pre-ping, то есть всё, что запрос
+    ждёт до первого обращения к базе.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.record_acquire(time.perf_counter() - started)
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    """Текущее состояние пула соединений движка и накопленные метрики ожидания."""
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": pool._max_overflow,
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(
+            acquires=metrics.acquires,
+            slow_acquires=metrics.slow_acquires,
+            timeouts=metrics.timeouts,
+            wait_seconds_avg=metrics.wait_seconds_total / metrics.acquires if metrics.acquires else 0.0,
+            wait_seconds_max=metrics.wait_seconds_max,
+        )
+    return status
@@ -0,0 +1,233 @@
+import json
+import logging
+import re
+import time
+
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм: число запросов к базе и суммарное время в базе (секунды)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+QUERY_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Параметры asyncpg ($1, $2, ...) и списки IN одинаковой формы независимо от числа значений
+PLACEHOLDERS = re.compile(r"\$\d+(?:\s*,\s*\$\d+)*")
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: без параметров и лишних пробелов (для поиска повторов N+1)."""
+    return " ".join(PLACEHOLDERS.sub("?", statement).split())
+
+
+@dataclass
+class RequestQueries:
+    """Запросы к базе, выполненные при обработке одного HTTP-запроса."""
+    count: int = 0
+    seconds: float = 0.0
+    slowest_seconds: float = 0.0
+    slowest_statement: Optional[str] = None
+    shapes: Counter = field(default_factory=Counter)
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_statement = statement
+
+    def violations(self) -> List[str]:
+        """Превышение бюджета запросов и повторы одного запроса (N+1)."""
+        problems = []
+        if self.count > settings.DB_QUERY_BUDGET:
+            problems.append(f"{self.count} queries exceed the budget of {settings.DB_QUERY_BUDGET}")
+        for shape, repeats in self.shapes.most_common():
+            if repeats <= settings.DB_QUERY_REPEAT_LIMIT:
+                break
+            problems.append(f"statement repeated {repeats} times: {shape[:200]}")
+        return problems
+
+    def server_timing(self) -> str:
+        return (
+            f'db;dur={self.seconds * 1000:.1f};desc="{self.count} queries", '
+            f"db-slowest;dur={self.slowest_seconds * 1000:.1f}"
+        )
+
+
+current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started = connection.info["query_started"].pop()
+    queries = current_queries.get()
+    if queries is not None:
+        queries.record(statement, time.perf_counter() - started)
+
+
+def handle_error(exception_context):
+    # Запрос с ошибкой не доходит до after_cursor_execute: снимаем его время начала
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Подключает учёт запросов текущего HTTP-запроса к движку."""
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine.sync_engine, "handle_error", handle_error)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, result = 0, []
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class RouteQueryMetrics:
+    """Гистограммы числа запросов и времени в базе по маршрутам (метод + шаблон пути)."""
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str], Histogram] = {}
+        self.seconds: Dict[Tuple[str, str], Histogram] = {}
+        self.violations = 0
+
+    def observe(self, method: str, route: str, queries: RequestQueries):
+        key = (method, route)
+        if key not in self.counts:
+            self.counts[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.seconds[key] = Histogram(QUERY_SECONDS_BUCKETS)
+        self.counts[key].observe(queries.count)
+        self.seconds[key].observe(queries.seconds)
+
+    def snapshot(self) -> dict:
+        return {
+            "violations": self.violations,
+            "routes": [
+                {
+                    "method": method,
+                    "route": route,
+                    "requests": histogram.count,
+                    "queries_avg": histogram.sum / histogram.count,
+                    "db_seconds_avg": self.seconds[(method, route)].sum / histogram.count,
+                }
+                for (method, route), histogram in sorted(self.counts.items())
+            ],
+        }
+
+    def prometheus(self) -> str:
+        """Гистограммы в текстовом формате Prometheus."""
+        lines = []
+        for name, histograms in (
+            ("db_queries_per_request", self.counts),
+            ("db_seconds_per_request", self.seconds),
+        ):
+            lines.append(f"# TYPE {name} histogram")
+            for (method, route), histogram in sorted(histograms.items()):
+                labels = f'method="{method}",route={json.dumps(route)}'
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        lines.append("# TYPE db_query_budget_violations_total counter")
+        lines.append(f"db_query_budget_violations_total {self.violations}")
+        return "\n".join(lines) + "\n"
+
+
+query_metrics = RouteQueryMetrics()
+
+
+def route_template(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class QueryStatsMiddleware:
+    """
+    Считает запросы к базе каждого HTTP-запроса: число, суммарное время и самый медленный.
+    Итог отдаётся в заголовке Server-Timing и попадает в гистограммы маршрута.
+
+    Превышение DB_QUERY_BUDGET и повторы одного запроса больше DB_QUERY_REPEAT_LIMIT раз
+    записываются в лог; в строгом режиме (DB_QUERY_STRICT) вместо ответа возвращается 500.
+    Запросы, выполненные после начала ответа (потоковые ответы), в заголовок не попадают.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        replaced = False
+
+        async def send_with_stats(message: Message):
+            nonlocal replaced
+            if replaced:
+                return
+            if message["type"] == "http.response.start":
+                problems = queries.violations()
+                if problems and settings.DB_QUERY_STRICT:
+                    replaced = True
+                    await send_violation(send, problems)
+                    return
+                MutableHeaders(scope=message).append("Server-Timing", queries.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            current_queries.reset(token)
+            route = route_template(scope)
+            query_metrics.observe(scope["method"], route, queries)
+            problems = queries.violations()
+            if problems:
+                query_metrics.violations += 1
+                logger.warning(
+                    "%s %s: %s; slowest %.1f ms: %s",
+                    scope["method"], route, "; ".join(problems),
+                    queries.slowest_seconds * 1000, queries.slowest_statement,
+                )
+
+
+async def send_violation(send: Send, problems: List[str]):
+    body = json.dumps({"detail": "Database query budget exceeded", "problems": problems}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 500,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,147 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.settings import settings
+from app.db.pool import pool_status
+from app.db.session import async_session, create_engine
+
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD")
+
+# Cookie с временем последней записи клиента: его чтения в это окно идут на основную базу
+LAST_WRITE_COOKIE = "db_last_write"
+
+# Отставание реплики в секундах. Если всё полученное уже применено, отставания нет,
+# даже когда на основной базе давно ничего не записывали
+REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url)
+        self.session = sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.lag: Optional[float] = None
+        self.healthy = True
+
+
+class ReplicaRouter:
+    """
+    Распределяет сеансы чтения по репликам (по кругу).
+
+    Отставание реплик проверяется раз в REPLICA_CHECK_INTERVAL секунд; реплики, которые
+    отстают больше REPLICA_MAX_LAG или недоступны, исключаются, пока не догонят.
+    Если подходящих реплик нет, чтение идёт на основную базу.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self.counter = itertools.count()
+        self.monitor: Optional[asyncio.Task] = None
+
+    def read_session(self) -> sessionmaker:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return async_session
+        return healthy[next(self.counter) % len(healthy)].session
+
+    async def check(self):
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    replica.lag = float(await connection.scalar(REPLICA_LAG_SQL))
+                replica.healthy = replica.lag <= settings.REPLICA_MAX_LAG
+            except Exception:
+                replica.lag, replica.healthy = None, False
+                logger.warning("Replica %s is unavailable", replica.engine.url.host, exc_info=True)
+
+    async def run_monitor(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.REPLICA_CHECK_INTERVAL)
+
+    def start(self):
+        if self.replicas and self.monitor is None:
+            self.monitor = asyncio.create_task(self.run_monitor())
+
+    async def stop(self):
+        if self.monitor is not None:
+            self.monitor.cancel()
+            self.monitor = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def status(self) -> List[dict]:
+        return [
+            {
+                "host": replica.engine.url.host,
+                "healthy": replica.healthy,
+                "lag_seconds": replica.lag,
+                "pool": pool_status(replica.engine),
+            }
+            for replica in self.replicas
+        ]
+
+
+replica_router = ReplicaRouter(settings.ASYNC_REPLICA_DATABASE_URLS)
+
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, ""))
+    except ValueError:
+        return False
+    return time.time() - last_write < settings.REPLICA_READ_YOUR_WRITES_WINDOW
+
+
+def session_factory_for(request: Request) -> sessionmaker:
+    """
+    Фабрика сеансов для запроса: безопасные запросы (GET, HEAD) читают с реплики,
+    остальные запросы и чтения клиента сразу после его записи — с основной базы.
+    """
+    if request.method not in SAFE_METHODS or wrote_recently(request):
+        return async_session
+    return replica_router.read_session()
+
+
+class ReadYourWritesMiddleware:
+    """
+    Помечает клиента после успешного изменяющего запроса (cookie LAST_WRITE_COOKIE),
+    чтобы его следующие чтения не попали на отстающую реплику.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or not replica_router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{LAST_WRITE_COOKIE}={time.time():.3f}; Max-Age={settings.REPLICA_READ_YOUR_WRITES_WINDOW}; "
+                    "Path=/; HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -1,9 +1,61 @@
+from typing import Callable
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.settings import settings
+from app.db.pool import InstrumentedQueuePool
+from app.db.query_stats import instrument_engine
 
-async_engine: AsyncEngine = create_async_engine(settings.ASYNC_DATABASE_URL, future=True)
+
+def create_engine(url: str) -> AsyncEngine:
+    """Асинхронный движок с настройками пула и сеанса PostgreSQL из Settings."""
+    connect_args = {
+        # Кэш подготовленных запросов SQLAlchemy и самого asyncpg (0 — выключен, например за pgbouncer)
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "server_settings": {"statement_timeout": str(settings.DB_STATEMENT_TIMEOUT)},
+    }
+    engine = create_async_engine(
+        url,
+        future=True,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    instrument_engine(engine)
+    return engine
+
+
+async_engine: AsyncEngine = create_engine(settings.ASYNC_DATABASE_URL)
 
 # Создание асинхронной фабрики сеансов
-async_session = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
\ No newline at end of file
+async_session = sessionmaker(async_engine, expire_on_commit=False, class_=AsyncSession)
+
+
+
+def after_commit(db: AsyncSession, callback: Callable[[], None]):
+    """
+    Выполняет callback после фиксации текущей транзакции сеанса (например, удаление
+    файлов, на которые база больше не ссылается). При откате callback отбрасывается.
+    """
+    callbacks = db.info.get("after_commit")
+    if callbacks is None:
+        callbacks = db.info["after_commit"] = []
+        event.listen(db.sync_session, "after_commit", run_after_commit)
+        event.listen(db.sync_session, "after_rollback", discard_after_commit)
+    callbacks.append(callback)
+
+
+def run_after_commit(session: Session):
+    callbacks, session.info["after_commit"] = session.info["after_commit"], []
+    for callback in callbacks:
+        callback()
+
+
+def discard_after_commit(session: Session):
+    session.info["after_commit"] = []
@@ -0,0 +1,155 @@
+import uuid
+
+from sqlalchemy import func, insert, literal, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from typing import AsyncIterator, Dict, Iterable, List
+
+from app.db.models import Category, Product, ProductCategoryAssociation, ProjectCategoryAssociation
+from app.schemas.product import CatalogRecord
+
+
+def category_paths_cte(root_ids: Iterable[uuid.UUID]):
+    """Рекурсивный CTE (id, path) с путями `Root/Sub/Leaf` всех категорий поддеревьев root_ids."""
+    paths = (
+        select(Category.id, Category.name.label("path"))
+        .where(Category.id.in_(list(root_ids)))
+        .cte("category_paths", recursive=True)
+    )
+    return paths.union_all(
+        select(Category.id, paths.c.path + literal("/") + Category.name)
+        .where(Category.parent_id == paths.c.id)
+    )
+
+
+class CatalogRepository:
+    """
+    Массовый импорт и экспорт каталога продуктов проекта.
+
+    Импорт выполняется в одной транзакции: категории создаются по путям за один проход,
+    продукты и привязки загружаются пакетами через COPY во временную таблицу
+    и переносятся с upsert по id.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_category_paths(self, root_ids: List[uuid.UUID]) -> Dict[str, uuid.UUID]:
+        """Отображение путь → id для всех категорий поддеревьев root_ids."""
+        paths = category_paths_cte(root_ids)
+        result = await self.db.execute(select(paths.c.path, paths.c.id))
+        return dict(result.tuples().all())
+
+    async def create_category_paths(
+        self,
+        project_id: uuid.UUID,
+        paths: Iterable[str],
+        path_ids: Dict[str, uuid.UUID],
+    ) -> int:
+        """
+        Создаёт недостающие категории для путей (одним многострочным INSERT)
+        и дополняет path_ids. Новые корневые категории привязываются к проекту.
+
+        :return: Количество созданных категорий.
+        """
+        categories = []
+        roots = []
+        for path in paths:
+            parts = path.split("/")
+            for depth in range(1, len(parts) + 1):
+                prefix = "/".join(parts[:depth])
+                if prefix in path_ids:
+                    continue
+                category_id = uuid.uuid4()
+                parent_id = path_ids["/".join(parts[:depth - 1])] if depth > 1 else None
+                path_ids[prefix] = category_id
+                categories.append({"id": category_id, "name": parts[depth - 1], "parent_id": parent_id})
+                if parent_id is None:
+                    roots.append({"project_id": project_id, "category_id": category_id})
+
+        # Родители идут в списке раньше потомков, поэтому порядок вставки не нарушает внешние ключи
+        if categories:
+            await self.db.execute(insert(Category), categories)
+        if roots:
+            await self.db.execute(insert(ProjectCategoryAssociation), roots)
+        return len(categories)
+
+    async def create_import_table(self):
+        """Создаёт временную таблицу пакета продуктов (один раз на импорт, удаляется при фиксации)."""
+        # Выполняется через сессию, чтобы COPY в import_products шёл в той же транзакции
+        await self.db.execute(text(
+            "CREATE TEMP TABLE products_import "
+            "(id uuid PRIMARY KEY, name varchar, description varchar, country varchar) "
+            "ON COMMIT DROP"
+        ))
+
+    async def import_products(self, records: List[CatalogRecord], path_ids: Dict[str, uuid.UUID]) -> int:
+        """
+        Загружает пакет продуктов через COPY с upsert по id и заменяет их привязки к категориям
+        проекта. Привязки к категориям других проектов сохраняются. Все пути категорий записей
+        должны уже быть в path_ids, временная таблица — создана create_import_table.
+
+        :return: Количество загруженных продуктов.
+        """
+        # При повторе id в пакете побеждает последняя запись
+        products = {}
+        for record in records:
+            products[record.id or uuid.uuid4()] = record
+
+        connection = await self.db.connection()
+        driver_connection = (await connection.get_raw_connection()).driver_connection
+
+        await driver_connection.copy_records_to_table(
+            "products_import",
+            records=[
+                (product_id, record.name, record.description, record.country)
+                for product_id, record in products.items()
+            ],
+            columns=["id", "name", "description", "country"],
+        )
+        # Версию обновлённых продуктов увеличивает триггер базы данных
+        await driver_connection.execute(
+            "INSERT INTO products (id, name, description, country) "
+            "SELECT id, name, description, country FROM products_import "
+            "ON CONFLICT (id) DO UPDATE SET "
+            "name = EXCLUDED.name, description = EXCLUDED.description, country = EXCLUDED.country"
+        )
+        await driver_connection.execute(
+            "DELETE FROM product_category_association "
+            "WHERE product_id IN (SELECT id FROM products_import) AND category_id = ANY($1::uuid[])",
+            list(set(path_ids.values())),
+        )
+        await driver_connection.copy_records_to_table(
+            "product_category_association",
+            records=[
+                (uuid.uuid4(), product_id, category_id)
+                for product_id, record in products.items()
+                for category_id in dict.fromkeys(path_ids[path] for path in record.categories)
+            ],
+            columns=["id", "product_id", "category_id"],
+        )
+        await driver_connection.execute("TRUNCATE products_import")
+        return len(products)
+
+    async def stream_products(self, root_ids: List[uuid.UUID], batch_size: int) -> AsyncIterator[List[CatalogRecord]]:
+        """
+        Потоково (серверным курсором) отдаёт продукты поддеревьев root_ids
+        с путями их категорий пакетами по batch_size.
+        """
+        paths = category_paths_cte(root_ids)
+        query = (
+            select(
+                Product.id,
+                Product.name,
+                Product.description,
+                Product.country,
+                func.array_agg(paths.c.path.distinct()).label("categories"),
+            )
+            .join(ProductCategoryAssociation, ProductCategoryAssociation.product_id == Product.id)
+            .join(paths, paths.c.id == ProductCategoryAssociation.category_id)
+            .group_by(Product.id)
+            .order_by(Product.id)
+        )
+        result = await self.db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield [CatalogRecord.model_validate(row, from_attributes=True) for row in rows]
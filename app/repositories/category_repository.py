@@ -1,80 +1,143 @@
+from sqlalchemy import CTE
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload, selectinload
 from uuid import UUID
-from typing import List
+from typing import Iterable, List
 
 from app.db.models import Category
+from app.repositories.loader import get_loader
+
+
+def category_subtree_cte(root_ids: Iterable[UUID]) -> CTE:
+    """
+    Рекурсивный CTE с идентификаторами всех категорий поддеревьев с корнями root_ids
+    (включая сами корни).
+    """
+    subtree = (
+        select(Category.id)
+        .where(Category.id.in_(list(root_ids)))
+        .cte("category_subtree", recursive=True)
+    )
+    return subtree.union(
+        select(Category.id).where(Category.parent_id == subtree.c.id)
+    )
 
 
 class CategoryRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
+        self.loader = get_loader(db, Category, self.load_categories)
+
+    async def load_categories(self, category_ids: List[UUID]) -> List[Category]:
+        """
+        Пакетная загрузка категорий для загрузчика запроса (без связей: дерево
+        и продукты строятся отдельными запросами по плоским строкам).
+        """
+        result = await self.db.execute(select(Category).where(Category.id.in_(category_ids)))
+        return result.scalars().all()
 
     async def get_all_categories(self):
-        result = await self.db.execute(
-            select(Category)
-            .options(joinedload(Category.products))
-        )
-        return result.unique().scalars().all()
+        result = await self.db.execute(select(Category))
+        return result.scalars().all()
     
     async def get_category_by_id(self, category_id: UUID):
-        result = await self.db.execute(
-            select(Category)
-            .options(
-                joinedload(Category.products),
-                selectinload(Category.children, recursion_depth=-1)
-            )
-            .where(Category.id == category_id)
-        )
-        return result.unique().scalar_one_or_none()
+        return await self.loader.load(category_id)
     
     async def get_category_by_ids(self, category_ids: list[UUID]) -> List[Category] | None:
-        result = await self.db.execute(
-            select(Category)
-            .options(
-                joinedload(Category.products),
-                joinedload(Category.projects),  # Указываем связь projects для ассоциаций
-                selectinload(Category.children, recursion_depth=-1)
-            )
-            .where(Category.id.in_(category_ids)))
-        return result.unique().scalars().all()
+        return await self.loader.load_many(category_ids)
     
 
+    async def get_existing_category_ids(self, category_ids: Iterable[UUID]) -> set[UUID]:
+        """Возвращает те из category_ids, категории с которыми существуют (без загрузки связей)."""
+        result = await self.db.execute(
+            select(Category.id).where(Category.id.in_(list(category_ids)))
+        )
+        return set(result.scalars().all())
+
     async def create_category(self, category: Category):
         self.db.add(category)
         await self.db.commit()
-        await self.db.refresh(category)
-
-        # Предварительная загрузка родительской категории
-        await self.db.execute(
-            select(Category).options(
-                joinedload(Category.parent),
-            )
-            .where(Category.id == category.id)
-        )
         return category
 
     async def update_category(self, category: Category, updates: dict):
         for key, value in updates.items():
             setattr(category, key, value)
         await self.db.commit()
-        await self.db.refresh(category)
         return category
 
     async def delete_category(self, category: Category):
         await self.db.delete(category)
         await self.db.commit()
+        self.loader.clear(category.id)
 
     
-    async def get_root_categories_with_relationships(self):
+    async def get_root_category_ids(self) -> List[UUID]:
         result = await self.db.execute(
-            select(Category)
-            .options(
-                joinedload(Category.products),
-                selectinload(Category.children, recursion_depth=-1)
-            )
+            select(Category.id)
             .where(Category.parent_id.is_(None))
+            .order_by(Category.name, Category.id)
         )
-        return result.unique().scalars().all()
-    
+        return result.scalars().all()
+
+    async def get_subtree_rows(self, root_ids: Iterable[UUID]):
+        """
+        Возвращает плоский список (id, name, parent_id) всех категорий поддеревьев
+        с корнями root_ids без загрузки продуктов и дочерних категорий.
+        """
+        subtree = category_subtree_cte(root_ids)
+        result = await self.db.execute(
+            select(Category.id, Category.name, Category.parent_id)
+            .join(subtree, subtree.c.id == Category.id)
+            .order_by(Category.name, Category.id)
+        )
+        return result.all()
+
+    async def get_categories_with_ancestors(self, category_ids: Iterable[UUID]):
+        """
+        Возвращает плоский список (id, name, parent_id) для указанных категорий
+        и всех их предков без загрузки продуктов и дочерних категорий.
+        """
+        ancestors = (
+            select(Category.id, Category.name, Category.parent_id)
+            .where(Category.id.in_(list(category_ids)))
+            .cte("category_ancestors", recursive=True)
+        )
+        ancestors = ancestors.union(
+            select(Category.id, Category.name, Category.parent_id)
+            .where(Category.id == ancestors.c.parent_id)
+        )
+        result = await self.db.execute(
+            select(ancestors).order_by(ancestors.c.name, ancestors.c.id)
+        )
+        return result.all()
+
+    async def get_category_node(self, category_id: UUID):
+        """
+        Возвращает (id, name, счётчики поддерева) категории без загрузки связей.
+        """
+        result = await self.db.execute(
+            select(
+                Category.id,
+                Category.name,
+                Category.descendant_categories_count,
+                Category.descendant_products_count,
+            )
+            .where(Category.id == category_id)
+        )
+        return result.one_or_none()
+
+    async def get_child_nodes(self, category_id: UUID):
+        """
+        Возвращает (id, name, счётчики поддерева) прямых дочерних категорий.
+        """
+        result = await self.db.execute(
+            select(
+                Category.id,
+                Category.name,
+                Category.descendant_categories_count,
+                Category.descendant_products_count,
+            )
+            .where(Category.parent_id == category_id)
+            .order_by(Category.name, Category.id)
+        )
+        return result.all()
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from uuid import UUID
 from typing import List
 
@@ -28,6 +28,8 @@ class ChainRepository:
     async def get_objects_by_product_id(self, product_id: UUID) -> List[Object]:
         """
         Получает список объектов, связанных с продуктом через цепочки.
+        У объектов загружаются только исходящие цепочки этого продукта и координаты
+        их целевых объектов (всё, что отдаёт ObjectChainResponse).
         
         :param product_id: UUID продукта
         :return: Список объектов (List[Object])
@@ -36,14 +38,17 @@ class ChainRepository:
             select(Object)
             .join(Chain, (Chain.source_object_id == Object.id) | (Chain.target_object_id == Object.id))
             .where(Chain.product_id == product_id)
-            .options(joinedload(Object.products), joinedload(Object.chains_source))
+            .options(
+                selectinload(Object.chains_source.and_(Chain.product_id == product_id))
+                .joinedload(Chain.target_object)
+                .load_only(Object.id, Object.x, Object.y, Object.name)
+            )
         )
         return result.unique().scalars().all()
 
     async def create_chain(self, chain: Chain):
         self.db.add(chain)
         await self.db.commit()
-        await self.db.refresh(chain)
         return chain
 
     async def update_chain(self, chain: Chain, updates: dict):
@@ -51,7 +56,6 @@ class ChainRepository:
         for key, value in updates.items():
             setattr(chain, key, value)
         await self.db.commit()
-        await self.db.refresh(chain)
         return chain
 
     async def delete_chain(self, chain: Chain):
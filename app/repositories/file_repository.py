@@ -0,0 +1,147 @@
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from uuid import UUID
+from typing import Iterable, List, Optional
+
+from app.db.models import Blob, Object, ObjectFile
+
+
+class FileRepository:
+    """
+    Файлы объектов в адресуемом по содержимому хранилище.
+
+    Одинаковое содержимое хранится один раз (таблица blobs), файлы объектов ссылаются на него
+    (таблица object_files). Счётчик ссылок blobs.ref_count поддерживается триггером.
+    Методы не фиксируют транзакцию; файлы содержимого удаляет фоновая очистка после фиксации.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_object_file(self, object_id: UUID, name: str) -> Optional[ObjectFile]:
+        result = await self.db.execute(
+            select(ObjectFile).where(ObjectFile.object_id == object_id, ObjectFile.name == name)
+        )
+        return result.scalar_one_or_none()
+
+    async def get_object_files(self, object_id: UUID) -> List[ObjectFile]:
+        result = await self.db.execute(
+            select(ObjectFile)
+            .where(ObjectFile.object_id == object_id)
+            .order_by(ObjectFile.created_at, ObjectFile.name)
+        )
+        return result.scalars().all()
+
+    async def get_project_files(self, project_id: UUID):
+        """
+        Файлы всех объектов проекта одним запросом: строки
+        (object_id, object_name, name, sha256, size, mime_type), сгруппированные по объектам.
+        """
+        result = await self.db.execute(
+            select(
+                Object.id.label("object_id"),
+                Object.name.label("object_name"),
+                ObjectFile.name,
+                ObjectFile.sha256,
+                ObjectFile.size,
+                ObjectFile.mime_type,
+            )
+            .join(ObjectFile, ObjectFile.object_id == Object.id)
+            .where(Object.project_id == project_id)
+            .order_by(Object.name, Object.id, ObjectFile.name)
+        )
+        return result.all()
+
+    async def acquire_blob(self, sha256: str, size: int):
+        """
+        Регистрирует содержимое в хранилище (или находит уже существующее).
+
+        Строка blobs блокируется до конца транзакции, поэтому параллельная очистка
+        не удалит файл, пока на него не появится ссылка.
+        """
+        statement = insert(Blob).values(sha256=sha256, size=size)
+        # Без автосброса: изменения объекта и его файлов записываются одним flush при фиксации
+        with self.db.no_autoflush:
+            await self.db.execute(
+                statement.on_conflict_do_update(index_elements=[Blob.sha256], set_={"size": statement.excluded.size})
+            )
+
+    def add_object_file(self, obj: Object, name: str, sha256: str, size: int, mime_type: str) -> ObjectFile:
+        """
+        Добавляет файл в коллекцию файлов объекта. Строка записывается при фиксации
+        транзакции, файлы одного запроса — одним многострочным INSERT.
+        """
+        object_file = ObjectFile(name=name, sha256=sha256, size=size, mime_type=mime_type)
+        obj.files.append(object_file)
+        return object_file
+
+    async def get_object_hashes(self, object_ids: List[UUID]) -> List[str]:
+        """Содержимое файлов указанных объектов (перед их каскадным удалением)."""
+        result = await self.db.execute(
+            select(ObjectFile.sha256).where(ObjectFile.object_id.in_(object_ids)).distinct()
+        )
+        return result.scalars().all()
+
+    async def delete_object_file(self, object_id: UUID, name: str) -> Optional[str]:
+        """Удаляет файл объекта и возвращает хеш его содержимого (None, если файла нет)."""
+        result = await self.db.execute(
+            delete(ObjectFile)
+            .where(ObjectFile.object_id == object_id, ObjectFile.name == name)
+            .returning(ObjectFile.sha256)
+        )
+        return result.scalar_one_or_none()
+
+    async def delete_object_files(self, object_id: UUID) -> List[str]:
+        """Удаляет все файлы объекта и возвращает хеши их содержимого."""
+        result = await self.db.execute(
+            delete(ObjectFile).where(ObjectFile.object_id == object_id).returning(ObjectFile.sha256)
+        )
+        return list(set(result.scalars().all()))
+
+    async def delete_unreferenced_blobs(self, hashes: Iterable[str]) -> List[str]:
+        """
+        Удаляет строки содержимого из hashes, на которое больше не ссылается ни один файл.
+        Параллельная загрузка того же содержимого держит блокировку строки (acquire_blob):
+        удаление дождётся её и пропустит строку, если ссылка появилась.
+
+        :return: Хеши удалённых строк; их файлы удаляются после фиксации транзакции.
+        """
+        hashes = list(set(hashes))
+        if not hashes:
+            return []
+        result = await self.db.execute(
+            delete(Blob).where(Blob.sha256.in_(hashes), Blob.ref_count == 0).returning(Blob.sha256)
+        )
+        return result.scalars().all()
+
+    async def take_unreferenced_blobs(self, limit: int) -> List[str]:
+        """
+        Удаляет до limit строк содержимого без ссылок, оставшихся после каскадных удалений
+        (например, файлов филиалов). Строки, заблокированные загрузками, пропускаются.
+        """
+        unreferenced = (
+            select(Blob.sha256)
+            .where(Blob.ref_count == 0)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.db.execute(
+            delete(Blob).where(Blob.sha256.in_(unreferenced.scalar_subquery())).returning(Blob.sha256)
+        )
+        return result.scalars().all()
+
+    async def claim_blob_removal(self, sha256: str) -> bool:
+        """
+        Перед удалением файла содержимого вставляет временную строку blobs: параллельная
+        загрузка того же содержимого (acquire_blob) дождётся конца транзакции и запишет
+        файл заново. Строка уже есть — содержимое снова используется, файл удалять нельзя.
+        """
+        statement = insert(Blob).values(sha256=sha256, size=0).on_conflict_do_nothing(index_elements=[Blob.sha256])
+        result = await self.db.execute(statement.returning(Blob.sha256))
+        return result.scalar_one_or_none() is not None
+
+    async def delete_blob(self, sha256: str):
+        """Удаляет временную строку, вставленную claim_blob_removal."""
+        await self.db.execute(delete(Blob).where(Blob.sha256 == sha256))
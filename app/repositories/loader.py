@@ -0,0 +1,89 @@
+import asyncio
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+class BatchLoader:
+    """
+    Загрузчик сущностей по ID в рамках одного запроса (по образцу DataLoader).
+
+    Все вызовы load() в пределах одного шага цикла событий объединяются в один
+    запрос `WHERE id IN (...)`, результаты кэшируются до конца запроса,
+    поэтому каждая сущность загружается не более одного раза.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[UUID]], Awaitable[Iterable[Any]]],
+        lock: asyncio.Lock,
+    ):
+        self.batch_fn = batch_fn
+        self.lock = lock
+        self.cache: Dict[UUID, asyncio.Future] = {}
+        self.queue: List[UUID] = []
+        self.dispatch_task: Optional[asyncio.Task] = None
+
+    async def load(self, key: UUID) -> Optional[Any]:
+        future = self.cache.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.cache[key] = future
+            self.queue.append(key)
+            # Запрос уходит на следующем шаге цикла событий, когда соберутся все ключи
+            if len(self.queue) == 1:
+                self.dispatch_task = asyncio.create_task(self.dispatch())
+        return await future
+
+    async def load_many(self, keys: Iterable[UUID]) -> List[Any]:
+        """Загружает несколько сущностей, пропуская несуществующие."""
+        entities = await asyncio.gather(*(self.load(key) for key in keys))
+        return [entity for entity in entities if entity is not None]
+
+    async def dispatch(self):
+        keys, self.queue = self.queue, []
+        futures = [self.cache[key] for key in keys]
+        try:
+            # Сессия не допускает параллельных запросов, поэтому загрузчики сессии выполняются по очереди
+            async with self.lock:
+                entities = await self.batch_fn(keys)
+        except Exception as e:
+            for key, future in zip(keys, futures):
+                if self.cache.get(key) is future:
+                    del self.cache[key]
+                future.set_exception(e)
+            return
+
+        found = {entity.id: entity for entity in entities}
+        for key, future in zip(keys, futures):
+            future.set_result(found.get(key))
+
+    def prime(self, entity: Any):
+        """Кладёт уже загруженную (например, только что созданную) сущность в кэш."""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(entity)
+        self.cache[entity.id] = future
+
+    def clear(self, key: UUID):
+        """Удаляет сущность из кэша (например, после её удаления)."""
+        self.cache.pop(key, None)
+
+
+def get_loader(
+    db: AsyncSession,
+    entity: type,
+    batch_fn: Callable[[List[UUID]], Awaitable[Iterable[Any]]],
+    profile: str = "",
+) -> BatchLoader:
+    """
+    Возвращает загрузчик сущностей entity, привязанный к сессии.
+    Сессия создаётся на каждый запрос, поэтому и кэш загрузчика живёт один запрос.
+    У загрузчиков одной сущности с разным набором связей (profile) свой кэш.
+    """
+    loaders = db.info.setdefault("loaders", {})
+    key = (entity, profile)
+    if key not in loaders:
+        lock = db.info.setdefault("loaders_lock", asyncio.Lock())
+        loaders[key] = BatchLoader(batch_fn, lock)
+    return loaders[key]
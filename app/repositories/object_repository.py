@@ -1,98 +1,169 @@
+from sqlalchemy import inspect
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy.future import select
 from uuid import UUID
-from typing import List
+from typing import Iterable, List, Optional, Set
 
 from app.db.models import Object
+from app.core.images import image_url
 from app.core.settings import settings
+from app.repositories.loader import get_loader
+from app.repositories.utils import mark_loaded_empty, versions_fingerprint
 
 class ObjectRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.settings = settings
+        self.loader = get_loader(db, Object, self.load_objects)
+        self.row_loader = get_loader(db, Object, self.load_object_rows, profile="rows")
+
+    async def get_existing_object_ids(self, object_ids: Iterable[UUID]) -> Set[UUID]:
+        """Возвращает те из object_ids, объекты с которыми существуют (без загрузки связей)."""
+        result = await self.db.execute(select(Object.id).where(Object.id.in_(list(object_ids))))
+        return set(result.scalars().all())
+
+    async def load_objects(self, object_ids: List[UUID]) -> List[Object]:
+        """Пакетная загрузка объектов для загрузчика запроса (с филиалами и файлами для ObjectResponse)."""
+        result = await self.db.execute(
+            select(Object)
+            .options(selectinload(Object.branches), selectinload(Object.files))
+            .where(Object.id.in_(object_ids)))
+        return result.unique().scalars().all()
+
+    async def load_object_rows(self, object_ids: List[UUID]) -> List[Object]:
+        """Пакетная загрузка объектов без связей (маршрутам, которым нужны только поля объекта)."""
+        result = await self.db.execute(select(Object).where(Object.id.in_(object_ids)))
+        return result.scalars().all()
 
     async def get_all_objects(self) -> List[Object]:
         result = await self.db.execute(
             select(Object)
-            .options(selectinload(Object.branches))
+            .options(selectinload(Object.branches), selectinload(Object.files))
     )
         return result.unique().scalars().all()
 
     async def get_object_by_id(self, object_id: UUID) -> Object:
-        result = await self.db.execute(
-            select(Object)
-            .options(selectinload(Object.branches))
-            .where(Object.id == object_id))
-        obj = result.unique().scalar_one_or_none()
-        return obj
+        return await self.loader.load(object_id)
+
+    async def get_object_row(self, object_id: UUID) -> Optional[Object]:
+        """Объект без филиалов и файлов."""
+        return await self.row_loader.load(object_id)
     
-    async def get_object_by_ids(self, object_ids: list[UUID]) -> List[Object]:
+    async def get_all_objects_etag(self) -> Optional[str]:
+        """Отпечаток версий всех объектов (для ETag) без загрузки самих объектов."""
+        result = await self.db.execute(select(versions_fingerprint(Object.id, Object.version)))
+        return result.scalar_one()
+
+    async def get_object_etag(self, object_id: UUID) -> Optional[str]:
+        """Отпечаток версий объекта и его филиалов (для ETag). None, если объекта нет."""
         result = await self.db.execute(
-            select(Object)
-            .where(Object.id.in_(object_ids)))
-        objects = result.unique().scalars().all()
-        return objects
+            select(versions_fingerprint(Object.id, Object.version))
+            .where((Object.id == object_id) | (Object.parent_id == object_id))
+        )
+        return result.scalar_one()
+
+    async def get_subtree_ids(self, object_id: UUID) -> List[UUID]:
+        """
+        Идентификаторы объекта и всех его филиалов на любой глубине
+        (одним рекурсивным запросом, без загрузки самих объектов).
+        """
+        subtree = (
+            select(Object.id)
+            .where(Object.id == object_id)
+            .cte("object_subtree", recursive=True)
+        )
+        subtree = subtree.union_all(
+            select(Object.id).where(Object.parent_id == subtree.c.id)
+        )
+        result = await self.db.execute(select(subtree.c.id))
+        return result.scalars().all()
+
+    async def get_object_by_ids(self, object_ids: list[UUID]) -> List[Object]:
+        return await self.loader.load_many(object_ids)
 
     async def create_object(self, obj: Object) -> Object:
+        """
+        Записывает новый объект (вместе с уже добавленными к нему файлами) и фиксирует транзакцию.
+
+        Объект не перечитывается: атрибуты остаются загруженными (expire_on_commit=False),
+        начальную версию задаёт база, а филиалов у нового объекта нет.
+        """
         self.db.add(obj)
         await self.db.commit()
-        await self.db.refresh(obj)
-
-        # Делаем дополнительный запрос на загрузку филиалов с помощью selectinload
-        query = select(Object).options(selectinload(Object.branches)).where(Object.id == obj.id)
-        result = await self.db.execute(query)
-
-        return result.unique().scalar_one_or_none()
+        mark_loaded_empty(obj, "branches", "files")
+        return obj
 
-    async def update_object(self, obj: Object, updates: dict) -> Object:
+    def set_fields(self, obj: Object, updates: dict):
+        """Изменяет поля объекта без фиксации транзакции."""
         for key, value in updates.items():
             setattr(obj, key, value)
+
+    async def save_object(self, obj: Object) -> Object:
+        """
+        Фиксирует изменения объекта одним UPDATE. Объект не перечитывается:
+        изменённые атрибуты уже в памяти, версию увеличивает триггер базы данных.
+        """
         await self.db.commit()
-        await self.db.refresh(obj)
         return obj
 
-    async def delete_object(self, obj: Object):
+    async def update_object(self, obj: Object, updates: dict) -> Object:
+        self.set_fields(obj, updates)
+        return await self.save_object(obj)
+
+    async def delete_object(self, obj: Object, subtree_ids: Iterable[UUID] = ()):
+        """
+        Удаляет объект без фиксации транзакции. Филиалы, цепочки и файлы удаляет база
+        (ON DELETE CASCADE); subtree_ids — удаляемые вместе с объектом филиалы,
+        их записи убираются из загрузчиков запроса.
+        """
         await self.db.delete(obj)
-        await self.db.commit()
+        await self.db.flush()
+        for object_id in {obj.id, *subtree_ids}:
+            self.loader.clear(object_id)
+            self.row_loader.clear(object_id)
 
-    async def update_image(self, obj: Object, image_flag: bool) -> Object:
+    def set_image(self, obj: Object, image_flag: bool, image_sha256: Optional[str] = None):
         """
-        Обновляет путь к изображению для объекта.
+        Устанавливает ссылку на изображение и его хеш-сумму без фиксации транзакции.
+        Ссылка содержит версию изображения, поэтому меняется при каждой замене.
         """
         if image_flag:
-            obj.image = f'{settings.API_URL}/objects/{obj.id}/image'
+            obj.image = image_url("objects", obj.id, image_sha256)
+            obj.image_sha256 = image_sha256
         else:
             obj.image = None
-        await self.db.commit()
-        await self.db.refresh(obj)
-        
-        # Делаем дополнительный запрос на загрузку филиалов с помощью selectinload
-        query = select(Object).options(selectinload(Object.branches)).where(Object.id == obj.id)
-        result = await self.db.execute(query)
+            obj.image_sha256 = None
 
-        return result.unique().scalar_one_or_none()
+    async def update_image(self, obj: Object, image_flag: bool, image_sha256: Optional[str] = None) -> Object:
+        """
+        Обновляет путь к изображению и его хеш-сумму для объекта.
+        """
+        self.set_image(obj, image_flag, image_sha256)
+        return await self.save_object(obj)
 
-    async def update_file_storage(self, obj: Object, file_storage: List[str] | None) -> Object:
+    def touch_files(self, obj: Object):
         """
-        Обновляет путь к файловому хранилищу для объекта.
+        Отмечает изменение файлов объекта без фиксации транзакции (строки object_files
+        добавляются и удаляются через FileRepository). Версия объекта увеличится
+        при записи, чтобы сменился его ETag.
         """
-        obj.file_storage = obj.file_storage + file_storage
-        await self.db.commit()
-        await self.db.refresh(obj)
+        # Сами колонки объекта не меняются, отмечаем его изменённым для увеличения версии.
+        # Новый объект и так будет записан INSERT с начальной версией
+        if inspect(obj).persistent:
+            flag_modified(obj, "name")
+
+    async def update_files(self, obj: Object) -> Object:
+        """Фиксирует изменение файлов объекта."""
+        self.touch_files(obj)
+        return await self.save_object(obj)
 
-        # Делаем дополнительный запрос на загрузку филиалов с помощью selectinload
-        query = select(Object).options(selectinload(Object.branches)).where(Object.id == obj.id)
-        result = await self.db.execute(query)
 
-        return result.unique().scalar_one_or_none()
-    
-    
     async def get_objects_within_bounds(self, x: float, y: float, project_id: UUID) -> List[Object]:
-        """Получить объекты в квадрате с центром (x, y) и радиусом 1 км."""
+        """Получить объекты в квадрате с центром (x, y) и радиусом 1 км (без связей)."""
         result = await self.db.execute(
             select(Object)
-            .options(selectinload(Object.branches))
             .where(
                 (Object.x >= x - 1.0) & (Object.x <= x + 1.0),
                 (Object.y >= y - 1.0) & (Object.y <= y + 1.0),
@@ -100,30 +171,3 @@ class ObjectRepository:
             )
         )
         return result.unique().scalars().all()
-    
-
-    async def remove_file_from_storage(self, obj: Object, file_name: str) -> Object:
-        """
-        Удаляет из file_storage объекта элемент с указанным именем файла.
-        
-        :param obj: Экземпляр объекта, у которого нужно удалить файл из file_storage.
-        :param file_name: Имя файла, которое необходимо удалить из file_storage.
-        :return: Обновленный объект.
-        """
-        if obj.file_storage:
-            # Если файл присутствует в списке, удаляем его
-            if file_name in obj.file_storage:
-                obj.file_storage = [f for f in obj.file_storage if f != file_name]
-            else:
-                # Если файл не найден, можно либо ничего не делать, либо вызвать исключение
-                raise Exception(f"File '{file_name}' not found in file_storage.")
-        else:
-            raise Exception("File storage is empty or not set for this object.")
-
-        await self.db.commit()
-        await self.db.refresh(obj)
-
-        # Дополнительный запрос для загрузки филиалов
-        query = select(Object).options(selectinload(Object.branches)).where(Object.id == obj.id)
-        result = await self.db.execute(query)
-        return result.unique().scalar_one_or_none()
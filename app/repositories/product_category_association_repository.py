@@ -1,9 +1,11 @@
 import uuid
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import joinedload
-from typing import List
+from typing import Iterable, List, Tuple
 
 from app.db.models import ProductCategoryAssociation
 
@@ -54,9 +56,28 @@ class AssociationRepository:
         association = ProductCategoryAssociation(product_id=product_id, category_id=category_id)
         self.db.add(association)
         await self.db.commit()
-        await self.db.refresh(association)
         return association
 
+    async def add_associations(self, pairs: Iterable[Tuple[uuid.UUID, uuid.UUID]]) -> None:
+        """
+        Добавляет привязки (product_id, category_id) многострочным INSERT
+        в текущей транзакции, без коммита. Уже существующие привязки пропускаются.
+        """
+        values = [{"product_id": product_id, "category_id": category_id} for product_id, category_id in pairs]
+        if values:
+            await self.db.execute(
+                insert(ProductCategoryAssociation).on_conflict_do_nothing(
+                    constraint="uq_product_category_association_product_id_category_id"
+                ),
+                values,
+            )
+
+    async def delete_associations_by_product(self, product_id: uuid.UUID) -> None:
+        """Удаляет все привязки продукта в текущей транзакции, без коммита."""
+        await self.db.execute(
+            delete(ProductCategoryAssociation).where(ProductCategoryAssociation.product_id == product_id)
+        )
+
     async def delete_association(self, association) -> None:
         await self.db.delete(association)
         await self.db.commit()
@@ -1,54 +1,201 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from uuid import UUID
-from typing import List
+from typing import Iterable, List, Optional, Set, Tuple
 
-from app.db.models import Product
+from app.db.models import Product, ProductCategoryAssociation
+from app.core.images import image_url
 from app.core.settings import settings
+from app.repositories.category_repository import category_subtree_cte
+from app.repositories.loader import get_loader
+from app.repositories.product_category_association_repository import AssociationRepository
+from app.repositories.utils import versions_fingerprint
+from app.schemas.filter import FilterModel
+
+
+def product_filter_conditions(filters: FilterModel) -> list:
+    """
+    Преобразует фильтры в условия ILIKE по текстовым колонкам продукта
+    (используют GIN-индексы pg_trgm).
+    """
+    return [
+        getattr(Product, field).icontains(value, autoescape=True)
+        for field, value in filters.model_dump(exclude_none=True).items()
+    ]
 
 class ProductRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.settings = settings
+        self.loader = get_loader(db, Product, self.load_products)
+        self.association_repo = AssociationRepository(db)
+
+    async def load_products(self, product_ids: List[UUID]) -> List[Product]:
+        """Пакетная загрузка продуктов для загрузчика запроса."""
+        result = await self.db.execute(select(Product).where(Product.id.in_(product_ids)))
+        return result.scalars().all()
 
     async def get_all_products(self):
         result = await self.db.execute(select(Product))
         return result.scalars().all()
 
     async def get_product_by_id(self, product_id: UUID):
-        result = await self.db.execute(select(Product).where(Product.id == product_id))
-        product = result.scalar_one_or_none()
-        return product
+        return await self.loader.load(product_id)
+
+    async def get_existing_product_ids(self, product_ids: Iterable[UUID]) -> Set[UUID]:
+        """Возвращает те из product_ids, продукты с которыми существуют (без загрузки связей)."""
+        result = await self.db.execute(select(Product.id).where(Product.id.in_(list(product_ids))))
+        return set(result.scalars().all())
     
+    async def get_all_products_etag(self) -> Optional[str]:
+        """Отпечаток версий всех продуктов (для ETag) без загрузки самих продуктов."""
+        result = await self.db.execute(select(versions_fingerprint(Product.id, Product.version)))
+        return result.scalar_one()
+
+    async def get_product_version(self, product_id: UUID) -> Optional[int]:
+        result = await self.db.execute(select(Product.version).where(Product.id == product_id))
+        return result.scalar_one_or_none()
+
     async def get_products_by_ids(self, ids: List[UUID]):
-        result = await self.db.execute(select(Product).where(Product.id.in_(ids)))
-        return result.scalars().all()
+        return await self.loader.load_many(ids)
 
-    async def create_product(self, product: Product):
-        self.db.add(product)
-        await self.db.commit()
-        await self.db.refresh(product)
+    async def create_product(self, product: Product, category_ids: Optional[List[UUID]] = None) -> Product:
+        """
+        Создаёт продукт вместе с привязками к категориям в одной транзакции.
+        """
+        [product] = await self.create_products([(product, category_ids or [])])
         return product
 
-    async def update_product(self, product: Product, updates: dict):
+    async def create_products(self, items: List[Tuple[Product, List[UUID]]]) -> List[Product]:
+        """
+        Создаёт продукты с привязками к категориям в одной транзакции:
+        продукты и привязки вставляются многострочными INSERT, коммит один.
+        """
+        products = [product for product, _ in items]
+        self.db.add_all(products)
+        await self.db.flush()
+
+        await self.association_repo.add_associations(
+            (product.id, category_id)
+            for product, category_ids in items
+            for category_id in category_ids
+        )
+        await self.db.commit()
+        return products
+
+    async def update_product(
+        self, product: Product, updates: dict, category_ids: Optional[List[UUID]] = None
+    ) -> Product:
+        """
+        Обновляет поля продукта и, если переданы category_ids, заменяет его привязки
+        к категориям. Всё выполняется в одной транзакции.
+        """
         for key, value in updates.items():
             setattr(product, key, value)
+
+        if category_ids is not None:
+            await self.association_repo.delete_associations_by_product(product.id)
+            await self.association_repo.add_associations(
+                (product.id, category_id) for category_id in category_ids
+            )
+
+        await self.db.commit()
+        return product
+
+    async def save_product(self, product: Product) -> Product:
+        """
+        Фиксирует изменения продукта одним UPDATE. Продукт не перечитывается:
+        изменённые атрибуты уже в памяти, версию увеличивает триггер базы данных.
+        """
         await self.db.commit()
-        await self.db.refresh(product)
         return product
 
     async def delete_product(self, product: Product):
         await self.db.delete(product)
         await self.db.commit()
+        self.loader.clear(product.id)
+
+    async def update_image(self, product: Product, image_flag: bool, image_sha256: Optional[str] = None) -> Product:
+        """
+        Обновляет путь к изображению и его хеш-сумму для продукта.
+        """
+        self.set_image(product, image_flag, image_sha256)
+        return await self.save_product(product)
+
+    async def get_category_product_rows(
+        self, root_category_ids: List[UUID], filters: Optional[FilterModel] = None
+    ):
+        """
+        Возвращает плоские строки (category_id, id, name, description, image, country)
+        для продуктов из поддеревьев категорий root_category_ids, при наличии фильтров —
+        только удовлетворяющих им.
+        """
+        subtree = category_subtree_cte(root_category_ids)
+        query = (
+            select(
+                ProductCategoryAssociation.category_id,
+                Product.id,
+                Product.name,
+                Product.description,
+                Product.image,
+                Product.country,
+            )
+            .join(Product, Product.id == ProductCategoryAssociation.product_id)
+            .join(subtree, subtree.c.id == ProductCategoryAssociation.category_id)
+            .order_by(Product.name, Product.id)
+        )
+        if filters is not None:
+            query = query.where(*product_filter_conditions(filters))
+
+        result = await self.db.execute(query)
+        return result.all()
 
-    async def update_image(self, product: Product, image_flag: bool) -> Product:
+    async def get_filtered_products(
+        self, root_category_ids: List[UUID], filters: FilterModel
+    ) -> List[Product]:
         """
-        Обновляет путь к изображению для продукта.
+        Возвращает уникальные продукты из поддеревьев категорий root_category_ids,
+        удовлетворяющие фильтрам.
+        """
+        subtree = category_subtree_cte(root_category_ids)
+        result = await self.db.execute(
+            select(Product)
+            .where(
+                Product.id.in_(
+                    select(ProductCategoryAssociation.product_id)
+                    .join(subtree, subtree.c.id == ProductCategoryAssociation.category_id)
+                ),
+                *product_filter_conditions(filters)
+            )
+        )
+        return result.scalars().all()
+
+    async def get_category_products_page(
+        self, category_id: UUID, cursor: Optional[UUID], limit: int
+    ) -> List[Product]:
+        """
+        Возвращает страницу продуктов, напрямую привязанных к категории,
+        упорядоченных по ID (keyset-пагинация: продукты с ID больше cursor).
+        """
+        query = (
+            select(Product)
+            .join(ProductCategoryAssociation, ProductCategoryAssociation.product_id == Product.id)
+            .where(ProductCategoryAssociation.category_id == category_id)
+        )
+        if cursor:
+            query = query.where(Product.id > cursor)
+
+        result = await self.db.execute(query.order_by(Product.id).limit(limit))
+        return result.scalars().all()
+
+    def set_image(self, product: Product, image_flag: bool, image_sha256: Optional[str] = None) -> None:
+        """
+        Устанавливает путь к изображению продукта и его хеш-сумму без сохранения
+        (для записи в общей транзакции). Ссылка содержит версию изображения.
         """
         if image_flag:
-            product.image = f'{settings.API_URL}/products/{product.id}/image'
+            product.image = image_url("products", product.id, image_sha256)
+            product.image_sha256 = image_sha256
         else:
             product.image = None
-        await self.db.commit()
-        await self.db.refresh(product)
-        return product
\ No newline at end of file
+            product.image_sha256 = None
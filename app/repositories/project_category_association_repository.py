@@ -51,7 +51,6 @@ class ProjectCategoryAssociationRepository:
         association = ProjectCategoryAssociation(project_id=project_id, category_id=category_id)
         self.db.add(association)
         await self.db.commit()
-        await self.db.refresh(association)
         return association
 
     async def create_associations(
@@ -1,39 +1,58 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
 from uuid import UUID
 from typing import List, Optional
 
 from app.db.models import Project, ProjectCategoryAssociation
 from app.repositories.project_category_association_repository import ProjectCategoryAssociationRepository
+from app.repositories.loader import get_loader
+from app.repositories.utils import versions_fingerprint
 
 class ProjectRepository:
     def __init__(self, db: AsyncSession):
         self.db = db
         self.association_repo = ProjectCategoryAssociationRepository(db)
+        self.loader = get_loader(db, Project, self.load_projects)
 
-    async def get_all_projects(self) -> List[Project]:
-        """Получить все проекты."""
+    async def load_projects(self, project_ids: List[UUID]) -> List[Project]:
+        """
+        Пакетная загрузка проектов для загрузчика запроса (без связей: ProjectResponse
+        их не содержит, корневые категории запрашиваются через get_category_ids).
+        """
+        result = await self.db.execute(select(Project).where(Project.id.in_(project_ids)))
+        return result.scalars().all()
+
+    async def get_category_ids(self, project_id: UUID) -> List[UUID]:
+        """ID корневых категорий проекта."""
         result = await self.db.execute(
-            select(Project).options(joinedload(Project.categories))
+            select(ProjectCategoryAssociation.category_id)
+            .where(ProjectCategoryAssociation.project_id == project_id)
         )
-        return result.unique().scalars().all()
+        return result.scalars().all()
+
+    async def get_all_projects(self) -> List[Project]:
+        """Получить все проекты (без связей)."""
+        result = await self.db.execute(select(Project))
+        return result.scalars().all()
 
     async def get_project_by_id(self, project_id: UUID) -> Optional[Project]:
         """Получить проект по ID."""
-        result = await self.db.execute(
-            select(Project)
-            .options(joinedload(Project.categories)
-                     .joinedload(ProjectCategoryAssociation.category))
-            .where(Project.id == project_id)
-        )
-        return result.unique().scalar_one_or_none()
+        return await self.loader.load(project_id)
+
+    async def get_all_projects_etag(self) -> Optional[str]:
+        """Отпечаток версий всех проектов (для ETag) без загрузки самих проектов."""
+        result = await self.db.execute(select(versions_fingerprint(Project.id, Project.version)))
+        return result.scalar_one()
+
+    async def get_project_version(self, project_id: UUID) -> Optional[int]:
+        """Агрегированная версия проекта и дерева его категорий."""
+        result = await self.db.execute(select(Project.version).where(Project.id == project_id))
+        return result.scalar_one_or_none()
 
     async def create_project(self, project: Project) -> Project:
         """Создать проект и ассоциации."""
         self.db.add(project)
         await self.db.commit()
-        await self.db.refresh(project)
 
         return project
 
@@ -42,6 +61,7 @@ class ProjectRepository:
         await self.association_repo.delete_associations_by_project(project.id)
         await self.db.delete(project)
         await self.db.commit()
+        self.loader.clear(project.id)
 
     async def update_project(
         self, project: Project, updates: dict) -> Project:
@@ -49,6 +69,5 @@ class ProjectRepository:
         for key, value in updates.items():
             setattr(project, key, value)
         await self.db.commit()
-        await self.db.refresh(project)
 
         return project
@@ -0,0 +1,102 @@
+import re
+
+from sqlalchemy import String, func, literal, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from uuid import UUID
+from typing import List, Optional
+
+from app.db.models import Category, Object, Product, ProductCategoryAssociation
+from app.repositories.category_repository import category_subtree_cte
+from app.schemas.enums import SearchResultType
+
+
+def build_prefix_tsquery(text: str) -> Optional[str]:
+    """
+    Преобразует пользовательский ввод в tsquery, где каждое слово ищется по префиксу
+    (для подсказок при наборе). Возвращает None, если в строке нет слов.
+    """
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+class SearchRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def search(
+        self,
+        project_id: UUID,
+        root_category_ids: List[UUID],
+        text: str,
+        limit: int,
+    ):
+        """
+        Полнотекстовый поиск по объектам, продуктам и категориям проекта,
+        отсортированный по релевантности.
+
+        :param project_id: ID проекта, объекты которого участвуют в поиске.
+        :param root_category_ids: Корневые категории проекта (поиск идёт по их поддеревьям).
+        :param text: Поисковая строка.
+        :param limit: Максимальное количество результатов.
+        :return: Строки (id, type, name, description, rank).
+        """
+        tsquery_text = build_prefix_tsquery(text)
+        if tsquery_text is None:
+            return []
+
+        query = func.to_tsquery("simple", tsquery_text)
+        subtree = category_subtree_cte(root_category_ids)
+
+        objects = (
+            select(
+                Object.id,
+                literal(SearchResultType.OBJECT.value).label("type"),
+                Object.name,
+                Object.description,
+                func.ts_rank(Object.search_vector, query).label("rank"),
+            )
+            .where(
+                Object.project_id == project_id,
+                Object.search_vector.bool_op("@@")(query),
+            )
+        )
+        products = (
+            select(
+                Product.id,
+                literal(SearchResultType.PRODUCT.value).label("type"),
+                Product.name,
+                Product.description,
+                func.ts_rank(Product.search_vector, query).label("rank"),
+            )
+            .where(
+                Product.id.in_(
+                    select(ProductCategoryAssociation.product_id)
+                    .join(subtree, subtree.c.id == ProductCategoryAssociation.category_id)
+                ),
+                Product.search_vector.bool_op("@@")(query),
+            )
+        )
+        categories = (
+            select(
+                Category.id,
+                literal(SearchResultType.CATEGORY.value).label("type"),
+                Category.name,
+                literal(None, String).label("description"),
+                func.ts_rank(Category.search_vector, query).label("rank"),
+            )
+            .where(
+                Category.id.in_(select(subtree.c.id)),
+                Category.search_vector.bool_op("@@")(query),
+            )
+        )
+
+        results = union_all(objects, products, categories).subquery()
+        result = await self.db.execute(
+            select(results)
+            .order_by(results.c.rank.desc(), results.c.name)
+            .limit(limit)
+        )
+        return result.all()
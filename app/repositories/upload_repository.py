@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from uuid import UUID
+from typing import Iterable, List, Optional, Set
+
+from app.core.settings import settings
+from app.db.models import ObjectUpload
+
+
+def upload_expiry() -> datetime:
+    """Срок жизни загрузки, отсчитываемый от текущего момента."""
+    return datetime.now(timezone.utc) + timedelta(seconds=settings.UPLOAD_EXPIRES)
+
+
+class UploadRepository:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_upload(self, upload: ObjectUpload) -> ObjectUpload:
+        """
+        Записывает загрузку и фиксирует транзакцию. Значения по умолчанию (смещение,
+        время создания) возвращаются тем же INSERT, загрузка не перечитывается.
+        """
+        upload.expires_at = upload_expiry()
+        self.db.add(upload)
+        await self.db.commit()
+        return upload
+
+    async def get_upload(self, object_id: UUID, upload_id: UUID) -> Optional[ObjectUpload]:
+        result = await self.db.execute(
+            select(ObjectUpload).where(
+                ObjectUpload.id == upload_id,
+                ObjectUpload.object_id == object_id,
+                ObjectUpload.expires_at > func.now(),
+            )
+        )
+        return result.scalar_one_or_none()
+
+    async def get_existing_upload_ids(self, upload_ids: Iterable[UUID]) -> Set[UUID]:
+        result = await self.db.execute(select(ObjectUpload.id).where(ObjectUpload.id.in_(list(upload_ids))))
+        return set(result.scalars().all())
+
+    async def lock_upload(self, object_id: UUID, upload_id: UUID) -> Optional[ObjectUpload]:
+        """
+        Загружает и блокирует загрузку до конца транзакции.
+        Если загрузку уже блокирует другой запрос, сразу завершается ошибкой (NOWAIT).
+        """
+        result = await self.db.execute(
+            select(ObjectUpload)
+            .where(
+                ObjectUpload.id == upload_id,
+                ObjectUpload.object_id == object_id,
+                ObjectUpload.expires_at > func.now(),
+            )
+            .with_for_update(nowait=True)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one_or_none()
+
+    async def advance_offset(self, upload: ObjectUpload, offset: int) -> bool:
+        """
+        Сдвигает смещение и продлевает срок загрузки, только если смещение в базе всё ещё
+        равно upload.upload_offset (его не сдвинул параллельный запрос). Строка остаётся
+        заблокированной до конца транзакции.
+
+        :return: False, если смещение изменилось или загрузки больше нет.
+        """
+        result = await self.db.execute(
+            update(ObjectUpload)
+            .where(ObjectUpload.id == upload.id, ObjectUpload.upload_offset == upload.upload_offset)
+            .values(upload_offset=offset, expires_at=upload_expiry())
+            .returning(ObjectUpload.id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def delete_upload(self, upload: ObjectUpload):
+        await self.db.delete(upload)
+        await self.db.flush()
+
+    async def delete_expired_uploads(self, limit: int) -> List[UUID]:
+        """
+        Удаляет до limit просроченных загрузок и возвращает их id (части удаляются после фиксации).
+        Загрузки, которые в этот момент дописываются, пропускаются.
+        """
+        expired = (
+            select(ObjectUpload.id)
+            .where(ObjectUpload.expires_at <= func.now())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        result = await self.db.execute(
+            delete(ObjectUpload).where(ObjectUpload.id.in_(expired.scalar_subquery())).returning(ObjectUpload.id)
+        )
+        return result.scalars().all()
@@ -0,0 +1,29 @@
+from sqlalchemy import String, func, inspect, literal
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm.attributes import set_committed_value
+
+
+def versions_fingerprint(id_column, version_column):
+    """
+    Агрегатное SQL-выражение: md5 от упорядоченного списка пар id:version.
+
+    Меняется при любом изменении, добавлении или удалении строки из выборки,
+    поэтому подходит для ETag списков без загрузки самих строк.
+    """
+    return func.md5(
+        func.string_agg(
+            func.concat(id_column, ":", version_column),
+            aggregate_order_by(literal(",", String), id_column),
+        )
+    )
+
+
+def mark_loaded_empty(instance, *relationships: str):
+    """
+    Помечает незагруженные связи только что созданной записи загруженными и пустыми,
+    чтобы для ответа не выполнялись лишние запросы (и ленивая загрузка вне async-контекста).
+    """
+    unloaded = inspect(instance).unloaded
+    for name in relationships:
+        if name in unloaded:
+            set_committed_value(instance, name, [])
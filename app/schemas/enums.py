@@ -3,4 +3,15 @@ from enum import Enum
 class StatusEnum(int, Enum):
     DAMAGED = 1
     UNDER_ATTACK = 2
-    FUNCTIONAL = 3
\ No newline at end of file
+    FUNCTIONAL = 3
+
+class SearchResultType(str, Enum):
+    OBJECT = "object"
+    PRODUCT = "product"
+    CATEGORY = "category"
+
+
+class CatalogFormat(str, Enum):
+    CSV = "csv"
+    NDJSON = "ndjson"
+    PARQUET = "parquet"
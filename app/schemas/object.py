@@ -1,3 +1,4 @@
+from datetime import datetime
 from pydantic import BaseModel, HttpUrl
 from typing import Optional, List
 from uuid import UUID
@@ -56,7 +57,6 @@ class ObjectUpdate(BaseModel):
     links: Optional[List[HttpUrl]] = None
     icon: Optional[bool] = None
     image: Optional[str] = None
-    file_storage: Optional[List[str]] = None
     description: Optional[str] = None
     parent_id: Optional[UUID] = None
 
@@ -80,5 +80,18 @@ class ObjectChainResponse(ObjectSmallResponse):
 class AllObjectChainResponse(BaseModel):
     objects: List[ObjectChainResponse]
 
+class ObjectFileResponse(BaseModel):
+    name: str
+    size: int
+    sha256: str
+    mime_type: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class ObjectFilesResponse(BaseModel):
+    files: List[ObjectFileResponse]
+
 class AllSmallObjectsResponse(BaseModel):
     objects: List[ObjectSmallResponse]
\ No newline at end of file
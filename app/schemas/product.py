@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from uuid import UUID
 from typing import List, Optional
 
@@ -30,3 +30,45 @@ class ProductUpdate(BaseModel):
 class ProductIds(BaseModel):
     ids: List[UUID]
 
+class ProductBulkItem(BaseModel):
+    """Продукт для массового создания. Изображение загружается отдельно, лишние поля отклоняются."""
+    name: str
+    description: Optional[str] = None
+    country: Optional[str] = None
+    categories: List[UUID]
+
+    class Config:
+        extra = "forbid"
+
+class ProductBulkCreate(BaseModel):
+    products: List[ProductBulkItem]
+
+class CatalogRecord(BaseModel):
+    """Строка каталога для импорта/экспорта: категории задаются путями `Root/Sub/Leaf`."""
+    id: Optional[UUID] = None
+    name: str
+    description: Optional[str] = None
+    country: Optional[str] = None
+    categories: List[str]
+
+    @field_validator("id", "description", "country", mode="before")
+    @classmethod
+    def empty_to_none(cls, value):
+        # В CSV отсутствующее значение приходит пустой строкой
+        return value or None
+
+    @field_validator("categories", mode="before")
+    @classmethod
+    def split_categories(cls, value):
+        # В CSV несколько путей категорий перечисляются через ";"
+        if isinstance(value, str):
+            value = value.split(";")
+        paths = [
+            "/".join(part.strip() for part in path.split("/") if part.strip())
+            for path in value or []
+        ]
+        return [path for path in paths if path]
+
+class CatalogImportResponse(BaseModel):
+    products: int
+    categories_created: int
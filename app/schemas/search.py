@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from uuid import UUID
+from typing import Optional, List
+
+from app.schemas.enums import SearchResultType
+
+
+class SearchResult(BaseModel):
+    id: UUID
+    type: SearchResultType
+    name: str
+    description: Optional[str] = None
+    rank: float
+
+    class Config:
+        from_attributes = True
+
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
@@ -1,8 +1,9 @@
 from uuid import UUID
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 from app.schemas.category import CategoryBase
+from app.schemas.product import ProductResponse
 
 class TreeResponse(CategoryBase):
     id: UUID
@@ -17,3 +18,16 @@ class AllTreeResponse(BaseModel):
     class Config:
         exclude_none = True
 
+
+class TreeNodeResponse(CategoryBase):
+    id: UUID
+    descendant_categories_count: int
+    descendant_products_count: int
+
+    class Config:
+        from_attributes = True
+
+class TreeChildrenResponse(TreeNodeResponse):
+    children: List[TreeNodeResponse]
+    products: List[ProductResponse]
+    next_cursor: Optional[UUID] = None  # ID последнего продукта страницы, если есть следующая
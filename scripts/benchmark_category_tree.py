@@ -0,0 +1,116 @@
+"""
+Микробенчмарк сборки дерева категорий (GET /tree/project/{id}).
+
+Сравнивает прежнюю рекурсивную сборку из ORM-графа (каждая привязка продукта
+валидируется заново) с build_category_trees, которая собирает деревья итеративно из плоских
+строк и валидирует каждый продукт один раз. Данные синтетические и создаются в памяти,
+база не нужна; генератор случайных чисел фиксирован, поэтому замеры повторяемы.
+
+Запуск из корня репозитория:
+
+    python -m scripts.benchmark_category_tree
+    python -m scripts.benchmark_category_tree --products 50000 --categories 2000 --links 3
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+
+from collections import namedtuple
+from types import SimpleNamespace
+from typing import Callable, List
+
+from app.api.routes.utils import build_category_trees
+from app.schemas.product import ProductResponse
+from app.schemas.tree import TreeResponse
+
+
+# Строки в форме ответов CategoryRepository.get_subtree_rows и ProductRepository.get_category_product_rows
+CategoryRow = namedtuple("CategoryRow", "id name parent_id")
+ProductRow = namedtuple("ProductRow", "category_id id name description image country")
+
+
+def make_catalog(products: int, categories: int, links: int):
+    """Одно случайное дерево категорий и продукты, привязанные к links категориям каждый."""
+    rng = random.Random(1)
+    category_rows = [CategoryRow(uuid.uuid4(), "root", None)]
+    for number in range(categories):
+        category_rows.append(CategoryRow(uuid.uuid4(), f"category {number}", rng.choice(category_rows).id))
+
+    product_rows = []
+    for number in range(products):
+        product_id = uuid.uuid4()
+        for category in rng.sample(category_rows, links):
+            product_rows.append(
+                ProductRow(category.id, product_id, f"product {number}", "description", None, "RU")
+            )
+    return category_rows, product_rows
+
+
+def make_orm_graph(category_rows: List[CategoryRow], product_rows: List[ProductRow]):
+    """Граф в форме прежней загрузки: категории с children и привязками products[].product."""
+    nodes = {
+        row.id: SimpleNamespace(id=row.id, name=row.name, children=[], products=[]) for row in category_rows
+    }
+    for row in category_rows:
+        if row.parent_id is not None:
+            nodes[row.parent_id].children.append(nodes[row.id])
+    products = {}
+    for row in product_rows:
+        product = products.setdefault(row.id, SimpleNamespace(**row._asdict()))
+        nodes[row.category_id].products.append(SimpleNamespace(product=product))
+    return nodes[category_rows[0].id]
+
+
+def map_all_category(category) -> TreeResponse:
+    """Прежняя рекурсивная сборка дерева (до перехода на плоские строки)."""
+    products = [ProductResponse.model_validate(link.product) for link in category.products]
+    return TreeResponse(
+        id=category.id,
+        name=category.name,
+        objects=[map_all_category(child) for child in category.children] + products,
+    )
+
+
+def best_of(repeat: int, run: Callable[[], object]) -> float:
+    """Лучшее время из repeat запусков (секунды)."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark building the category tree response")
+    parser.add_argument("--products", type=int, default=50_000, help="number of products")
+    parser.add_argument("--categories", type=int, default=2_000, help="number of non-root categories")
+    parser.add_argument("--links", type=int, default=3, help="categories per product")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per variant, the best one is reported")
+    args = parser.parse_args()
+
+    category_rows, product_rows = make_catalog(args.products, args.categories, args.links)
+    root = make_orm_graph(category_rows, product_rows)
+    root_ids = [category_rows[0].id]
+
+    recursive = best_of(args.repeat, lambda: map_all_category(root))
+    iterative = best_of(args.repeat, lambda: build_category_trees(root_ids, category_rows, product_rows))
+    print(
+        f"{args.products} products x {args.links} categories, {len(category_rows)} categories: "
+        f"recursive {recursive * 1000:.0f} ms, iterative {iterative * 1000:.0f} ms, "
+        f"x{recursive / iterative:.1f}"
+    )
+
+    # Глубокое дерево: рекурсивная сборка упирается в предел рекурсии, итеративная — нет
+    deep = [CategoryRow(uuid.uuid4(), "category 0", None)]
+    for number in range(1, sys.getrecursionlimit() * 2):
+        deep.append(CategoryRow(uuid.uuid4(), f"category {number}", deep[-1].id))
+    deep_tree = best_of(1, lambda: build_category_trees([deep[0].id], deep, []))
+    print(f"depth {len(deep)}: iterative {deep_tree * 1000:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
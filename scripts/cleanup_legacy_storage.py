@@ -0,0 +1,139 @@
+"""
+Удаление прежней раскладки хранилища после применения миграций.
+
+Миграции копируют файлы в новую раскладку и не удаляют исходные: файловая система
+не откатывается вместе с транзакцией миграции. Скрипт запускается после того, как миграции
+зафиксированы, и удаляет исходный файл, только если его копия на месте:
+
+- e5f2a8c14b69: каталоги STORAGE_DIR/objects/<id>/files (содержимое перенесено в blobs/);
+- 2c9d4f6b8e15: изображения без версии objects|products/<id>/image* (скопированы
+  в каталог версии <id>/<sha256>/, удаляются через хранилище приложения, в том числе S3).
+
+Запуск из корня репозитория (сначала без удаления, затем с ним):
+
+    python -m scripts.cleanup_legacy_storage --dry-run
+    python -m scripts.cleanup_legacy_storage
+"""
+import argparse
+import asyncio
+import os
+import posixpath
+import shutil
+import sys
+
+from typing import Dict, List, Set
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import select
+
+from app.core.blobs import blob_key
+from app.core.settings import settings
+from app.core.storage import close_storage, get_storage
+from app.db.models import Object, ObjectFile, Product
+from app.db.session import async_engine, async_session
+
+
+CONTENT_ADDRESSED_FILES = "e5f2a8c14b69"
+VERSIONED_IMAGES = "2c9d4f6b8e15"
+
+
+async def applied_revisions() -> Set[str]:
+    """Ревизии, входящие в историю текущей версии базы."""
+    async with async_engine.connect() as connection:
+        heads = await connection.run_sync(lambda c: MigrationContext.configure(c).get_current_heads())
+    script = ScriptDirectory.from_config(Config("alembic.ini"))
+    return {revision.revision for head in heads for revision in script.iterate_revisions(head, "base")}
+
+
+async def cleanup_object_files(dry_run: bool) -> List[str]:
+    """
+    Удаляет каталоги objects/<id>/files, все файлы которых есть в object_files
+    и чьё содержимое лежит в хранилище. Возвращает пропущенные каталоги.
+    """
+    objects_dir = os.path.join(settings.STORAGE_DIR, "objects")
+    if not os.path.isdir(objects_dir):
+        return []
+
+    async with async_session() as db:
+        result = await db.execute(select(ObjectFile.object_id, ObjectFile.name, ObjectFile.sha256))
+        hashes: Dict[str, Dict[str, str]] = {}
+        for object_id, name, sha256 in result:
+            hashes.setdefault(str(object_id), {})[name] = sha256
+
+    storage = get_storage()
+    skipped = []
+    for object_id in sorted(os.listdir(objects_dir)):
+        files_dir = os.path.join(objects_dir, object_id, "files")
+        if not os.path.isdir(files_dir):
+            continue
+        object_hashes = hashes.get(object_id, {})
+        copied = [
+            name in object_hashes and await storage.stat(blob_key(object_hashes[name])) is not None
+            for name in os.listdir(files_dir)
+        ]
+        if not all(copied):
+            skipped.append(files_dir)
+            continue
+        print(f"remove {files_dir}")
+        if not dry_run:
+            shutil.rmtree(files_dir, ignore_errors=True)
+    return skipped
+
+
+async def cleanup_unversioned_images(dry_run: bool) -> List[str]:
+    """
+    Удаляет изображения и уменьшенные копии без версии ({table}/<id>/image*), если файл
+    с тем же именем есть в каталоге текущей версии. Возвращает пропущенные ключи.
+    """
+    async with async_session() as db:
+        rows = [
+            (model.__tablename__, entity_id, image_sha256)
+            for model in (Object, Product)
+            for entity_id, image_sha256 in await db.execute(
+                select(model.id, model.image_sha256).where(model.image_sha256.is_not(None))
+            )
+        ]
+
+    storage = get_storage()
+    skipped = []
+    for table, entity_id, image_sha256 in rows:
+        entity_prefix = f"{table}/{entity_id}/"
+        for key in await storage.list(f"{entity_prefix}image"):
+            name = posixpath.basename(key)
+            if key != f"{entity_prefix}{name}":
+                continue
+            if await storage.stat(f"{entity_prefix}{image_sha256}/{name}") is None:
+                skipped.append(key)
+                continue
+            print(f"remove {key}")
+            if not dry_run:
+                await storage.delete(key)
+    return skipped
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description="Remove the storage layout replaced by migrations")
+    parser.add_argument("--dry-run", action="store_true", help="only print what would be removed")
+    args = parser.parse_args()
+
+    revisions = await applied_revisions()
+    skipped = []
+    if CONTENT_ADDRESSED_FILES in revisions:
+        skipped += await cleanup_object_files(args.dry_run)
+    else:
+        print(f"Migration {CONTENT_ADDRESSED_FILES} is not applied, object files are left in place")
+    if VERSIONED_IMAGES in revisions:
+        skipped += await cleanup_unversioned_images(args.dry_run)
+    else:
+        print(f"Migration {VERSIONED_IMAGES} is not applied, unversioned images are left in place")
+
+    await close_storage()
+    await async_engine.dispose()
+    for path in skipped:
+        print(f"skipped {path}: not every file has a copy in the new layout")
+    return 1 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
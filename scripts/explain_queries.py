@@ -0,0 +1,168 @@
+"""
+Проверка планов основных запросов репозиториев.
+
+Каждый метод репозитория выполняется на реальной базе, выданные им SQL-запросы
+перехватываются и повторяются с EXPLAIN. Для указанных таблиц в плане не должно быть
+последовательного сканирования. Последовательное сканирование запрещается
+(enable_seqscan = off), поэтому и на маленькой базе разработчика планировщик
+выбирает его, только если подходящего индекса нет.
+
+Запуск из корня репозитория (база с применёнными миграциями и хотя бы одним
+проектом, объектом, категорией и продуктом):
+
+    python -m scripts.explain_queries
+"""
+import asyncio
+import json
+import sys
+
+from dataclasses import dataclass
+from typing import Awaitable, Callable, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.models import Blob, Category, Object, ObjectFile, Product, Project
+from app.db.session import async_engine, async_session
+from app.repositories.category_repository import CategoryRepository
+from app.repositories.chain_repository import ChainRepository
+from app.repositories.file_repository import FileRepository
+from app.repositories.object_repository import ObjectRepository
+from app.repositories.product_category_association_repository import AssociationRepository
+from app.repositories.product_repository import ProductRepository
+from app.repositories.project_category_association_repository import ProjectCategoryAssociationRepository
+from app.repositories.project_repository import ProjectRepository
+
+
+@dataclass
+class Samples:
+    project_id: UUID
+    object: Object
+    category_id: UUID
+    product_id: UUID
+    sha256: str
+
+
+@dataclass
+class Case:
+    name: str
+    tables: List[str]  # Таблицы, которые должны читаться по индексу
+    run: Callable[[AsyncSession, Samples], Awaitable]
+
+
+async def delete_blob(db: AsyncSession, samples: Samples):
+    """
+    Удаление содержимого. Строку blobs внешний ключ object_files.sha256 проверяет
+    запросом к object_files (триггер ссылочной целостности, в EXPLAIN DELETE его нет),
+    поэтому тот же запрос выполняется явно.
+    """
+    await FileRepository(db).delete_unreferenced_blobs([samples.sha256])
+    await db.execute(
+        select(ObjectFile.id).where(ObjectFile.sha256 == samples.sha256).with_for_update(key_share=True)
+    )
+
+
+CASES = [
+    Case("project by id", ["project_category_association"],
+         lambda db, s: ProjectRepository(db).load_projects([s.project_id])),
+    Case("project associations", ["project_category_association"],
+         lambda db, s: ProjectCategoryAssociationRepository(db).get_associations_by_project(s.project_id)),
+    Case("object by id", ["objects", "object_files"],
+         lambda db, s: ObjectRepository(db).load_objects([s.object.id])),
+    Case("object etag", ["objects"],
+         lambda db, s: ObjectRepository(db).get_object_etag(s.object.id)),
+    Case("objects in bounds", ["objects"],
+         lambda db, s: ObjectRepository(db).get_objects_within_bounds(s.object.x, s.object.y, s.project_id)),
+    Case("project files", ["objects", "object_files"],
+         lambda db, s: FileRepository(db).get_project_files(s.project_id)),
+    Case("chains by product", ["chains"],
+         lambda db, s: ChainRepository(db).get_chains_by_product_id(s.product_id)),
+    Case("objects by product", ["chains"],
+         lambda db, s: ChainRepository(db).get_objects_by_product_id(s.product_id)),
+    Case("category children", ["categories"],
+         lambda db, s: CategoryRepository(db).get_child_nodes(s.category_id)),
+    Case("category subtree", ["categories"],
+         lambda db, s: CategoryRepository(db).get_subtree_rows([s.category_id])),
+    Case("category products", ["product_category_association"],
+         lambda db, s: ProductRepository(db).get_category_product_rows([s.category_id])),
+    Case("product associations", ["product_category_association"],
+         lambda db, s: AssociationRepository(db).get_associations_by_product(s.product_id)),
+    Case("blob delete", ["blobs", "object_files"], delete_blob),
+]
+
+
+async def load_samples(db: AsyncSession) -> Optional[Samples]:
+    project_id = await db.scalar(select(Project.id).limit(1))
+    obj = await db.scalar(select(Object).where(Object.project_id.is_not(None)).limit(1))
+    category_id = await db.scalar(select(Category.id).limit(1))
+    product_id = await db.scalar(select(Product.id).limit(1))
+    # Для плана удаления содержимого строка не обязана существовать
+    sha256 = await db.scalar(select(Blob.sha256).limit(1)) or "0" * 64
+    if None in (project_id, obj, category_id, product_id):
+        return None
+    return Samples(obj.project_id, obj, category_id, product_id, sha256)
+
+
+async def capture_statements(db: AsyncSession, case: Case, samples: Samples) -> List[Tuple[str, tuple]]:
+    """Выполняет метод репозитория и возвращает выданные им запросы с параметрами."""
+    statements = []
+
+    def remember(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", remember)
+    try:
+        await case.run(db, samples)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", remember)
+    return statements
+
+
+def plan_nodes(node: dict):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+async def explain(db: AsyncSession, statement: str, parameters) -> dict:
+    connection = await db.connection()
+    result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+    plan = result.scalar_one()
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+
+
+async def check_case(db: AsyncSession, case: Case, samples: Samples) -> List[str]:
+    """Возвращает описания последовательных сканирований проверяемых таблиц."""
+    problems = []
+    for statement, parameters in await capture_statements(db, case, samples):
+        plan = await explain(db, statement, parameters)
+        for node in plan_nodes(plan):
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in case.tables:
+                problems.append(f"Seq Scan on {node['Relation Name']}: {statement.splitlines()[0][:120]}")
+    return problems
+
+
+async def main() -> int:
+    async with async_session() as db:
+        samples = await load_samples(db)
+        if samples is None:
+            print("Database has no sample project/object/category/product, nothing to check")
+            return 1
+
+        await db.execute(text("SET LOCAL enable_seqscan = off"))
+        failed = 0
+        for case in CASES:
+            problems = await check_case(db, case, samples)
+            print(f"{'FAIL' if problems else 'ok  '} {case.name}")
+            for problem in problems:
+                print(f"     {problem}")
+            failed += bool(problems)
+        await db.rollback()
+
+    await async_engine.dispose()
+    print(f"{len(CASES) - failed}/{len(CASES)} queries use indexes")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
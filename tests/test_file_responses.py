@@ -0,0 +1,86 @@
+"""
+Файлы и изображения из локального хранилища отдаются со строгим ETag по хеш-сумме
+содержимого; повторный запрос с этим ETag в If-None-Match получает 304 без тела.
+"""
+import io
+import uuid
+
+import pytest
+
+from PIL import Image
+
+
+pytestmark = pytest.mark.anyio
+
+
+def jpeg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "red").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+async def object_id(client):
+    """Объект с файлом notes.txt и изображением."""
+    project = (await client.post("/projects/", json={"name": f"project {uuid.uuid4()}"})).json()
+    form = {"x": "1", "y": "1", "name": "object", "area": "1", "object_status": "1"}
+    obj = (await client.post(
+        f"/objects/{project['id']}", data=form, files={"files": ("notes.txt", b"notes", "text/plain")}
+    )).json()
+    response = await client.post(f"/objects/{obj['id']}/image", files={"file": ("image.jpg", jpeg(), "image/jpeg")})
+    assert response.status_code == 201, response.text
+    return obj["id"]
+
+
+@pytest.fixture
+async def product_id(client):
+    """Продукт с изображением."""
+    project = (await client.post("/projects/", json={"name": f"project {uuid.uuid4()}"})).json()
+    category = (await client.post("/categories/", json={"name": "category", "id": project["id"]})).json()
+    product = (await client.post("/products/", data={"name": "product", "categories": [category["id"]]})).json()
+    response = await client.post(
+        f"/products/{product['id']}/image", files={"file": ("image.jpg", jpeg(), "image/jpeg")}
+    )
+    assert response.status_code == 201, response.text
+    return product["id"]
+
+
+async def assert_not_modified(client, url: str):
+    response = await client.get(url)
+    assert response.status_code == 200, response.text
+    etag = response.headers["etag"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        cached = await client.get(url, headers={"If-None-Match": if_none_match})
+        assert cached.status_code == 304, if_none_match
+        assert cached.headers["etag"] == etag and cached.content == b""
+        assert cached.headers.get("cache-control") == response.headers.get("cache-control")
+
+    changed = await client.get(url, headers={"If-None-Match": '"other"'})
+    assert changed.status_code == 200 and changed.content == response.content
+
+
+async def test_object_file_not_modified(client, object_id):
+    await assert_not_modified(client, f"/objects/{object_id}/files/notes.txt")
+
+
+async def test_object_image_not_modified(client, object_id):
+    await assert_not_modified(client, f"/objects/{object_id}/image")
+
+
+async def test_product_image_not_modified(client, product_id):
+    await assert_not_modified(client, f"/products/{product_id}/image")
+
+
+async def test_accel_redirect_keeps_checksum_etag(client, object_id, monkeypatch):
+    from app.core.settings import settings
+
+    monkeypatch.setattr(settings, "ACCEL_REDIRECT_LOCATION", "/protected-storage/")
+    url = f"/objects/{object_id}/files/notes.txt"
+
+    response = await client.get(url)
+    assert response.status_code == 200 and response.content == b""
+    assert response.headers["x-accel-redirect"].startswith("/protected-storage/blobs/")
+
+    cached = await client.get(url, headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304 and "x-accel-redirect" not in cached.headers
@@ -0,0 +1,177 @@
+"""
+Маршруты загружают только те связи и строки, которые отдают в ответе.
+
+Связи всех сущностей, прочитанных из базы за время запроса, сравниваются с полями
+response_model маршрута: загруженная, но не попадающая в ответ связь — лишний запрос
+(или JOIN). Каждая прочитанная строка должна попасть в ответ (или быть указана в запросе):
+так ловится, например, selectinload цепочек всех продуктов ради цепочек одного.
+"""
+import json
+import typing
+import uuid
+
+import pytest
+
+from pydantic import BaseModel
+from sqlalchemy import event, inspect
+from starlette.routing import Match
+
+from app.db.models import Base, Category, Chain, Object, ObjectFile, Product, Project
+
+
+pytestmark = pytest.mark.anyio
+
+# Поля ответа, которые собираются из связей с другим именем: поле -> путь по связям
+FIELD_RELATIONSHIPS = {
+    "file_storage": ("files",),
+    "chains": ("chains_source", "target_object"),
+}
+
+# Сущности, которые попадают в ответ не по id, а по другому полю
+RETURNED_AS = {ObjectFile: "name"}
+
+
+def nested_model(annotation) -> typing.Optional[type]:
+    """Модель pydantic внутри аннотации поля (List[...], Optional[...])."""
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for argument in typing.get_args(annotation):
+        model = nested_model(argument)
+        if model is not None:
+            return model
+    return None
+
+
+def serialized_relationships(model: typing.Optional[type], entity: type) -> typing.Set[typing.Tuple[type, str]]:
+    """Связи (класс, имя), которые читает ответ model, собранный из сущностей entity."""
+    serialized = set()
+    if model is None:
+        # Ответ без модели (удаление, выгрузка файлом) связей не читает
+        return serialized
+    for name, field in model.model_fields.items():
+        target = entity
+        path = FIELD_RELATIONSHIPS.get(name, (name,))
+        if path[0] in inspect(entity).relationships:
+            for key in path:
+                serialized.add((target, key))
+                target = inspect(target).relationships[key].mapper.class_
+        nested = nested_model(field.annotation)
+        if nested is not None:
+            serialized |= serialized_relationships(nested, target)
+    return serialized
+
+
+def route_response_model(app, method: str, path: str) -> typing.Optional[type]:
+    scope = {"type": "http", "method": method, "path": path}
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.response_model
+    raise LookupError(f"{method} {path}")
+
+
+@pytest.fixture
+def loaded_entities():
+    """Сущности, прочитанные из базы (события load и refresh)."""
+    entities = []
+
+    def record(target, *args):
+        entities.append(target)
+
+    event.listen(Base, "load", record, propagate=True)
+    event.listen(Base, "refresh", record, propagate=True)
+    yield entities
+    event.remove(Base, "load", record)
+    event.remove(Base, "refresh", record)
+
+
+@pytest.fixture
+async def catalog(client):
+    """
+    Проект с категорией, двумя объектами (второй — филиал первого с файлом) и двумя продуктами,
+    каждый с цепочкой между объектами.
+    """
+    project = (await client.post("/projects/", json={"name": f"project {uuid.uuid4()}"})).json()
+    category = (await client.post("/categories/", json={"name": "category", "id": project["id"]})).json()
+    form = {"x": "1", "y": "1", "name": "object", "area": "1", "object_status": "1"}
+    source = (await client.post(f"/objects/{project['id']}", data=form)).json()
+    target = (await client.post(
+        f"/objects/{project['id']}",
+        data={**form, "parent_id": source["id"]},
+        files={"files": ("notes.txt", b"notes", "text/plain")},
+    )).json()
+    product = (await client.post("/products/", data={"name": "product", "categories": [category["id"]]})).json()
+    other_product = (await client.post("/products/", data={"name": "other", "categories": [category["id"]]})).json()
+    chain, _ = [
+        (await client.post("/chains/", json={
+            "source_object_id": source["id"], "target_object_id": target["id"], "product_id": product_id,
+        })).json()
+        for product_id in (product["id"], other_product["id"])
+    ]
+    return {
+        "project": project["id"], "category": category["id"], "object": source["id"],
+        "branch": target["id"], "product": product["id"], "chain": chain["id"],
+    }
+
+
+ENDPOINTS = [
+    ("GET", "/projects/{project}", {}),
+    ("PUT", "/projects/{project}", {"json": {"name": "renamed"}}),
+    ("GET", "/objects/{object}", {}),
+    ("PUT", "/objects/{object}", {"data": {"object_data": json.dumps({"name": "renamed"})}}),
+    ("POST", "/objects/{project}", {"data": {"x": "2", "y": "2", "name": "o", "area": "1", "object_status": "1"}}),
+    ("POST", "/objects/check_location/{project}", {"json": {"x": 1, "y": 1}}),
+    ("GET", "/objects/{branch}/files", {}),
+    ("GET", "/products/{product}", {}),
+    ("PUT", "/products/{product}", {"data": {"product_data": json.dumps({"name": "renamed"})}}),
+    ("POST", "/products/{project}/filtered", {"json": {}}),
+    ("GET", "/products/export?project_id={project}", {}),
+    ("GET", "/categories/{category}", {}),
+    ("PUT", "/categories/{category}", {"json": {"name": "renamed"}}),
+    ("POST", "/categories/", {"json": {"name": "child", "id": "{category}"}}),
+    ("GET", "/chains/{chain}", {}),
+    ("GET", "/chains/by-product/{product}", {}),
+    ("GET", "/chains/objects/by_product/{product}", {}),
+    ("GET", "/tree/project/{project}", {}),
+    ("GET", "/search?q=product&project_id={project}", {}),
+    ("DELETE", "/objects/{object}", {}),
+]
+
+# Сущность, из которой собирается ответ маршрута
+RESPONSE_ENTITIES = {
+    "projects": Project, "objects": Object, "products": Product, "categories": Category,
+    "chains": Chain, "tree": Category, "search": Object,
+}
+
+
+@pytest.mark.parametrize("method, path, kwargs", ENDPOINTS, ids=[f"{m} {p}" for m, p, _ in ENDPOINTS])
+async def test_endpoint_loads_only_serialized_relationships(client, catalog, loaded_entities, method, path, kwargs):
+    url = path.format(**catalog)
+    kwargs = json.loads(json.dumps(kwargs).replace("{category}", catalog["category"]))
+    response_model = route_response_model(client.app, method, url.split("?")[0])
+    entity = RESPONSE_ENTITIES[url.strip("/").split("/")[0].split("?")[0]]
+    if url.startswith("/chains/objects/"):
+        entity = Object
+    serialized = serialized_relationships(response_model, entity)
+    loaded_entities.clear()
+
+    response = await client.request(method, url, **kwargs)
+
+    assert response.status_code < 400, response.text
+    # Удалённые строки не сериализуются; их связи ORM разбирает при удалении без запросов
+    unserialized = {
+        (type(instance).__name__, key)
+        for instance in loaded_entities
+        if not inspect(instance).was_deleted
+        for key in inspect(instance).mapper.relationships.keys()
+        if key not in inspect(instance).unloaded and (type(instance), key) not in serialized
+    }
+    assert not unserialized, f"{method} {path} loads relationships it does not serialize: {sorted(unserialized)}"
+    # Каждая прочитанная строка должна быть в запросе или в ответе
+    unused = {
+        (type(instance).__name__, key)
+        for instance in loaded_entities
+        for key in [str(getattr(instance, RETURNED_AS.get(type(instance), "id")))]
+        if key not in url + json.dumps(kwargs) + response.text
+    }
+    assert not unused, f"{method} {path} loads rows it does not return: {sorted(unused)}"
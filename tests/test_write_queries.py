@@ -0,0 +1,126 @@
+"""
+Запись объектов и продуктов не перечитывает строки после фиксации: значения по умолчанию
+возвращает тот же INSERT (RETURNING), ответ собирается из атрибутов в памяти.
+"""
+import uuid
+
+import pytest
+
+from sqlalchemy import select
+
+from app.db.models import Category, Object, Product, Project
+from app.repositories.category_repository import CategoryRepository
+from app.repositories.object_repository import ObjectRepository
+from app.repositories.product_repository import ProductRepository
+from app.repositories.project_repository import ProjectRepository
+from app.schemas.object import ObjectResponse
+from app.schemas.product import ProductResponse
+
+
+pytestmark = pytest.mark.anyio
+
+# Запись одной сущности: INSERT/UPDATE строки и, для продукта, INSERT привязок
+MAX_WRITE_STATEMENTS = 3
+
+
+def assert_no_reload(statements):
+    assert len(statements) < MAX_WRITE_STATEMENTS, statements
+    assert not any(statement.lstrip().upper().startswith("SELECT") for statement in statements), statements
+
+
+async def create_project(db) -> Project:
+    return await ProjectRepository(db).create_project(Project(name=f"project {uuid.uuid4()}"))
+
+
+async def create_object(db) -> Object:
+    project = await create_project(db)
+    obj = Object(x=1.0, y=2.0, name="object", area=10.0, object_status=1, project_id=project.id)
+    return await ObjectRepository(db).create_object(obj)
+
+
+async def create_category(db) -> Category:
+    return await CategoryRepository(db).create_category(Category(name=f"category {uuid.uuid4()}"))
+
+
+async def test_create_object(db, statements):
+    project = await create_project(db)
+    statements.clear()
+
+    obj = Object(x=1.0, y=2.0, name="object", area=10.0, object_status=1, project_id=project.id)
+    obj = await ObjectRepository(db).create_object(obj)
+    response = ObjectResponse.model_validate(obj)
+
+    assert response.branches == [] and response.file_storage == []
+    assert_no_reload(statements)
+
+
+async def test_update_object(db, statements):
+    created = await create_object(db)
+    repository = ObjectRepository(db)
+    obj = await repository.get_object_by_id(created.id)
+    statements.clear()
+
+    repository.set_fields(obj, {"name": "renamed"})
+    obj = await repository.save_object(obj)
+    response = ObjectResponse.model_validate(obj)
+
+    assert response.name == "renamed"
+    assert_no_reload(statements)
+    assert await db.scalar(select(Object.version).where(Object.id == obj.id)) == 2
+
+
+async def test_create_product(db, statements):
+    category = await create_category(db)
+    statements.clear()
+
+    product = await ProductRepository(db).create_product(Product(name="product"), [category.id])
+    response = ProductResponse.model_validate(product)
+
+    assert response.id == product.id
+    assert_no_reload(statements)
+
+
+async def test_update_product(db, statements):
+    category = await create_category(db)
+    repository = ProductRepository(db)
+    created = await repository.create_product(Product(name="product"), [category.id])
+    product = await repository.get_product_by_id(created.id)
+    statements.clear()
+
+    product = await repository.update_product(product, {"name": "renamed"})
+    product = await repository.update_image(product, True, "0" * 64)
+    response = ProductResponse.model_validate(product)
+
+    assert response.name == "renamed" and response.image.endswith("/image/" + "0" * 16)
+    assert_no_reload(statements)
+    assert await repository.get_product_version(product.id) == 3
+
+
+async def test_update_project_returns_version(db, statements):
+    project = await create_project(db)
+    statements.clear()
+
+    project = await ProjectRepository(db).update_project(project, {"name": "renamed"})
+
+    assert project.version == 2
+    assert len(statements) == 1 and "RETURNING" in statements[0], statements
+
+
+async def test_delete_object_removes_subtree(db, statements):
+    repository = ObjectRepository(db)
+    root = await create_object(db)
+    parent_id, subtree = root.id, [root.id]
+    for _ in range(2):
+        branch = Object(x=1.0, y=2.0, name="branch", area=1.0, object_status=1,
+                        project_id=root.project_id, parent_id=parent_id)
+        parent_id = (await repository.create_object(branch)).id
+        subtree.append(parent_id)
+    statements.clear()
+
+    object_ids = await repository.get_subtree_ids(root.id)
+    await repository.delete_object(await repository.get_object_row(root.id), object_ids)
+    await db.commit()
+
+    assert sorted(object_ids) == sorted(subtree)
+    assert await repository.get_existing_object_ids(subtree) == set()
+    assert len([statement for statement in statements if "object_subtree" in statement]) == 1